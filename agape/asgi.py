@@ -3,6 +3,10 @@ ASGI config for agape project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server such as uvicorn or daphne, and set
+NOTIFICATION_PUSH_ENABLED, to push notifications through the async streams in
+users.push. Under WSGI the stream view answers 204 and browsers poll instead.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
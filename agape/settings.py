@@ -110,6 +110,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'users.context_processors.unread_notifications',
             ],
             'debug': DEBUG,
         },
@@ -210,6 +211,13 @@ else:
         }
     }
 
+# Row counts at or above this threshold are served from planner estimates
+# (PostgreSQL only) and displayed as approximations, e.g. "~1.2M"
+APPROXIMATE_COUNT_THRESHOLD = env.int('APPROXIMATE_COUNT_THRESHOLD', default=100000)
+
+# Seconds a claimed withdrawal stays with its operator before it returns to the queue
+WITHDRAWAL_CLAIM_TIMEOUT = env.int('WITHDRAWAL_CLAIM_TIMEOUT', default=15 * 60)
+
 # Media files
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -496,6 +504,41 @@ RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
 RATELIMIT_KEY_PREFIX = 'ratelimit'
 
+# Failed logins allowed inside the sliding window before an account is locked
+LOGIN_FAILURE_LIMIT = env.int('LOGIN_FAILURE_LIMIT', default=5)
+LOGIN_FAILURE_WINDOW = env.int('LOGIN_FAILURE_WINDOW', default=15 * 60)  # seconds
+LOGIN_LOCKOUT_DURATION = env.int('LOGIN_LOCKOUT_DURATION', default=30 * 60)  # seconds
+
+# Key for the referral code permutation. Required, and kept apart from
+# SECRET_KEY so rotating that never changes the codes: changing this after
+# codes have been issued can produce codes that collide with existing ones.
+REFERRAL_CODE_SECRET = env('REFERRAL_CODE_SECRET')
+# Referral code sequence numbers reserved per database round trip
+REFERRAL_CODE_BLOCK_SIZE = env.int('REFERRAL_CODE_BLOCK_SIZE', default=100)
+# Record referral bonuses as pending and credit them with credit_referral_bonuses
+REFERRAL_BONUS_DEFERRED = env.bool('REFERRAL_BONUS_DEFERRED', default=False)
+REFERRAL_CREDIT_BATCH_SIZE = env.int('REFERRAL_CREDIT_BATCH_SIZE', default=500)
+# Users notified per INSERT ... SELECT when broadcasting a notification
+NOTIFICATION_BROADCAST_CHUNK_SIZE = env.int('NOTIFICATION_BROADCAST_CHUNK_SIZE', default=5000)
+# Days each notification type is kept and the newest kept per user, enforced
+# by the prune_notifications command (0 means no limit)
+NOTIFICATION_RETENTION = {
+    'info': {'days': 90, 'max_per_user': 200},
+    'success': {'days': 90, 'max_per_user': 200},
+    'warning': {'days': 180, 'max_per_user': 200},
+    'error': {'days': 180, 'max_per_user': 200},
+}
+NOTIFICATION_PRUNE_CHUNK_SIZE = env.int('NOTIFICATION_PRUNE_CHUNK_SIZE', default=5000)
+# Push new notifications and the admin dashboard's live counters over
+# Server-Sent Events. Only enable it when serving agape.asgi:application;
+# otherwise the header badge polls every NOTIFICATION_POLL_INTERVAL seconds
+# and the dashboard polls its counters
+NOTIFICATION_PUSH_ENABLED = env.bool('NOTIFICATION_PUSH_ENABLED', default=False)
+NOTIFICATION_POLL_INTERVAL = env.int('NOTIFICATION_POLL_INTERVAL', default=60)
+# Relay notification push events between processes over Redis pub/sub;
+# without it each process only pushes to its own streams
+NOTIFICATION_PUSH_REDIS_URL = env('NOTIFICATION_PUSH_REDIS_URL', default=REDIS_URL)
+
 
 # SMTP Settings
 
@@ -512,6 +555,25 @@ STRIPE_PUBLIC_KEY = env('STRIPE_PUBLIC_KEY', default='')
 STRIPE_SECRET_KEY = env('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = env('STRIPE_WEBHOOK_SECRET', default='')
 
+# Crypto payment verification
+# Shown to users on the funding page and checked by the verifier; must be a
+# 0x-prefixed 40 character hex address
+PAYMENT_RECEIVING_ADDRESS = env('PAYMENT_RECEIVING_ADDRESS', default='')
+PAYMENT_EXPLORER_CLIENT = env('PAYMENT_EXPLORER_CLIENT', default='frontend.explorers.EtherscanExplorerClient')
+PAYMENT_EXPLORER_API_URL = env('PAYMENT_EXPLORER_API_URL', default='https://api.bscscan.com/api')
+PAYMENT_EXPLORER_API_KEY = env('PAYMENT_EXPLORER_API_KEY', default='')
+PAYMENT_TOKEN_CONTRACT = env('PAYMENT_TOKEN_CONTRACT', default='0x55d398326f99059fF775485246999027B3197955')  # USDT (BEP-20)
+PAYMENT_TOKEN_DECIMALS = env.int('PAYMENT_TOKEN_DECIMALS', default=18)
+PAYMENT_REQUIRED_CONFIRMATIONS = env.int('PAYMENT_REQUIRED_CONFIRMATIONS', default=15)
+# Number of payments claimed per batch and explorer lookups run at once
+PAYMENT_VERIFIER_BATCH_SIZE = env.int('PAYMENT_VERIFIER_BATCH_SIZE', default=200)
+PAYMENT_VERIFIER_CONCURRENCY = env.int('PAYMENT_VERIFIER_CONCURRENCY', default=8)
+# Payments still unconfirmed after this many checks are marked failed
+PAYMENT_VERIFIER_MAX_ATTEMPTS = env.int('PAYMENT_VERIFIER_MAX_ATTEMPTS', default=20)
+# Shared secret for signed payment provider webhooks; deliveries are refused while unset
+PAYMENT_WEBHOOK_SECRET = env('PAYMENT_WEBHOOK_SECRET', default='')
+PAYMENT_WEBHOOK_TOLERANCE = env.int('PAYMENT_WEBHOOK_TOLERANCE', default=300)  # seconds
+
 CONTENT_SECURITY_POLICY = {
     'DIRECTIVES': {
         'default-src': ["'self'"],
@@ -0,0 +1,208 @@
+"""
+Approximate row counts for large tables.
+
+``COUNT(*)`` has to visit every matching row on PostgreSQL, which makes
+paginators and dashboard totals the slowest part of a page once tables grow
+into the millions. This module asks the query planner for its row estimate
+instead and only falls back to an exact count when the estimate is below
+``APPROXIMATE_COUNT_THRESHOLD``, so small result sets stay exact.
+"""
+
+import json
+import logging
+from typing import Union
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Model, QuerySet
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+# Estimates at or above this many rows are shown as approximations
+DEFAULT_APPROXIMATE_COUNT_THRESHOLD = 100000
+
+
+class ApproximateCount(int):
+    """
+    An integer row count that remembers whether it is a planner estimate.
+
+    Behaves exactly like an ``int`` so it can be handed to ``Paginator`` and
+    templates unchanged; ``approximate`` tells the display layer to render it
+    as ``~1.2M`` rather than as an exact figure.
+    """
+
+    approximate: bool
+
+    def __new__(cls, value: int, approximate: bool = False) -> "ApproximateCount":
+        """Create a count, flagged when it is an estimate."""
+        obj = super().__new__(cls, value)
+        obj.approximate = approximate
+        return obj
+
+
+def get_threshold() -> int:
+    """
+    Return the row count above which estimates are used instead of COUNT(*).
+
+    Returns:
+        int: The configured threshold
+    """
+    return getattr(settings, "APPROXIMATE_COUNT_THRESHOLD", DEFAULT_APPROXIMATE_COUNT_THRESHOLD)
+
+
+def _table_estimate(queryset: QuerySet) -> int:
+    """Read the planner's row estimate for an unfiltered table from pg_class."""
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    # reltuples is -1 for tables that have never been vacuumed or analyzed
+    return int(row[0]) if row and row[0] is not None else -1
+
+
+def _query_estimate(queryset: QuerySet) -> int:
+    """Read the planner's row estimate for a filtered queryset via EXPLAIN."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def estimate_count(queryset: QuerySet) -> int:
+    """
+    Return the planner's row estimate for a queryset.
+
+    Args:
+        queryset (QuerySet): The queryset to estimate
+
+    Returns:
+        int: The estimated number of rows, or -1 if no estimate is available
+    """
+    if connections[queryset.db].vendor != "postgresql":
+        return -1
+
+    try:
+        if not queryset.query.where and not queryset.query.distinct:
+            return _table_estimate(queryset)
+        return _query_estimate(queryset)
+    except Exception as e:
+        logger.warning(f"Could not estimate row count for {queryset.model.__name__}: {e}")
+        return -1
+
+
+def approximate_count(source: Union[QuerySet, type]) -> ApproximateCount:
+    """
+    Count the rows of a queryset or model, estimating when the table is large.
+
+    Args:
+        source (Union[QuerySet, type]): A queryset, or a model class to count all rows of
+
+    Returns:
+        ApproximateCount: The row count, flagged as approximate when it is an estimate
+    """
+    queryset = (
+        source._default_manager.all()
+        if isinstance(source, type) and issubclass(source, Model)
+        else source
+    )
+
+    estimate = estimate_count(queryset)
+    if estimate >= get_threshold():
+        return ApproximateCount(estimate, approximate=True)
+
+    return ApproximateCount(queryset.count())
+
+
+class ApproximatePage(Page):
+    """A page whose next link comes from the rows fetched, not from the count."""
+
+    def __init__(self, object_list, number: int, paginator: Paginator, has_more: bool):
+        """Create a page that knows whether another one follows."""
+        super().__init__(object_list, number, paginator)
+        self.has_more = has_more
+
+    def has_next(self) -> bool:
+        """Return whether another page follows, without a count."""
+        return self.has_more
+
+    def end_index(self) -> int:
+        """Return the 1-based index of the last object on the page."""
+        return self.start_index() + len(self.object_list) - 1 if self.object_list else 0
+
+
+class ApproximatePaginator(Paginator):
+    """
+    Paginator that uses ``approximate_count`` instead of ``COUNT(*)``.
+
+    While the count is exact it behaves like ``Paginator``. When it is a
+    planner estimate the estimate may be short, so pages past ``num_pages``
+    are still served as long as they have rows. Each such page fetches one
+    extra row to decide whether there is a next page, and only a page with
+    no rows at all is treated as out of range.
+    """
+
+    @cached_property
+    def count(self) -> ApproximateCount:
+        """Return the exact count, or an estimate for large tables."""
+        if isinstance(self.object_list, QuerySet):
+            return approximate_count(self.object_list)
+        return ApproximateCount(len(self.object_list))
+
+    @property
+    def approximate(self) -> bool:
+        """Return whether the count is an estimate."""
+        return getattr(self.count, "approximate", False)
+
+    def validate_number(self, number) -> int:
+        """Validate a page number, allowing pages past an estimated count."""
+        if not self.approximate:
+            return super().validate_number(number)
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages["invalid_page"])
+        if number < 1:
+            raise EmptyPage(self.error_messages["min_page"])
+        return number
+
+    def page(self, number) -> Page:
+        """Return a page, fetching one extra row when the count is estimated."""
+        if not self.approximate:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom : bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage(self.error_messages["no_results"])
+        return ApproximatePage(
+            rows[: self.per_page], number, self, has_more=len(rows) > self.per_page
+        )
+
+
+def format_count(value: int) -> str:
+    """
+    Format a count for display, abbreviating approximate values as ``~1.2M``.
+
+    Args:
+        value (int): A plain int or an ``ApproximateCount``
+
+    Returns:
+        str: The formatted count
+    """
+    if not getattr(value, "approximate", False):
+        return str(value)
+
+    for divisor, suffix in ((10**9, "B"), (10**6, "M"), (10**3, "K")):
+        if value >= divisor:
+            short = f"{value / divisor:.1f}".rstrip("0").rstrip(".")
+            return f"~{short}{suffix}"
+    return f"~{int(value)}"
@@ -0,0 +1,106 @@
+"""
+Request-scoped batch loading.
+
+Views that render many rows often look up the same kind of data once per
+row, such as a balance per user or a subscription list per user. A
+``BatchLoader`` collects those lookups and resolves every outstanding key
+with a single call to its batch function, in the style of DataLoader.
+
+Rows declare what they will need with ``defer``. The first ``load`` then
+fetches everything deferred so far in one batch. Results are kept for the
+rest of the request, so repeated lookups cost nothing.
+
+Loaders live on the request (see ``request_loader``). They never outlive it,
+so there is nothing to invalidate.
+"""
+
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Set
+
+
+class BatchLoader:
+    """Coalesces lookups by key into calls to a batch function."""
+
+    def __init__(
+        self, batch_fn: Callable[[List[Hashable]], Dict[Hashable, Any]], default: Any = None
+    ):
+        """
+        Create a loader around a batch function.
+
+        Args:
+            batch_fn (Callable[[List[Hashable]], Dict[Hashable, Any]]): Resolves a
+                list of keys to a dictionary of values
+            default (Any): Value for keys the batch function leaves out
+        """
+        self.batch_fn = batch_fn
+        self.default = default
+        self.batches = 0
+        self._values: Dict[Hashable, Any] = {}
+        self._pending: Set[Hashable] = set()
+
+    def defer(self, *keys: Hashable) -> None:
+        """Queue keys to be fetched by the next dispatch."""
+        self._pending.update(key for key in keys if key not in self._values)
+
+    def dispatch(self) -> None:
+        """Fetch every queued key with one call to the batch function."""
+        if not self._pending:
+            return
+        keys, self._pending = list(self._pending), set()
+        self.batches += 1
+        values = self.batch_fn(keys)
+        for key in keys:
+            self._values[key] = values.get(key, self.default)
+
+    def load(self, key: Hashable) -> Any:
+        """
+        Get the value for a key, fetching it with everything queued so far.
+
+        Args:
+            key (Hashable): The key to look up
+
+        Returns:
+            Any: The value, or the loader's default
+        """
+        if key not in self._values:
+            self.defer(key)
+            self.dispatch()
+        return self._values[key]
+
+    def load_many(self, keys: Iterable[Hashable]) -> List[Any]:
+        """
+        Get the values for several keys with at most one batch.
+
+        Args:
+            keys (Iterable[Hashable]): The keys to look up
+
+        Returns:
+            List[Any]: The values, in the order of the keys
+        """
+        keys = list(keys)
+        self.defer(*keys)
+        self.dispatch()
+        return [self._values[key] for key in keys]
+
+
+def request_loader(
+    request,
+    name: str,
+    batch_fn: Callable[[List[Hashable]], Dict[Hashable, Any]],
+    default: Any = None,
+) -> BatchLoader:
+    """
+    Get the named loader for a request, creating it on first use.
+
+    Args:
+        request (HttpRequest): The current request
+        name (str): The loader's name, unique per batch function
+        batch_fn (Callable[[List[Hashable]], Dict[Hashable, Any]]): Resolves a list of keys
+        default (Any): Value for keys the batch function leaves out
+
+    Returns:
+        BatchLoader: The request's loader
+    """
+    loaders = request.__dict__.setdefault("_batch_loaders", {})
+    if name not in loaders:
+        loaders[name] = BatchLoader(batch_fn, default)
+    return loaders[name]
@@ -46,3 +46,262 @@ class HealthCheckTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['status'], 'unhealthy')
         self.assertEqual(response.data['database'], 'unhealthy')
+
+
+class ApproximateCountTests(TestCase):
+    """
+    Test suite for the approximate count helpers
+    """
+
+    def setUp(self):
+        """
+        Create a few users to count
+        """
+        from users.models import User
+
+        self.User = User
+        for i in range(3):
+            User.objects.create_user(
+                username=f"countuser{i}",
+                email=f"count{i}@example.com",
+                password="testpassword123"
+            )
+
+    def test_small_tables_are_counted_exactly(self):
+        """
+        Test that counts below the threshold run an exact COUNT(*)
+        """
+        from core.counts import approximate_count
+
+        count = approximate_count(self.User)
+
+        self.assertEqual(count, 3)
+        self.assertFalse(count.approximate)
+
+    @patch('core.counts.estimate_count', return_value=1234567)
+    def test_large_tables_use_estimate(self, mock_estimate):
+        """
+        Test that estimates above the threshold skip the exact count
+        """
+        from core.counts import ApproximatePaginator, approximate_count
+
+        with self.assertNumQueries(0):
+            count = approximate_count(self.User.objects.all())
+            paginator = ApproximatePaginator(self.User.objects.order_by('id'), 10)
+            num_pages = paginator.num_pages
+
+        self.assertEqual(count, 1234567)
+        self.assertTrue(count.approximate)
+        self.assertEqual(num_pages, 123457)
+
+    @patch('core.counts.estimate_count', return_value=1)
+    def test_pages_past_a_short_estimate_are_served(self, mock_estimate):
+        """
+        Test that an estimate below the real count doesn't hide the later pages
+        """
+        from django.core.paginator import EmptyPage
+        from django.test import override_settings
+        from core.counts import ApproximatePaginator
+
+        with override_settings(APPROXIMATE_COUNT_THRESHOLD=1):
+            paginator = ApproximatePaginator(self.User.objects.order_by('id'), 1)
+            self.assertEqual(paginator.num_pages, 1)
+
+            page = paginator.get_page(2)
+            self.assertEqual(page.number, 2)
+            self.assertEqual(page.object_list[0].username, 'countuser1')
+            self.assertTrue(page.has_next())
+            self.assertEqual(page.end_index(), 2)
+
+            last = paginator.page(3)
+            self.assertEqual(last.object_list[0].username, 'countuser2')
+            self.assertFalse(last.has_next())
+            with self.assertRaises(EmptyPage):
+                paginator.page(4)
+
+    def test_format_count(self):
+        """
+        Test that only approximate counts are abbreviated
+        """
+        from core.counts import ApproximateCount, format_count
+
+        self.assertEqual(format_count(1234567), '1234567')
+        self.assertEqual(format_count(ApproximateCount(1234567, approximate=True)), '~1.2M')
+        self.assertEqual(format_count(ApproximateCount(2000000, approximate=True)), '~2M')
+        self.assertEqual(format_count(ApproximateCount(150300, approximate=True)), '~150.3K')
+
+
+class TieredCacheTests(TestCase):
+    """
+    Test suite for the in-process cache tier and its cross-process invalidation
+    """
+
+    def setUp(self):
+        """
+        Create two tiers sharing the Django cache, standing in for two workers
+        """
+        from django.core.cache import cache
+        from core.tiered_cache import TieredCache
+
+        cache.clear()
+        self.cache = cache
+        self.worker = TieredCache('test_tiered', sync_interval=0)
+        self.other_worker = TieredCache('test_tiered', sync_interval=0)
+
+    def test_hits_are_served_in_process(self):
+        """
+        Test that a value read once is served without going to the shared cache
+        """
+        self.worker.set('plans', ['gold'], 60)
+        self.other_worker.set('plans', ['changed behind its back'], 60)
+
+        self.assertEqual(self.worker.get('plans'), ['gold'])
+
+    def test_delete_reaches_other_processes(self):
+        """
+        Test that a delete in one process evicts the key from another's local tier
+        """
+        self.other_worker.get_or_set('plans', lambda: ['gold'], 60)
+        self.other_worker.get_or_set('queue', lambda: [1, 2], 60)
+
+        self.worker.delete('plans')
+        self.worker.set('queue', [3], 60)
+
+        self.assertIsNone(self.other_worker.get('plans'))
+        # Keys that weren't deleted stay in process
+        self.assertEqual(self.other_worker.get('queue'), [1, 2])
+
+    def test_missing_invalidation_log_drops_the_local_tier(self):
+        """
+        Test that a process that can't replay the invalidation log drops everything it holds
+        """
+        self.other_worker.get_or_set('plans', lambda: ['gold'], 60)
+        self.other_worker.get_or_set('queue', lambda: [1, 2], 60)
+
+        self.worker.delete('plans')
+        self.cache.delete('test_tiered_invalidated_1')
+        self.worker.set('queue', [3], 60)
+
+        self.assertEqual(self.other_worker.get('queue'), [3])
+
+    def test_namespace_invalidation_reaches_other_processes(self):
+        """
+        Test that bumping a namespace retires its keys in every process
+        """
+        key = self.other_worker.versioned_key('plans', 'plan_1')
+        self.other_worker.get_or_set(key, lambda: {'name': 'Gold'}, 60)
+        self.assertEqual(self.worker.versioned_key('plans', 'plan_1'), key)
+
+        self.worker.invalidate_namespace('plans')
+
+        new_key = self.other_worker.versioned_key('plans', 'plan_1')
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(self.other_worker.get_or_set(new_key, lambda: {'name': 'Platinum'}, 60), {'name': 'Platinum'})
+
+    def test_sync_is_rate_limited(self):
+        """
+        Test that the generation counter is only checked once per sync interval
+        """
+        from unittest.mock import patch
+
+        worker = type(self.worker)('test_tiered', sync_interval=60)
+        worker.set('plans', ['gold'], 60)
+        worker.get('plans')
+
+        with patch.object(worker.backend, 'get', wraps=worker.backend.get) as backend_get:
+            for _ in range(10):
+                self.assertEqual(worker.get('plans'), ['gold'])
+        backend_get.assert_not_called()
+
+
+class StampedeProtectionTests(TestCase):
+    """
+    Test suite for single-flight recomputation and early expiration
+    """
+
+    def setUp(self):
+        """
+        Start from an empty cache
+        """
+        from django.core.cache import cache
+
+        cache.clear()
+        self.cache = cache
+
+    def test_concurrent_misses_compute_once(self):
+        """
+        Test that workers missing the same key at once run the loader only once
+        """
+        import threading
+        import time
+        from core.tiered_cache import get_or_compute
+
+        calls = []
+
+        def load():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['position 1']
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(get_or_compute(self.cache, 'queue', load, 60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['position 1']] * 5)
+
+    def test_expiring_value_is_refreshed_by_one_worker(self):
+        """
+        Test that a value about to expire is refreshed early, while others keep serving it
+        """
+        import time
+        from core.tiered_cache import get_or_compute
+
+        # Took a long time to compute and expires in a second: always due for a refresh
+        self.cache.set('plans', (['old'], 1000, time.time() + 1), 60)
+
+        self.cache.set('plans_lock', 'another worker', 10)
+        self.assertEqual(get_or_compute(self.cache, 'plans', lambda: ['new'], 60), ['old'])
+
+        self.cache.delete('plans_lock')
+        self.assertEqual(get_or_compute(self.cache, 'plans', lambda: ['new'], 60), ['new'])
+        self.assertIsNone(self.cache.get('plans_lock'))
+
+    def test_fresh_value_is_not_recomputed(self):
+        """
+        Test that a value far from expiry is served without calling the loader
+        """
+        from core.tiered_cache import get_or_compute
+
+        get_or_compute(self.cache, 'plans', lambda: ['cached'], 60)
+
+        self.assertEqual(get_or_compute(self.cache, 'plans', self.fail, 60), ['cached'])
+
+    def test_invalidation_while_computing_is_not_overwritten(self):
+        """
+        Test that a value loaded before an invalidation is not left in the cache after it
+        """
+        from core.tiered_cache import get_many_or_compute, get_or_compute, invalidate
+
+        def load():
+            invalidate(self.cache, ['plans'])
+            return ['stale']
+
+        self.assertEqual(get_or_compute(self.cache, 'plans', load, 60), ['stale'])
+        self.assertIsNone(self.cache.get('plans'))
+        self.assertEqual(get_or_compute(self.cache, 'plans', lambda: ['fresh'], 60), ['fresh'])
+
+        def load_many(lookups):
+            invalidate(self.cache, ['wallet_1'])
+            return {lookup: f'balance {lookup}' for lookup in lookups}
+
+        keys = {1: 'wallet_1', 2: 'wallet_2'}
+        self.assertEqual(get_many_or_compute(self.cache, keys, load_many, 60), {1: 'balance 1', 2: 'balance 2'})
+        self.assertIsNone(self.cache.get('wallet_1'))
+        self.assertIsNotNone(self.cache.get('wallet_2'))
@@ -0,0 +1,500 @@
+"""
+Two-tier caching: a per-process LRU in front of the shared Django cache.
+
+Reading from Redis costs a round trip plus decompressing and unpickling the
+value, even for data that hardly ever changes. ``TieredCache`` keeps recently
+read values in process memory (L1) and only goes to the Django cache (L2) on
+an L1 miss.
+
+Invalidations have to reach the L1 of every worker. Each ``TieredCache``
+namespace keeps a generation counter in the shared cache. Deleting keys bumps
+the counter and records the keys under the new generation. Every process
+compares the counter with the last one it saw, at most once per
+``sync_interval`` seconds, and evicts the keys recorded since. If any part
+of that log has expired, it drops its whole L1 instead. Another worker
+therefore serves a deleted value for at most ``sync_interval`` seconds.
+
+Groups of keys that are always invalidated together can share a versioned
+namespace instead. ``versioned_key`` embeds the namespace's generation in the
+key, and ``invalidate_namespace`` retires every key in it with one INCR,
+however many there are. The old entries are never read again and age out of
+both tiers. Processes pick up new generations with the same periodic check.
+
+``get_or_compute`` keeps a miss or an expiry from turning into a thundering
+herd on the database:
+
+* Single flight: on a miss, only the worker that takes a short lock key runs
+  the loader. The others poll briefly for its result.
+* Probabilistic early expiration (XFetch): shared values are stored with the
+  time it took to compute them. A reader may refresh a value shortly before
+  it expires, and slow computations start earlier. Only the lock holder
+  refreshes, while everyone else keeps serving the current value. A hot key
+  is therefore rebuilt by one request before it expires, rather than by every
+  request after.
+
+Shared entries read through these functions must be deleted with
+``invalidate``. It gives each key a new invalidation marker, and a
+computation that sees the marker change while its loader ran removes what it
+stored. A value built from rows read before a write therefore never outlives
+the write's invalidation.
+"""
+
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from django.core.cache import cache as default_cache
+
+logger = logging.getLogger(__name__)
+
+# How long invalidation log entries are kept (in seconds)
+INVALIDATION_LOG_TIMEOUT = 60 * 10  # 10 minutes
+
+# Beyond this many missed generations the L1 is dropped rather than replayed
+MAX_REPLAYED_GENERATIONS = 100
+
+# Single-flight lock: how long it's held at most, and how long others wait for it
+RECOMPUTE_LOCK_TIMEOUT = 10  # seconds
+RECOMPUTE_WAIT = 2.0  # seconds
+RECOMPUTE_POLL_INTERVAL = 0.05  # seconds
+
+# XFetch beta; above 1 favours earlier refreshes
+EARLY_EXPIRATION_BETA = 1.0
+
+# A shared value is stored as (value, seconds it took to compute, expiry timestamp)
+Entry = Tuple[Any, float, float]
+
+
+def _entry(value: Any, delta: float, timeout: Optional[float]) -> Entry:
+    expires = math.inf if timeout is None else time.time() + timeout
+    return (value, delta, expires)
+
+
+def _is_fresh(entry: Entry, beta: float) -> bool:
+    """Decide whether to keep serving an entry or refresh it early (XFetch)."""
+    _, delta, expires = entry
+    # 1 - random() is in (0, 1], so the log is finite and <= 0
+    return time.time() - delta * beta * math.log(1 - random.random()) < expires
+
+
+def _marker_key(key: str) -> str:
+    return f"{key}_invalidated"
+
+
+def invalidate(backend, keys: Iterable[str]) -> None:
+    """
+    Delete shared entries, including any being computed right now.
+
+    Args:
+        backend: The Django cache
+        keys (Iterable[str]): The cache keys
+    """
+    keys = list(keys)
+    if not keys:
+        return
+    # Markers first: a computation that stores its value after this point
+    # sees the new marker and removes the value again
+    backend.set_many({_marker_key(key): uuid.uuid4().hex for key in keys}, INVALIDATION_LOG_TIMEOUT)
+    backend.delete_many(keys)
+
+
+def _compute(
+    backend,
+    key: str,
+    loader: Callable[[], Any],
+    timeout: Optional[float],
+    lock_key: str,
+    token: str,
+) -> Any:
+    """Run the loader while holding the lock and store what it returns."""
+    try:
+        marker = backend.get(_marker_key(key))
+        started = time.monotonic()
+        value = loader()
+        if value is not None:
+            backend.set(key, _entry(value, time.monotonic() - started, timeout), timeout)
+            if backend.get(_marker_key(key)) != marker:
+                # Invalidated while the loader ran; the value may predate the write
+                backend.delete(key)
+        return value
+    finally:
+        if backend.get(lock_key) == token:
+            backend.delete(lock_key)
+
+
+def get_or_compute(
+    backend,
+    key: str,
+    loader: Callable[[], Any],
+    timeout: Optional[float] = None,
+    beta: float = EARLY_EXPIRATION_BETA,
+) -> Any:
+    """
+    Get a value from a Django cache, computing it at most once across workers.
+
+    Keys read with this function must only be written by it or by
+    ``TieredCache``, which store the entries it expects, and deleted with
+    ``invalidate``.
+
+    Args:
+        backend: The Django cache
+        key (str): The cache key
+        loader (Callable[[], Any]): Builds the value; None is returned but not cached
+        timeout (Optional[float]): Cache timeout in seconds
+        beta (float): XFetch beta; 0 disables early refreshes
+
+    Returns:
+        Any: The cached or computed value
+    """
+    lock_key = f"{key}_lock"
+    token = uuid.uuid4().hex
+
+    entry = backend.get(key)
+    if entry is not None:
+        if _is_fresh(entry, beta) or not backend.add(lock_key, token, RECOMPUTE_LOCK_TIMEOUT):
+            # Fresh, or another worker is already refreshing it
+            return entry[0]
+        logger.debug(f"Refreshing {key} before it expires")
+        return _compute(backend, key, loader, timeout, lock_key, token)
+
+    if backend.add(lock_key, token, RECOMPUTE_LOCK_TIMEOUT):
+        return _compute(backend, key, loader, timeout, lock_key, token)
+
+    # Another worker is computing it; wait for its result
+    deadline = time.monotonic() + RECOMPUTE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(RECOMPUTE_POLL_INTERVAL)
+        entry = backend.get(key)
+        if entry is not None:
+            return entry[0]
+        if backend.get(lock_key) is None:
+            # It finished without caching anything
+            break
+
+    logger.debug(f"Gave up waiting for {key} to be computed")
+    return loader()
+
+
+def get_many_or_compute(
+    backend,
+    keys: Dict[Hashable, str],
+    loader: Callable[[List[Hashable]], Dict[Hashable, Any]],
+    timeout: Optional[float] = None,
+) -> Dict[Hashable, Any]:
+    """
+    Get many values with one cache round trip, loading all the misses in one call.
+
+    Reads and writes the same entries as ``get_or_compute``. Batches skip
+    the single-flight lock and early expiration, since concurrent batches
+    rarely ask for the same keys.
+
+    Args:
+        backend: The Django cache
+        keys (Dict[Hashable, str]): Cache key for each lookup key
+        loader (Callable[[List[Hashable]], Dict[Hashable, Any]]): Builds the values
+            for the missing lookup keys; keys it leaves out are not cached
+        timeout (Optional[float]): Cache timeout in seconds
+
+    Returns:
+        Dict[Hashable, Any]: The value for each lookup key that was cached or loaded
+    """
+    entries = backend.get_many(list(keys.values())) if keys else {}
+    values = {
+        lookup: entries[cache_key][0] for lookup, cache_key in keys.items() if cache_key in entries
+    }
+
+    missing = [lookup for lookup in keys if lookup not in values]
+    if missing:
+        marker_keys = [_marker_key(keys[lookup]) for lookup in missing]
+        markers = backend.get_many(marker_keys)
+        started = time.monotonic()
+        loaded = loader(missing)
+        delta = time.monotonic() - started
+        stored = {
+            keys[lookup]: _entry(value, delta, timeout)
+            for lookup, value in loaded.items()
+            if value is not None
+        }
+        if stored:
+            backend.set_many(stored, timeout)
+            changed = backend.get_many(marker_keys)
+            stale = [
+                cache_key
+                for cache_key in stored
+                if changed.get(_marker_key(cache_key)) != markers.get(_marker_key(cache_key))
+            ]
+            if stale:
+                backend.delete_many(stale)
+        values.update(loaded)
+    return values
+
+
+class LocalCache:
+    """A small thread-safe LRU with expiry, private to the process."""
+
+    def __init__(self, size: int, timeout: float):
+        """Create an empty cache holding at most size values."""
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = size
+        self.timeout = timeout
+
+    def get(self, key: str):
+        """Return a cached value, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, timeout: Optional[float] = None) -> None:
+        """Cache a value, evicting the least recently used one if full."""
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Drop a cached value."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every cached value."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        """Return the number of cached values."""
+        return len(self._entries)
+
+
+class TieredCache:
+    """
+    A process-local LRU (L1) in front of the Django cache (L2).
+
+    Values returned from L1 are shared by every caller in the process and
+    must be treated as read-only.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        size: int = 1024,
+        timeout: float = 60,
+        sync_interval: float = 1.0,
+        backend=None,
+    ):
+        """
+        Create a tiered cache over a shared backend.
+
+        Args:
+            namespace (str): Prefix of the generation counter and invalidation log keys
+            size (int): Maximum number of values kept in process
+            timeout (float): Longest a value is kept in process, in seconds
+            sync_interval (float): Seconds between checks for other processes' invalidations
+            backend: The L2 cache; defaults to the default Django cache
+        """
+        self.local = LocalCache(size, timeout)
+        self.backend = backend or default_cache
+        self.sync_interval = sync_interval
+        self.namespace = namespace
+        self.generation_key = f"{namespace}_generation"
+        self.log_key_template = f"{namespace}_invalidated_{{}}"
+        self._generation: Optional[int] = None
+        self._versions: Dict[str, int] = {}
+        self._next_sync = 0.0
+        self._sync_lock = threading.Lock()
+
+    def _version_key(self, name: str) -> str:
+        return f"{self.namespace}_{name}_version"
+
+    def _sync(self) -> None:
+        """Evict the keys other processes have invalidated since the last check."""
+        now = time.monotonic()
+        if now < self._next_sync or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = now + self.sync_interval
+            version_keys = {self._version_key(name): name for name in self._versions}
+            counters = self.backend.get_many([self.generation_key, *version_keys])
+            self._versions = {
+                name: counters[key] for key, name in version_keys.items() if key in counters
+            }
+
+            generation = counters.get(self.generation_key)
+            if generation is None:
+                self.backend.add(self.generation_key, 0, None)
+                generation = 0
+            seen, self._generation = self._generation, generation
+            if seen is None or generation == seen:
+                return
+            if generation < seen:
+                # The counter was evicted and started over
+                self.local.clear()
+                return
+            if generation - seen > MAX_REPLAYED_GENERATIONS:
+                self.local.clear()
+                return
+
+            log_keys = [self.log_key_template.format(n) for n in range(seen + 1, generation + 1)]
+            logged = self.backend.get_many(log_keys)
+            if len(logged) < len(log_keys):
+                self.local.clear()
+                return
+            for keys in logged.values():
+                for key in keys:
+                    self.local.delete(key)
+        finally:
+            self._sync_lock.release()
+
+    def version(self, name: str) -> int:
+        """
+        Get the current generation of a versioned namespace.
+
+        Args:
+            name (str): The namespace, within this cache's namespace
+
+        Returns:
+            int: The generation, as of the last check
+        """
+        self._sync()
+        version = self._versions.get(name)
+        if version is None:
+            key = self._version_key(name)
+            # Start from the clock so a counter that was evicted never
+            # returns to a generation whose keys may still be cached
+            self.backend.add(key, time.time_ns() // 1000, None)
+            version = self.backend.get(key) or 0
+            self._versions[name] = version
+        return version
+
+    def versioned_key(self, name: str, key: str) -> str:
+        """
+        Embed a namespace's current generation in a key.
+
+        Args:
+            name (str): The namespace
+            key (str): The unversioned cache key
+
+        Returns:
+            str: The key for the current generation
+        """
+        return f"{key}_v{self.version(name)}"
+
+    def invalidate_namespace(self, name: str) -> None:
+        """
+        Retire every key of a versioned namespace with a single INCR.
+
+        Args:
+            name (str): The namespace
+        """
+        key = self._version_key(name)
+        self.backend.add(key, time.time_ns() // 1000, None)
+        try:
+            self._versions[name] = self.backend.incr(key)
+        except ValueError:
+            # Evicted between add and incr; the next read starts a new counter
+            self._versions.pop(name, None)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Get a value from L1, falling back to L2.
+
+        Args:
+            key (str): The cache key
+            default (Any): Returned when neither tier has the key
+
+        Returns:
+            Any: The cached value, or default
+        """
+        self._sync()
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        entry = self.backend.get(key)
+        if entry is None:
+            return default
+        self.local.set(key, entry[0])
+        return entry[0]
+
+    def set(self, key: str, value: Any, timeout: Optional[float] = None) -> None:
+        """
+        Store a value in both tiers.
+
+        Args:
+            key (str): The cache key
+            value (Any): The value; None is not cached
+            timeout (Optional[float]): L2 timeout in seconds; L1 keeps it no longer
+        """
+        self.backend.set(key, _entry(value, 0, timeout), timeout)
+        self.local.set(key, value, timeout)
+
+    def get_or_set(
+        self, key: str, loader: Callable[[], Any], timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Get a value, loading it on a miss with ``get_or_compute``.
+
+        Args:
+            key (str): The cache key
+            loader (Callable[[], Any]): Builds the value on a miss
+            timeout (Optional[float]): L2 timeout in seconds
+
+        Returns:
+            Any: The cached or loaded value
+        """
+        self._sync()
+        value = self.local.get(key)
+        if value is None:
+            value = get_or_compute(self.backend, key, loader, timeout)
+            if value is not None:
+                self.local.set(key, value, timeout)
+        return value
+
+    def delete_many(self, keys: Iterable[str]) -> None:
+        """
+        Delete keys from both tiers and have every other process evict them.
+
+        Args:
+            keys (Iterable[str]): The cache keys
+        """
+        keys = list(keys)
+        if not keys:
+            return
+        invalidate(self.backend, keys)
+        for key in keys:
+            self.local.delete(key)
+
+        self.backend.add(self.generation_key, 0, None)
+        try:
+            generation = self.backend.incr(self.generation_key)
+        except ValueError:
+            # The counter was evicted between add and incr; other processes
+            # see it start over and drop their L1
+            return
+        self.backend.set(self.log_key_template.format(generation), keys, INVALIDATION_LOG_TIMEOUT)
+
+    def delete(self, key: str) -> None:
+        """Delete a key from both tiers in every process."""
+        self.delete_many([key])
+
+    def clear_local(self) -> None:
+        """Drop this process's L1."""
+        self.local.clear()
+        self._generation = None
+        self._versions = {}
+        self._next_sync = 0.0
@@ -9,8 +9,15 @@ urlpatterns = [
     path('users/', admin_views.manage_users, name='manage_users'),
     path('users/create-staff/', admin_views.create_staff_user, name='create_staff_user'),
     path('users/search-suggestions/', admin_views.search_suggestions, name='search_suggestions'),
+    path('users/notify/', admin_views.broadcast_notification, name='broadcast_notification'),
+    path('users/adjust-balances/', admin_views.bulk_adjust_balances, name='bulk_adjust_balances'),
+    path('users/export/', admin_views.export_users, name='export_users'),
     path('withdrawals/', admin_views.manage_withdrawals, name='manage_withdrawals'),
+    path('withdrawals/export/', admin_views.export_withdrawals, name='export_withdrawals'),
+    path('withdrawals/queue/', admin_views.withdrawal_queue, name='withdrawal_queue'),
     path('deposits/', admin_views.manage_deposits, name='manage_deposits'),
+    path('deposits/export/', admin_views.export_deposits, name='export_deposits'),
+    path('transactions/export/', admin_views.export_transactions, name='export_transactions'),
     path('user/<int:user_id>/balance/', admin_views.user_balance, name='user_balance'),
     path('withdrawal/<int:withdrawal_id>/process/', admin_views.process_withdrawal, name='process_withdrawal'),
 ]
\ No newline at end of file
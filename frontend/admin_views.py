@@ -1,19 +1,34 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.core.paginator import Paginator
 from users.models import User
 from transactions.models import Transaction, Withdrawal
-from decimal import Decimal
 from .decorators import admin_required
 from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.forms import AuthenticationForm
 from django.urls import reverse
-from django.db.models import Sum
 from django.utils import timezone
 from datetime import timedelta
-from django.http import JsonResponse
-from django.db.models import Q
+import io
+import itertools
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from core.counts import ApproximatePaginator, approximate_count
+from .balance_adjustments import (
+    ADJUSTABLE_WALLETS, INPUT_COLUMNS, REPORT_COLUMNS, USER_ID_PREFIX, apply_adjustment_chunk,
+    apply_adjustments, read_adjustments, report_rows,
+)
+from .exports import export_response, stream_csv
+from transactions.live import get_live_stats
+from transactions.workqueue import (
+    DEFAULT_CLAIM_BATCH_SIZE, WITHDRAWAL_ACTIONS, available_withdrawals,
+    claim_withdrawals, process_withdrawals, release_withdrawals,
+)
+from transactions.rollups import lifetime_totals, period_totals
+from users.models import Notification
+from plans.models import Subscription as PlanSubscription
+from users.notifications import broadcast_notification as send_broadcast
+from users.search import filter_users as search_users, get_suggestions
 
 def admin_login(request):
     """Admin login view."""
@@ -46,19 +61,17 @@ def admin_login(request):
 @admin_required
 def admin_dashboard(request):
     """Admin dashboard view showing overview of system."""
-    # Get total users count directly from database
-    total_users = User.objects.count()
+    # Get total users count (estimated on large tables)
+    total_users = approximate_count(User)
     
-    # Get deposits and withdrawals statistics
-    total_deposits = Transaction.objects.filter(transaction_type='deposit').count()
-    total_deposits_amount = Transaction.objects.filter(
-        transaction_type='deposit'
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    # Get deposits and withdrawals statistics from the daily rollups
+    deposit_totals = lifetime_totals('DEPOSIT')
+    total_deposits = deposit_totals['count']
+    total_deposits_amount = deposit_totals['amount']
     
-    total_withdrawals = Withdrawal.objects.count()
-    total_withdrawals_amount = Withdrawal.objects.aggregate(
-        total=Sum('amount')
-    )['total'] or Decimal('0.00')
+    withdrawal_totals = lifetime_totals('WITHDRAWAL')
+    total_withdrawals = withdrawal_totals['count']
+    total_withdrawals_amount = withdrawal_totals['amount']
     
     # Calculate net revenue (deposits - withdrawals)
     net_revenue = total_deposits_amount - total_withdrawals_amount
@@ -68,47 +81,43 @@ def admin_dashboard(request):
     
     # Add recent deposits
     recent_deposits = Transaction.objects.filter(
-        transaction_type='deposit'
-    ).order_by('-created_at')[:5]
+        transaction_type='DEPOSIT'
+    ).order_by('-created_at').values('amount', 'created_at', username=F('user__username'))[:5]
     for deposit in recent_deposits:
         recent_activities.append({
             'type': 'deposit',
-            'user': deposit.user.username,
+            'user': deposit['username'],
             'action': 'made a deposit',
-            'amount': deposit.amount,
-            'timestamp': deposit.created_at
+            'amount': deposit['amount'],
+            'timestamp': deposit['created_at']
         })
     
     # Add recent withdrawals
-    recent_withdrawals = Withdrawal.objects.order_by('-created_at')[:5]
+    recent_withdrawals = Withdrawal.objects.order_by('-created_at').values(
+        'amount', 'created_at', username=F('user__username')
+    )[:5]
     for withdrawal in recent_withdrawals:
         recent_activities.append({
             'type': 'withdrawal',
-            'user': withdrawal.user.username,
+            'user': withdrawal['username'],
             'action': 'requested withdrawal',
-            'amount': withdrawal.amount,
-            'timestamp': withdrawal.created_at
+            'amount': withdrawal['amount'],
+            'timestamp': withdrawal['created_at']
         })
     
     # Sort combined activities by timestamp
     recent_activities.sort(key=lambda x: x['timestamp'], reverse=True)
     recent_activities = recent_activities[:5]
     
-    # Get quick stats
-    today = timezone.now()
-    start_of_day = today.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Get quick stats for today from the daily rollups
+    today = timezone.localdate()
+    today_totals = period_totals(today, today + timedelta(days=1))
+    new_users_count = today_totals['new_users']
+    active_users_count = today_totals['active_users']
     
-    new_users_count = User.objects.filter(
-        date_joined__gte=start_of_day
-    ).count()
-    
-    active_users_count = User.objects.filter(
-        last_login__gte=start_of_day
-    ).count()
-    
-    pending_withdrawals = Withdrawal.objects.filter(
-        status='pending'
-    ).count()
+    # Live counters replace the pending withdrawals query
+    live_stats = get_live_stats()
+    pending_withdrawals = live_stats['pending_withdrawals']
     
     context = {
         'total_users': total_users,
@@ -121,38 +130,123 @@ def admin_dashboard(request):
         'new_users_count': new_users_count,
         'active_users_count': active_users_count,
         'pending_withdrawals': pending_withdrawals,
+        'live_stats': live_stats,
     }
     return render(request, 'admin/dashboard.html', context)
 
+def _sort_queryset(queryset, sort_by, valid_sort_fields, default_sort):
+    """Order a queryset by a whitelisted, optionally descending, sort field."""
+    sort_field = sort_by.lstrip('-')
+    if sort_field not in valid_sort_fields:
+        sort_by = default_sort
+        sort_field = sort_by.lstrip('-')
+    prefix = '-' if sort_by.startswith('-') else ''
+    return queryset.order_by(f"{prefix}{valid_sort_fields[sort_field]}")
+
+# Columns shown on the admin list pages; each page is one query for these
+USER_WALLET_FIELDS = [
+    'pre_starter_wallet', 'starter_wallet', 'basic1_wallet', 'basic2_wallet', 'standard_wallet',
+    'ultimate1_wallet', 'ultimate2_wallet', 'referral_bonus_wallet', 'funding_wallet',
+]
+
+def user_rows(users):
+    """Project users to the manage_users columns, with their balance and active plan."""
+    active_plan = PlanSubscription.objects.filter(
+        user=OuterRef('pk'), status=PlanSubscription.SubscriptionStatus.ACTIVE
+    ).order_by('-created_at').values('plan__name')[:1]
+    total_balance = F(USER_WALLET_FIELDS[0])
+    for field in USER_WALLET_FIELDS[1:]:
+        total_balance += F(field)
+
+    return users.annotate(
+        total_balance=total_balance,
+        subscription_count=Count('subscriptions'),
+        active_plan=Subquery(active_plan),
+    ).values(
+        'id', 'username', 'date_joined', 'is_active', 'total_balance', 'subscription_count', 'active_plan',
+    )
+
+def withdrawal_rows(withdrawals):
+    """Project withdrawals to the manage_withdrawals columns."""
+    return withdrawals.values(
+        'id', 'amount', 'status', 'withdrawal_type', 'created_at', username=F('user__username'),
+    )
+
+def transaction_rows(transactions):
+    """Project transactions to the manage_deposits columns."""
+    return transactions.values(
+        'id', 'amount', 'status', 'description', 'created_at', username=F('user__username'),
+    )
+
+def filter_users(params):
+    """Apply the manage_users search and sort parameters."""
+    users = User.objects.all()
+
+    search_query = params.get('search')
+    if search_query:
+        users = search_users(users, search_query)
+
+    valid_sort_fields = {
+        'username': 'username',
+        'date_joined': 'date_joined',
+        'is_active': 'is_active',
+    }
+    return _sort_queryset(users, params.get('sort', '-date_joined'), valid_sort_fields, '-date_joined')
+
+def filter_withdrawals(params):
+    """Apply the manage_withdrawals search, status and sort parameters."""
+    withdrawals = Withdrawal.objects.all()
+
+    search_query = params.get('search')
+    if search_query:
+        withdrawals = withdrawals.filter(user__in=search_users(User.objects.all(), search_query))
+
+    status = params.get('status')
+    if status:
+        withdrawals = withdrawals.filter(status=status.upper())
+
+    valid_sort_fields = {
+        'username': 'user__username',
+        'created_at': 'created_at',
+        'status': 'status',
+    }
+    return _sort_queryset(withdrawals, params.get('sort', '-created_at'), valid_sort_fields, '-created_at')
+
+def filter_transactions(params, transaction_type=None):
+    """Apply the manage_deposits search, status and sort parameters to transactions."""
+    transactions = Transaction.objects.all()
+
+    transaction_type = transaction_type or params.get('type')
+    if transaction_type:
+        transactions = transactions.filter(transaction_type=transaction_type.upper())
+
+    search_query = params.get('search')
+    if search_query:
+        transactions = transactions.filter(user__in=search_users(User.objects.all(), search_query))
+
+    status = params.get('status')
+    if status:
+        transactions = transactions.filter(status=status.upper())
+
+    valid_sort_fields = {
+        'username': 'user__username',
+        'created_at': 'created_at',
+        'status': 'status',
+    }
+    return _sort_queryset(transactions, params.get('sort', '-created_at'), valid_sort_fields, '-created_at')
+
+def filter_deposits(params):
+    """Apply the manage_deposits filters to deposit transactions."""
+    return filter_transactions(params, transaction_type='DEPOSIT')
+
 @admin_required
 def manage_users(request):
     """View for managing users."""
-    users = User.objects.prefetch_related(
-        'subscriptions',
-        'subscriptions__plan'
-    ).all()
-    
-    # Get search parameter
+    users = user_rows(filter_users(request.GET))
     search_query = request.GET.get('search')
     
-    # Apply search
-    if search_query:
-        users = users.filter(username__icontains=search_query)
-    
-    # Get sort parameter
-    sort_by = request.GET.get('sort', '-date_joined')  # Default sort by date desc
-    sort_field = sort_by.lstrip('-')
-    
-    # Validate sort field
-    valid_sort_fields = ['username', 'date_joined', 'is_active']
-    if sort_field not in valid_sort_fields:
-        sort_by = '-date_joined'
-    
-    # Apply sorting
-    users = users.order_by(sort_by)
-    
     # Pagination
-    paginator = Paginator(users, 10)  # Show 10 users per page
+    paginator = ApproximatePaginator(users, 10)  # Show 10 users per page
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
@@ -166,7 +260,7 @@ def manage_users(request):
     
     context = {
         'page_obj': page_obj,
-        'total_users': users.count(),
+        'total_users': page_obj.paginator.count,
         'current_filters': {
             'search': search_query,
             'sort': current_sort
@@ -178,70 +272,165 @@ def manage_users(request):
 @admin_required
 def manage_withdrawals(request):
     """View for managing withdrawal requests."""
-    withdrawals = Withdrawal.objects.all().order_by('-created_at')
-    paginator = Paginator(withdrawals, 10)
+    withdrawals = withdrawal_rows(filter_withdrawals(request.GET))
+    paginator = ApproximatePaginator(withdrawals, 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
     context = {
         'page_obj': page_obj,
+        'total_withdrawals': page_obj.paginator.count,
+        'current_filters': {
+            'search': request.GET.get('search'),
+            'sort': request.GET.get('sort', ''),
+        },
     }
     return render(request, 'admin/manage_withdrawals.html', context)
 
 @admin_required
 def manage_deposits(request):
     """View for managing deposits."""
-    deposits = Transaction.objects.filter(transaction_type='deposit').order_by('-created_at')
-    paginator = Paginator(deposits, 10)
+    deposits = transaction_rows(filter_deposits(request.GET))
+    paginator = ApproximatePaginator(deposits, 10)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
     context = {
         'page_obj': page_obj,
+        'total_deposits': page_obj.paginator.count,
+        'current_filters': {
+            'search': request.GET.get('search'),
+            'sort': request.GET.get('sort', ''),
+        },
     }
     return render(request, 'admin/manage_deposits.html', context)
 
+USER_EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('username', 'username'),
+    ('email', 'email'),
+    ('date_joined', 'date_joined'),
+    ('last_login', 'last_login'),
+    ('is_active', 'is_active'),
+    ('is_staff', 'is_staff'),
+    ('referral_code', 'referral_code'),
+    ('referred_by__username', 'referred_by'),
+    ('funding_wallet', 'funding_wallet'),
+    ('referral_bonus_wallet', 'referral_bonus_wallet'),
+]
+
+TRANSACTION_EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('transaction_id', 'transaction_id'),
+    ('user__username', 'username'),
+    ('transaction_type', 'transaction_type'),
+    ('amount', 'amount'),
+    ('status', 'status'),
+    ('description', 'description'),
+    ('created_at', 'created_at'),
+    ('completed_at', 'completed_at'),
+]
+
+WITHDRAWAL_EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('user__username', 'username'),
+    ('amount', 'amount'),
+    ('withdrawal_fee', 'withdrawal_fee'),
+    ('withdrawal_type', 'withdrawal_type'),
+    ('status', 'status'),
+    ('transaction__transaction_id', 'transaction_id'),
+    ('created_at', 'created_at'),
+    ('processed_at', 'processed_at'),
+]
+
+@admin_required
+def export_users(request):
+    """Stream the filtered user list as CSV or NDJSON."""
+    return export_response(
+        filter_users(request.GET), USER_EXPORT_COLUMNS, 'users', request.GET.get('format', 'csv')
+    )
+
+@admin_required
+def export_withdrawals(request):
+    """Stream the filtered withdrawal list as CSV or NDJSON."""
+    return export_response(
+        filter_withdrawals(request.GET), WITHDRAWAL_EXPORT_COLUMNS, 'withdrawals', request.GET.get('format', 'csv')
+    )
+
+@admin_required
+def export_deposits(request):
+    """Stream the filtered deposit list as CSV or NDJSON."""
+    return export_response(
+        filter_deposits(request.GET), TRANSACTION_EXPORT_COLUMNS, 'deposits', request.GET.get('format', 'csv')
+    )
+
+@admin_required
+def export_transactions(request):
+    """Stream all transactions, optionally filtered by type, as CSV or NDJSON."""
+    return export_response(
+        filter_transactions(request.GET), TRANSACTION_EXPORT_COLUMNS, 'transactions', request.GET.get('format', 'csv')
+    )
+
 @admin_required
 def user_balance(request, user_id):
-    """View for managing user balance."""
+    """View for adjusting one of a user's wallets."""
     user = get_object_or_404(User, id=user_id)
-    
+
     if request.method == 'POST':
-        action = request.POST.get('action')
-        amount = Decimal(request.POST.get('amount', '0'))
-        
-        if action == 'add':
-            user.balance += amount
-            Transaction.objects.create(
-                user=user,
-                amount=amount,
-                transaction_type='admin_deposit',
-                status='completed',
-                description='Admin deposit'
-            )
-            messages.success(request, f'Added ${amount} to {user.username}\'s balance')
-        elif action == 'remove':
-            if user.balance >= amount:
-                user.balance -= amount
-                Transaction.objects.create(
-                    user=user,
-                    amount=amount,
-                    transaction_type='admin_withdrawal',
-                    status='completed',
-                    description='Admin withdrawal'
-                )
-                messages.success(request, f'Removed ${amount} from {user.username}\'s balance')
-            else:
-                messages.error(request, 'Insufficient balance')
-        
-        user.save()
+        amount = request.POST.get('amount', '0')
+        if request.POST.get('action') == 'remove':
+            amount = f"-{amount}"
+        row = {
+            'line': 1,
+            'user': f"{USER_ID_PREFIX}{user.id}",
+            'wallet': request.POST.get('wallet', 'funding_wallet'),
+            'amount': amount,
+            'reason': request.POST.get('reason', '').strip() or 'Admin adjustment',
+        }
+        result = apply_adjustment_chunk([row], request.user)[0]
+        if result['status'] == 'applied':
+            messages.success(request, f"Adjusted {user.username}'s {result['wallet']} by ${result['amount']}")
+        else:
+            messages.error(request, result['message'])
         return redirect('admin:user_balance', user_id=user.id)
-    
+
     context = {
         'user': user,
+        'wallets': [(wallet, getattr(user, wallet)) for wallet in ADJUSTABLE_WALLETS],
     }
     return render(request, 'admin/user_balance.html', context)
 
+@admin_required
+def bulk_adjust_balances(request):
+    """Apply a CSV of wallet adjustments and stream back the per-row report."""
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        if upload is None:
+            messages.error(request, 'Please choose a CSV file')
+            return redirect('admin:bulk_adjust_balances')
+
+        try:
+            rows = read_adjustments(io.TextIOWrapper(upload.file, encoding='utf-8-sig'))
+            first = next(rows, None)
+        except (ValueError, UnicodeDecodeError) as e:
+            messages.error(request, f'Invalid CSV: {e}')
+            return redirect('admin:bulk_adjust_balances')
+        if first is None:
+            messages.error(request, 'The CSV has no rows')
+            return redirect('admin:bulk_adjust_balances')
+
+        results = apply_adjustments(itertools.chain([first], rows), request.user)
+        response = StreamingHttpResponse(stream_csv(report_rows(results), REPORT_COLUMNS), content_type='text/csv')
+        filename = f"balance-adjustments-{timezone.now():%Y%m%d-%H%M%S}.csv"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    context = {
+        'columns': INPUT_COLUMNS,
+        'wallets': ADJUSTABLE_WALLETS,
+    }
+    return render(request, 'admin/bulk_adjust_balances.html', context)
+
 @admin_required
 def process_withdrawal(request, withdrawal_id):
     """View for processing withdrawal requests."""
@@ -250,16 +439,15 @@ def process_withdrawal(request, withdrawal_id):
     if request.method == 'POST':
         action = request.POST.get('action')
         
-        if action == 'approve':
-            withdrawal.status = 'approved'
-            withdrawal.save()
-            messages.success(request, f'Withdrawal request for ${withdrawal.amount} has been approved')
-        elif action == 'reject':
-            withdrawal.status = 'rejected'
-            withdrawal.user.balance += withdrawal.amount  # Refund the amount
-            withdrawal.user.save()
-            withdrawal.save()
-            messages.success(request, f'Withdrawal request for ${withdrawal.amount} has been rejected and refunded')
+        if action in WITHDRAWAL_ACTIONS:
+            # Locks the row so two admins can't process the same request
+            result = process_withdrawals([withdrawal.id], action, request.user)
+            if not result['processed']:
+                messages.error(request, 'This withdrawal has already been processed or is being handled by another admin')
+            elif action == 'approve':
+                messages.success(request, f'Withdrawal request for ${withdrawal.amount} has been approved')
+            else:
+                messages.success(request, f'Withdrawal request for ${withdrawal.amount} has been rejected and refunded')
         
         return redirect('admin:manage_withdrawals')
     
@@ -268,40 +456,56 @@ def process_withdrawal(request, withdrawal_id):
     }
     return render(request, 'admin/process_withdrawal.html', context)
 
+@admin_required
+def withdrawal_queue(request):
+    """Work queue for claiming and processing pending withdrawals in batches."""
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        selected_ids = [int(pk) for pk in request.POST.getlist('ids') if pk.isdigit()]
+
+        if action == 'claim':
+            try:
+                batch_size = int(request.POST.get('batch_size') or DEFAULT_CLAIM_BATCH_SIZE)
+            except ValueError:
+                batch_size = DEFAULT_CLAIM_BATCH_SIZE
+            claimed = claim_withdrawals(request.user, limit=max(1, min(batch_size, 500)))
+            if claimed:
+                messages.success(request, f'Claimed {len(claimed)} withdrawal(s)')
+            else:
+                messages.info(request, 'There are no pending withdrawals to claim')
+        elif action == 'release':
+            released = release_withdrawals(request.user, selected_ids or None)
+            messages.success(request, f'Released {released} withdrawal(s)')
+        elif action in WITHDRAWAL_ACTIONS:
+            if not selected_ids:
+                messages.error(request, 'Select at least one withdrawal')
+            else:
+                result = process_withdrawals(selected_ids, action, request.user)
+                verb = 'Approved' if action == 'approve' else 'Rejected'
+                messages.success(request, f'{verb} {len(result["processed"])} withdrawal(s)')
+                if result['skipped']:
+                    messages.warning(
+                        request,
+                        f'Skipped {len(result["skipped"])} withdrawal(s) already processed or claimed by another admin'
+                    )
+
+        return redirect('admin:withdrawal_queue')
+
+    claimed_withdrawals = Withdrawal.objects.filter(
+        claimed_by=request.user, status='PENDING'
+    ).select_related('user').order_by('created_at')
+
+    context = {
+        'claimed_withdrawals': claimed_withdrawals,
+        'available_count': approximate_count(available_withdrawals()),
+        'batch_size': DEFAULT_CLAIM_BATCH_SIZE,
+    }
+    return render(request, 'admin/withdrawal_queue.html', context)
+
 @admin_required
 def search_suggestions(request):
     """API endpoint for search suggestions."""
-    query = request.GET.get('q', '').strip()
-    suggestions = []
-    
-    if len(query) >= 2:
-        # Get username suggestions
-        username_suggestions = User.objects.filter(
-            username__icontains=query
-        ).values_list('username', flat=True)[:5]
-        suggestions.extend(username_suggestions)
-        
-        # Get email suggestions (domain part masked)
-        email_suggestions = User.objects.filter(
-            email__icontains=query
-        ).values_list('email', flat=True)[:5]
-        masked_emails = [
-            f"{email.split('@')[0]}@..." for email in email_suggestions
-        ]
-        suggestions.extend(masked_emails)
-        
-        # Get plan name suggestions
-        plan_suggestions = User.objects.filter(
-            subscriptions__plan__name__icontains=query
-        ).values_list(
-            'subscriptions__plan__name', flat=True
-        ).distinct()[:5]
-        suggestions.extend(plan_suggestions)
-        
-        # Remove duplicates and limit to 5 suggestions
-        suggestions = list(dict.fromkeys(suggestions))[:5]
-    
-    return JsonResponse({'suggestions': suggestions})
+    return JsonResponse({'suggestions': get_suggestions(request.GET.get('q', ''))})
 
 @admin_required
 def create_staff_user(request):
@@ -329,4 +533,35 @@ def create_staff_user(request):
             messages.error(request, f'Error creating staff user: {str(e)}')
             return redirect('admin:create_staff_user')
             
-    return render(request, 'admin/create_staff_user.html') 
\ No newline at end of file
+    return render(request, 'admin/create_staff_user.html')
+
+@admin_required
+def broadcast_notification(request):
+    """Send a notification to the active users matching the manage_users search."""
+    recipients = filter_users(request.POST if request.method == 'POST' else request.GET).filter(is_active=True)
+
+    if request.method == 'POST':
+        message = request.POST.get('message', '').strip()
+        notification_type = request.POST.get('notification_type', 'info')
+
+        if not message:
+            messages.error(request, 'Please enter a message')
+        elif notification_type not in dict(Notification.NOTIFICATION_TYPES):
+            messages.error(request, 'Invalid notification type')
+        else:
+            sent = send_broadcast(
+                message,
+                title=request.POST.get('title', '').strip(),
+                notification_type=notification_type,
+                link=request.POST.get('link') or None,
+                users=recipients,
+            )
+            messages.success(request, f'Notification sent to {sent} users')
+            return redirect('admin:manage_users')
+
+    context = {
+        'recipient_count': approximate_count(recipients),
+        'search': request.POST.get('search') if request.method == 'POST' else request.GET.get('search'),
+        'notification_types': Notification.NOTIFICATION_TYPES,
+    }
+    return render(request, 'admin/broadcast_notification.html', context)
@@ -0,0 +1,292 @@
+"""
+Bulk wallet balance adjustments for the admin panel.
+
+An uploaded CSV with ``user,wallet,amount,reason`` columns is read once, row
+by row, and applied in chunks. ``user`` is a username, or ``id:`` followed by
+a user ID. Each chunk runs in its own transaction and
+does the following:
+
+1. Resolves and locks its users with one query.
+2. Checks each row against the user's running balance.
+3. Updates each wallet column it touches with a single ``UPDATE ... CASE``.
+4. Bulk-creates one ADJUSTMENT transaction per applied row.
+
+Every input row produces a line in the result report, so a month-end run over
+tens of thousands of users costs a few queries per thousand rows. The report
+is streamed back while the upload is still being applied.
+"""
+
+import csv
+import logging
+import uuid
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from transactions.models import Transaction
+from transactions.rollups import mark_user_active, record_transaction
+from users.cache import invalidate_user_cache
+from users.models import User
+
+logger = logging.getLogger("agape.transactions")
+
+# Rows applied per database transaction
+ADJUSTMENT_CHUNK_SIZE = 1000
+
+# User wallet columns an adjustment may target
+ADJUSTABLE_WALLETS = [
+    "pre_starter_wallet",
+    "starter_wallet",
+    "basic1_wallet",
+    "basic2_wallet",
+    "standard_wallet",
+    "ultimate1_wallet",
+    "ultimate2_wallet",
+    "referral_bonus_wallet",
+    "funding_wallet",
+]
+
+INPUT_COLUMNS = ["user", "wallet", "amount", "reason"]
+REPORT_COLUMNS = [
+    "line",
+    "user",
+    "wallet",
+    "amount",
+    "reason",
+    "status",
+    "message",
+    "transaction_id",
+]
+
+# A user cell starting with this prefix is a user ID; anything else is a username
+USER_ID_PREFIX = "id:"
+
+# Exclusive upper bound of each wallet column, from its max_digits and decimal_places
+WALLET_LIMITS = {
+    wallet: Decimal(10) ** (field.max_digits - field.decimal_places)
+    for wallet, field in ((wallet, User._meta.get_field(wallet)) for wallet in ADJUSTABLE_WALLETS)
+}
+
+
+def read_adjustments(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Parse an adjustment CSV without loading it into memory.
+
+    Args:
+        lines (Iterable[str]): The decoded CSV lines, header first
+
+    Returns:
+        Iterator[Dict[str, Any]]: One row per line with its 'line' number
+
+    Raises:
+        ValueError: If the header is missing one of the input columns
+    """
+    reader = csv.DictReader(lines)
+    headers = [header.strip().lower() for header in reader.fieldnames or []]
+    missing = [column for column in INPUT_COLUMNS if column not in headers]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}")
+    reader.fieldnames = headers
+
+    for row in reader:
+        yield {
+            "line": reader.line_num,
+            **{column: (row.get(column) or "").strip() for column in INPUT_COLUMNS},
+        }
+
+
+def _validate(row: Dict[str, Any]) -> Optional[str]:
+    """Check a row's own fields, normalizing them in place; returns an error message."""
+    if not row["user"]:
+        return "User is required"
+
+    wallet = row["wallet"].lower()
+    if not wallet.endswith("_wallet"):
+        wallet = f"{wallet}_wallet"
+    if wallet not in ADJUSTABLE_WALLETS:
+        return f"Unknown wallet '{row['wallet']}'"
+    row["wallet"] = wallet
+
+    user = row["user"]
+    if user.lower().startswith(USER_ID_PREFIX):
+        user_id = user[len(USER_ID_PREFIX) :].strip()
+        if not user_id.isdigit():
+            return f"Invalid user ID '{user}'"
+        row["user_id"] = int(user_id)
+
+    limit = WALLET_LIMITS[wallet]
+    try:
+        amount = Decimal(row["amount"])
+        if not amount.is_finite() or abs(amount) >= limit:
+            return f"Amount must be non-zero and below {limit:,}"
+        if amount != amount.quantize(Decimal("0.01")):
+            return "Amount must have at most two decimal places"
+    except InvalidOperation:
+        return f"Invalid amount '{row['amount']}'"
+    if not amount:
+        return f"Amount must be non-zero and below {limit:,}"
+    row["amount"] = amount.quantize(Decimal("0.01"))
+
+    if not row["reason"]:
+        return "Reason is required"
+    return None
+
+
+def _reject(row: Dict[str, Any], message: str) -> Dict[str, Any]:
+    return {**row, "status": "rejected", "message": message, "transaction_id": ""}
+
+
+def apply_adjustment_chunk(rows: List[Dict[str, Any]], admin_user) -> List[Dict[str, Any]]:
+    """
+    Validate and apply one chunk of adjustments in a single transaction.
+
+    Rows are applied in order against each user's running balance, so a
+    debit is only rejected if the rows before it leave too little.
+
+    Args:
+        rows (List[Dict[str, Any]]): Parsed rows from read_adjustments
+        admin_user (User): The admin making the adjustments
+
+    Returns:
+        List[Dict[str, Any]]: The report line for each row, in input order
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+    valid: List[Tuple[int, Dict[str, Any]]] = []
+    for index, row in enumerate(rows):
+        error = _validate(row)
+        if error:
+            results[index] = _reject(row, error)
+        else:
+            valid.append((index, row))
+
+    now = timezone.now()
+    with transaction.atomic():
+        ids = {row["user_id"] for _, row in valid if "user_id" in row}
+        names = {row["user"] for _, row in valid if "user_id" not in row}
+        wallets = sorted({row["wallet"] for _, row in valid})
+        users = (
+            list(
+                User.objects.select_for_update()
+                .filter(Q(pk__in=ids) | Q(username__in=names))
+                .order_by("pk")
+                .values("pk", "username", *wallets)
+            )
+            if valid
+            else []
+        )
+        by_id = {user["pk"]: user for user in users}
+        by_name = {user["username"]: user for user in users}
+
+        deltas: Dict[str, Dict[int, Decimal]] = defaultdict(lambda: defaultdict(Decimal))
+        new_transactions = []
+        for index, row in valid:
+            user = by_id.get(row["user_id"]) if "user_id" in row else by_name.get(row["user"])
+            if user is None:
+                results[index] = _reject(row, "User not found")
+                continue
+
+            balance = user[row["wallet"]] + deltas[row["wallet"]][user["pk"]]
+            if balance + row["amount"] < 0:
+                results[index] = _reject(row, f"Insufficient balance ({balance})")
+                continue
+            if balance + row["amount"] >= WALLET_LIMITS[row["wallet"]]:
+                results[index] = _reject(
+                    row, f"Balance would exceed {WALLET_LIMITS[row['wallet']]:,}"
+                )
+                continue
+
+            deltas[row["wallet"]][user["pk"]] += row["amount"]
+            transaction_id = f"ADJ-{uuid.uuid4().hex[:12]}"
+            new_transactions.append(
+                Transaction(
+                    user_id=user["pk"],
+                    transaction_type="ADJUSTMENT",
+                    amount=row["amount"],
+                    status="COMPLETED",
+                    transaction_id=transaction_id,
+                    description=f"{row['reason']} ({row['wallet']}, by {admin_user.username})",
+                    completed_at=now,
+                )
+            )
+            results[index] = {
+                **row,
+                "status": "applied",
+                "message": "",
+                "transaction_id": transaction_id,
+            }
+
+        # One UPDATE per wallet column touched by the chunk
+        for wallet, changes in deltas.items():
+            field = User._meta.get_field(wallet)
+            change = Case(
+                *[When(pk=user_id, then=Value(delta)) for user_id, delta in changes.items()],
+                output_field=DecimalField(
+                    max_digits=field.max_digits, decimal_places=field.decimal_places
+                ),
+            )
+            User.objects.filter(pk__in=changes).update(**{wallet: F(wallet) + change})
+
+        if new_transactions:
+            Transaction.objects.bulk_create(new_transactions)
+
+            # bulk_create and update() send no signals
+            day = timezone.localdate(now)
+            record_transaction(
+                day,
+                "ADJUSTMENT",
+                "COMPLETED",
+                len(new_transactions),
+                sum((t.amount for t in new_transactions), Decimal("0.00")),
+            )
+            for user_id in {t.user_id for t in new_transactions}:
+                mark_user_active(user_id, day)
+                invalidate_user_cache(user_id)
+
+    return results
+
+
+def _chunked(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk: List[Dict[str, Any]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def apply_adjustments(
+    rows: Iterable[Dict[str, Any]], admin_user, chunk_size: int = ADJUSTMENT_CHUNK_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """
+    Apply adjustments chunk by chunk, yielding each row's report line.
+
+    Args:
+        rows (Iterable[Dict[str, Any]]): Parsed rows from read_adjustments
+        admin_user (User): The admin making the adjustments
+        chunk_size (int): Rows applied per database transaction
+
+    Returns:
+        Iterator[Dict[str, Any]]: Report lines, in input order
+    """
+    counts = {"applied": 0, "rejected": 0}
+    for chunk in _chunked(rows, chunk_size):
+        for result in apply_adjustment_chunk(chunk, admin_user):
+            counts[result["status"]] += 1
+            yield result
+
+    logger.info(
+        f"Balance adjustments by {admin_user.username}: "
+        f"{counts['applied']} applied, {counts['rejected']} rejected"
+    )
+
+
+def report_rows(results: Iterable[Dict[str, Any]]) -> Iterator[tuple]:
+    """Turn report lines into tuples in REPORT_COLUMNS order."""
+    for result in results:
+        yield tuple(result[column] for column in REPORT_COLUMNS)
@@ -0,0 +1,233 @@
+"""
+Chain-explorer clients used to verify submitted crypto payments.
+
+The payment verifier loads the client named by ``PAYMENT_EXPLORER_CLIENT``.
+``EtherscanExplorerClient`` talks to any Etherscan-compatible API (Etherscan,
+BscScan, ...) and ``StubExplorerClient`` answers from an in-memory table so
+tests and local development never touch the network.
+"""
+
+import re
+from decimal import Decimal
+from typing import Dict, NamedTuple, Optional
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+# Hex formats accepted for submitted transaction hashes and wallet addresses
+TRANSACTION_HASH_RE = re.compile(r"^0x[0-9a-f]{64}$")
+ADDRESS_RE = re.compile(r"^0x[0-9a-f]{40}$")
+
+# Verification outcomes
+CONFIRMED = "confirmed"
+PENDING = "pending"
+FAILED = "failed"
+
+
+class TransferCheck(NamedTuple):
+    """
+    The result of looking up a payment on chain.
+
+    ``status`` is CONFIRMED when the transfer reached the receiving address
+    with enough confirmations, PENDING when it should be checked again later
+    (not yet mined, not enough confirmations, or the explorer was
+    unavailable) and FAILED when it can never be credited.
+    """
+
+    status: str
+    amount: Optional[Decimal] = None
+    reason: str = ""
+
+
+class ExplorerError(Exception):
+    """Raised when the explorer cannot be reached or returns an error."""
+
+
+def normalize_transaction_hash(value: str) -> str:
+    """
+    Return a transaction hash in the canonical form stored on payments.
+
+    Hashes are case-insensitive hex, so ``0xAB..`` and `` 0xab.. `` are the
+    same transfer; storing one form keeps the uniqueness check and webhook
+    lookups from being sidestepped by changing case or padding.
+
+    Args:
+        value (str): The hash as submitted
+
+    Returns:
+        str: The stripped, lowercased hash
+
+    Raises:
+        ValueError: If the value is not a 0x-prefixed 32-byte hex hash
+    """
+    normalized = str(value or "").strip().lower()
+    if not TRANSACTION_HASH_RE.match(normalized):
+        raise ValueError("Transaction ID must be a 0x-prefixed 64 character hex hash.")
+    return normalized
+
+
+def normalize_address(value: str) -> str:
+    """
+    Return a wallet address in the canonical form stored on payments.
+
+    Args:
+        value (str): The address as submitted
+
+    Returns:
+        str: The stripped, lowercased address
+
+    Raises:
+        ValueError: If the value is not a 0x-prefixed 20-byte hex address
+    """
+    normalized = str(value or "").strip().lower()
+    if not ADDRESS_RE.match(normalized):
+        raise ValueError("Wallet address must be a 0x-prefixed 40 character hex address.")
+    return normalized
+
+
+class BaseExplorerClient:
+    """Interface for chain-explorer clients."""
+
+    def check_transfer(
+        self, transaction_hash: str, expected_amount: Decimal, sender: str = ""
+    ) -> TransferCheck:
+        """
+        Look up a token transfer to the receiving address.
+
+        Args:
+            transaction_hash (str): The on-chain transaction hash submitted by the user
+            expected_amount (Decimal): The amount the user says they paid
+            sender (str): The wallet the user says they paid from; only transfers from it count
+
+        Returns:
+            TransferCheck: The verification outcome
+
+        Raises:
+            ExplorerError: If the explorer could not be queried
+        """
+        raise NotImplementedError
+
+
+class EtherscanExplorerClient(BaseExplorerClient):
+    """
+    Verify ERC-20/BEP-20 transfers through an Etherscan-compatible API.
+
+    The transaction receipt is searched for a Transfer event from the
+    configured token contract to the receiving address, sent from the
+    wallet the user submitted.
+    """
+
+    def __init__(
+        self, api_url: Optional[str] = None, api_key: Optional[str] = None, timeout: int = 10
+    ):
+        """Create a client for the configured Etherscan-compatible API."""
+        self.api_url = api_url or settings.PAYMENT_EXPLORER_API_URL
+        self.api_key = api_key if api_key is not None else settings.PAYMENT_EXPLORER_API_KEY
+        self.timeout = timeout
+        try:
+            self.receiving_address = normalize_address(settings.PAYMENT_RECEIVING_ADDRESS)
+            self.token_contract = normalize_address(settings.PAYMENT_TOKEN_CONTRACT)
+        except ValueError as e:
+            raise ImproperlyConfigured(f"PAYMENT_RECEIVING_ADDRESS and PAYMENT_TOKEN_CONTRACT: {e}")
+        self.token_decimals = settings.PAYMENT_TOKEN_DECIMALS
+        self.required_confirmations = settings.PAYMENT_REQUIRED_CONFIRMATIONS
+        # One pooled connection per client; the verifier shares a client across threads
+        self.session = requests.Session()
+
+    def _call(self, action: str, **params) -> Optional[dict]:
+        try:
+            response = self.session.get(
+                self.api_url,
+                params={"module": "proxy", "action": action, "apikey": self.api_key, **params},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            payload = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise ExplorerError(f"{action} failed: {e}")
+
+        if "error" in payload:
+            raise ExplorerError(f"{action} failed: {payload['error']}")
+        # Rate limits and API key errors come back as a plain string result
+        if isinstance(payload.get("result"), str) and not payload["result"].startswith("0x"):
+            raise ExplorerError(f"{action} failed: {payload['result']}")
+        return payload.get("result")
+
+    def check_transfer(
+        self, transaction_hash: str, expected_amount: Decimal, sender: str = ""
+    ) -> TransferCheck:
+        """Check a transfer; see BaseExplorerClient.check_transfer."""
+        receipt = self._call("eth_getTransactionReceipt", txhash=transaction_hash)
+        if not receipt:
+            return TransferCheck(PENDING, reason="Transaction not found or not yet mined")
+        if receipt.get("status") != "0x1":
+            return TransferCheck(FAILED, reason="Transaction reverted on chain")
+
+        paid = Decimal("0")
+        for log in receipt.get("logs", []):
+            topics = log.get("topics", [])
+            if (
+                log.get("address", "").lower() == self.token_contract
+                and len(topics) == 3
+                and topics[0] == TRANSFER_TOPIC
+                and "0x" + topics[2][-40:].lower() == self.receiving_address
+                and (not sender or "0x" + topics[1][-40:].lower() == sender)
+            ):
+                paid += Decimal(int(log["data"], 16)) / (Decimal(10) ** self.token_decimals)
+
+        if not paid:
+            return TransferCheck(
+                FAILED, reason="No token transfer from your wallet to the receiving address"
+            )
+        if paid < expected_amount:
+            return TransferCheck(
+                FAILED,
+                amount=paid,
+                reason=f"Transfer of {paid} is less than the submitted {expected_amount}",
+            )
+
+        latest_block = int(self._call("eth_blockNumber"), 16)
+        confirmations = latest_block - int(receipt["blockNumber"], 16) + 1
+        if confirmations < self.required_confirmations:
+            return TransferCheck(
+                PENDING,
+                amount=paid,
+                reason=f"{confirmations} of {self.required_confirmations} confirmations",
+            )
+
+        return TransferCheck(CONFIRMED, amount=expected_amount)
+
+
+class StubExplorerClient(BaseExplorerClient):
+    """
+    In-memory explorer for tests and local development.
+
+    Register outcomes in ``StubExplorerClient.transfers`` keyed by transaction
+    hash; unknown hashes are reported as not yet mined.
+    """
+
+    transfers: Dict[str, TransferCheck] = {}
+
+    def check_transfer(
+        self, transaction_hash: str, expected_amount: Decimal, sender: str = ""
+    ) -> TransferCheck:
+        """Check a transfer; see BaseExplorerClient.check_transfer."""
+        result = self.transfers.get(transaction_hash)
+        if isinstance(result, Exception):
+            raise result
+        return result or TransferCheck(PENDING, reason="Transaction not found or not yet mined")
+
+
+def get_explorer_client() -> BaseExplorerClient:
+    """
+    Build the explorer client configured in PAYMENT_EXPLORER_CLIENT.
+
+    Returns:
+        BaseExplorerClient: The configured client
+    """
+    return import_string(settings.PAYMENT_EXPLORER_CLIENT)()
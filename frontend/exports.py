@@ -0,0 +1,150 @@
+"""
+Streaming CSV/NDJSON exports for the admin panel.
+
+Rows are read with ``values_list(...).iterator(chunk_size=...)`` and written to
+a ``StreamingHttpResponse`` as they arrive, so an export of millions of rows
+uses constant memory and the first bytes are sent before the query finishes.
+
+Text cells that a spreadsheet would read as a formula (starting with ``=``,
+``+``, ``-``, ``@``, tab or carriage return) are prefixed with ``'`` in CSV
+output, so user-supplied names and descriptions can't run in the admin's
+spreadsheet.
+"""
+
+import csv
+import json
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# Number of rows fetched from the database per round trip
+EXPORT_CHUNK_SIZE = 2000
+
+# Number of rows buffered before a chunk is handed to the WSGI server
+ROWS_PER_WRITE = 500
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+# A column is a (queryset lookup, output header) pair
+Column = Tuple[str, str]
+
+# Leading characters that make spreadsheets evaluate a cell
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+class Echo:
+    """Pseudo-buffer that hands back whatever ``csv.writer`` writes to it."""
+
+    def write(self, value: str) -> str:
+        """Return the value instead of buffering it."""
+        return value
+
+
+def iter_rows(
+    queryset: QuerySet, columns: Sequence[Column], chunk_size: int = EXPORT_CHUNK_SIZE
+) -> Iterator[tuple]:
+    """
+    Iterate over a queryset's export columns without caching the results.
+
+    Args:
+        queryset (QuerySet): The rows to export
+        columns (Sequence[Column]): The (lookup, header) pairs to read
+        chunk_size (int): Number of rows fetched per database round trip
+
+    Returns:
+        Iterator[tuple]: One tuple of column values per row
+    """
+    lookups = [lookup for lookup, _ in columns]
+    return queryset.values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+def _batched(lines: Iterable[str]) -> Iterator[str]:
+    """Join lines into larger writes so the server isn't flushed once per row."""
+    buffer: List[str] = []
+    for line in lines:
+        buffer.append(line)
+        if len(buffer) >= ROWS_PER_WRITE:
+            yield "".join(buffer)
+            buffer = []
+    if buffer:
+        yield "".join(buffer)
+
+
+def _escape_cell(value):
+    """Prefix text a spreadsheet would evaluate as a formula."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def stream_csv(rows: Iterable[tuple], headers: Sequence[str]) -> Iterator[str]:
+    """
+    Render rows as CSV, yielding the header line immediately.
+
+    Args:
+        rows (Iterable[tuple]): The rows to render
+        headers (Sequence[str]): The column headers
+
+    Returns:
+        Iterator[str]: CSV text chunks
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(headers)
+    yield from _batched(writer.writerow([_escape_cell(value) for value in row]) for row in rows)
+
+
+def stream_ndjson(rows: Iterable[tuple], headers: Sequence[str]) -> Iterator[str]:
+    """
+    Render rows as newline-delimited JSON objects keyed by header.
+
+    Args:
+        rows (Iterable[tuple]): The rows to render
+        headers (Sequence[str]): The keys for each row's values
+
+    Returns:
+        Iterator[str]: NDJSON text chunks
+    """
+    yield from _batched(
+        json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + "\n" for row in rows
+    )
+
+
+def export_response(
+    queryset: QuerySet,
+    columns: Sequence[Column],
+    name: str,
+    export_format: str = "csv",
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> StreamingHttpResponse:
+    """
+    Build a streaming download of a queryset.
+
+    Args:
+        queryset (QuerySet): The filtered and ordered rows to export
+        columns (Sequence[Column]): The (lookup, header) pairs to export
+        name (str): Base name of the downloaded file
+        export_format (str): Either 'csv' or 'ndjson'; unknown values fall back to 'csv'
+        chunk_size (int): Number of rows fetched per database round trip
+
+    Returns:
+        StreamingHttpResponse: The streaming export
+    """
+    if export_format not in EXPORT_FORMATS:
+        export_format = "csv"
+
+    headers = [header for _, header in columns]
+    rows = iter_rows(queryset, columns, chunk_size)
+    renderer = stream_ndjson if export_format == "ndjson" else stream_csv
+
+    response = StreamingHttpResponse(
+        renderer(rows, headers), content_type=EXPORT_FORMATS[export_format]
+    )
+    filename = f"{name}-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
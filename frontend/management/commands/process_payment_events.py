@@ -0,0 +1,56 @@
+"""Settle payments from the webhook event inbox."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from frontend.payments import EVENT_BATCH_SIZE, process_payment_events
+
+
+class Command(BaseCommand):
+    """Drain the payment webhook inbox, once or continuously."""
+
+    help = (
+        "Settle pending payments from the payment webhook inbox. "
+        "Several copies can run in parallel."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=EVENT_BATCH_SIZE,
+            help="Events settled per transaction.",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=0,
+            help="Stop after this many batches. Defaults to running until the inbox is empty.",
+        )
+        parser.add_argument(
+            "--forever", action="store_true", help="Keep polling for new events instead of exiting."
+        )
+        parser.add_argument(
+            "--interval", type=int, default=5, help="Seconds to wait between polls with --forever."
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        while True:
+            totals = process_payment_events(
+                batch_size=max(options["batch_size"], 1),
+                max_batches=options["max_batches"],
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Payment events processed: {totals['events']} events, "
+                    f"{totals['confirmed']} confirmed, {totals['failed']} failed "
+                    f"in {totals['batches']} batches."
+                )
+            )
+
+            if not options["forever"]:
+                break
+            time.sleep(options["interval"])
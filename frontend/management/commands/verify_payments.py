@@ -0,0 +1,63 @@
+"""Verify pending crypto payments against the block explorer."""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from frontend.payments import verify_pending_payments
+
+
+class Command(BaseCommand):
+    """Verify due payments in batches, once or continuously."""
+
+    help = (
+        "Verify pending crypto payments on chain and credit confirmed ones. "
+        "Several copies can run in parallel."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="Payments claimed per batch. Defaults to PAYMENT_VERIFIER_BATCH_SIZE.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            help="Explorer lookups in flight. Defaults to PAYMENT_VERIFIER_CONCURRENCY.",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=0,
+            help="Stop after this many batches. Defaults to running until no payments are due.",
+        )
+        parser.add_argument(
+            "--forever",
+            action="store_true",
+            help="Keep polling for new payments instead of exiting.",
+        )
+        parser.add_argument(
+            "--interval", type=int, default=30, help="Seconds to wait between polls with --forever."
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        while True:
+            totals = verify_pending_payments(
+                batch_size=options["batch_size"],
+                concurrency=options["concurrency"],
+                max_batches=options["max_batches"],
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Payments verified: {totals['confirmed']} confirmed, "
+                    f"{totals['failed']} failed, {totals['retried']} retried "
+                    f"in {totals['batches']} batches."
+                )
+            )
+
+            if not options["forever"]:
+                break
+            time.sleep(options["interval"])
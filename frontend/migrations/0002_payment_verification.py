@@ -0,0 +1,30 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("frontend", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="verification_attempts",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="next_verification_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="verified_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["status", "next_verification_at"], name="payment_verification_idx"),
+        ),
+    ]
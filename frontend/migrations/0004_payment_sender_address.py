@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("frontend", "0003_payment_event"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="sender_address",
+            field=models.CharField(blank=True, db_index=True, default="", max_length=42),
+        ),
+    ]
@@ -15,13 +15,57 @@ class Payment(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     transaction_id = models.CharField(max_length=255, unique=True)
     token_id = models.CharField(max_length=255)
+    # Wallet the transfer was sent from; only transfers from it are credited
+    sender_address = models.CharField(max_length=42, blank=True, default='', db_index=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     notes = models.TextField(blank=True, null=True)
+    # Background verification state (see frontend.payments)
+    verification_attempts = models.PositiveIntegerField(default=0)
+    next_verification_at = models.DateTimeField(null=True, blank=True)
+    verified_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_verification_at'], name='payment_verification_idx'),
+        ]
 
     def __str__(self):
         return f"Payment of {self.amount} USDT by {self.user.username} ({self.status})"
+
+
+class PaymentEvent(models.Model):
+    """
+    A payment confirmation pushed by the payment provider.
+
+    The webhook only ever inserts into this table; the process_payment_events
+    command reads unprocessed rows in batches, settles the matching payments
+    and stamps ``processed_at``. Redelivered events are dropped by the
+    unique constraint on (transaction_id, token_id).
+    """
+    STATUS_CHOICES = [
+        ('confirmed', 'Confirmed'),
+        ('failed', 'Failed'),
+    ]
+
+    transaction_id = models.CharField(max_length=255)
+    token_id = models.CharField(max_length=255)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['transaction_id', 'token_id'], name='unique_payment_event'),
+        ]
+        indexes = [
+            models.Index(fields=['processed_at', 'id'], name='payment_event_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} event for {self.transaction_id}"
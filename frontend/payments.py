@@ -0,0 +1,519 @@
+"""
+Background verification of submitted crypto payments.
+
+``fund_account`` and ``submit_payment`` store payments as 'pending'. The
+``verify_payments`` command drains them in batches:
+
+1. Claim a batch with ``SELECT ... FOR UPDATE SKIP LOCKED`` and push its
+   ``next_verification_at`` into the future, so parallel verifiers never
+   check the same payment twice.
+2. Look each payment up on chain through the configured explorer client,
+   with a bounded thread pool. No database connection is held meanwhile.
+3. In one transaction, credit the confirmed payments to the users' funding
+   wallets, record DEPOSIT transactions and notify each user once. Failed
+   payments are closed, and unconfirmed ones are rescheduled with
+   exponential backoff.
+
+Confirmations pushed by the payment provider take a faster path: the
+webhook appends them to the ``PaymentEvent`` inbox and
+``process_payment_events`` settles them through the same bulk crediting.
+"""
+
+import hashlib
+import hmac
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from transactions.live import record_completed_deposits
+from transactions.models import Transaction
+from transactions.rollups import mark_user_active, record_transaction
+from users.models import Notification, User
+from users.notifications import create_notifications
+
+from .explorers import (
+    CONFIRMED,
+    FAILED,
+    PENDING,
+    BaseExplorerClient,
+    ExplorerError,
+    TransferCheck,
+    get_explorer_client,
+    normalize_address,
+    normalize_transaction_hash,
+)
+from .models import Payment, PaymentEvent
+
+logger = logging.getLogger("agape.payments")
+
+# Seconds a claimed payment is hidden from other verifiers while it is checked
+CLAIM_LEASE = 5 * 60
+
+# Retry delays double from BACKOFF_BASE seconds up to BACKOFF_MAX seconds
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+
+# Largest number of events accepted in one webhook delivery
+MAX_EVENTS_PER_DELIVERY = 1000
+
+# Number of inbox events settled per transaction
+EVENT_BATCH_SIZE = 500
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    """
+    Return how long to wait before checking a payment again.
+
+    Args:
+        attempts (int): Number of checks made so far
+
+    Returns:
+        timedelta: The delay before the next check
+    """
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX))
+
+
+def normalize_submission(user: User, transaction_id: str, sender_address: str) -> Tuple[str, str]:
+    """
+    Validate the on-chain details of a submitted payment.
+
+    A sending wallet belongs to the first account that pays from it, so a
+    transaction hash copied from the explorer can't be claimed by anyone
+    but the user who sent it.
+
+    Args:
+        user (User): The user submitting the payment
+        transaction_id (str): The transaction hash as submitted
+        sender_address (str): The wallet address the user paid from
+
+    Returns:
+        Tuple[str, str]: The normalized transaction hash and sender address
+
+    Raises:
+        ValueError: If either value is malformed, the hash was already
+            submitted or the wallet is linked to another account
+    """
+    transaction_id = normalize_transaction_hash(transaction_id)
+    sender_address = normalize_address(sender_address)
+
+    if Payment.objects.filter(transaction_id=transaction_id).exists():
+        raise ValueError("Transaction ID already exists.")
+    if Payment.objects.filter(sender_address=sender_address).exclude(user=user).exists():
+        raise ValueError("This wallet address is linked to another account.")
+    return transaction_id, sender_address
+
+
+def claim_payments(limit: int) -> List[Payment]:
+    """
+    Claim a batch of pending payments that are due for a check.
+
+    Args:
+        limit (int): Maximum number of payments to claim
+
+    Returns:
+        List[Payment]: The claimed payments, oldest first
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.filter(
+                Q(next_verification_at__isnull=True) | Q(next_verification_at__lte=now),
+                status="pending",
+            )
+            .select_for_update(skip_locked=True)
+            .order_by("created_at", "pk")[:limit]
+        )
+        if not payments:
+            return []
+
+        Payment.objects.filter(pk__in=[payment.pk for payment in payments]).update(
+            verification_attempts=F("verification_attempts") + 1,
+            next_verification_at=now + timedelta(seconds=CLAIM_LEASE),
+        )
+
+    for payment in payments:
+        payment.verification_attempts += 1
+    return payments
+
+
+def check_payments(
+    payments: List[Payment],
+    client: BaseExplorerClient,
+    concurrency: int,
+) -> List[Tuple[Payment, TransferCheck]]:
+    """
+    Look up a batch of payments on chain in parallel.
+
+    Explorer errors are treated as "check again later" so one flaky
+    lookup doesn't fail the batch. Malformed hashes from before submissions
+    were validated fail without a lookup.
+
+    Args:
+        payments (List[Payment]): The claimed payments
+        client (BaseExplorerClient): The explorer to query
+        concurrency (int): Maximum number of lookups in flight
+
+    Returns:
+        List[Tuple[Payment, TransferCheck]]: Each payment with its outcome
+    """
+
+    def check(payment: Payment) -> TransferCheck:
+        try:
+            transaction_hash = normalize_transaction_hash(payment.transaction_id)
+        except ValueError as e:
+            return TransferCheck(FAILED, reason=str(e))
+        try:
+            return client.check_transfer(transaction_hash, payment.amount, payment.sender_address)
+        except ExplorerError as e:
+            logger.warning(f"Explorer lookup failed: payment={payment.pk}, error={str(e)}")
+            return TransferCheck(PENDING, reason=str(e))
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        return list(zip(payments, executor.map(check, payments)))
+
+
+def credit_payments(payments: List[Payment]) -> None:
+    """
+    Credit confirmed payments to the users' funding wallets.
+
+    One UPDATE credits every user, one INSERT records the DEPOSIT
+    transactions and one INSERT notifies each user once. Must be called
+    inside a transaction.
+
+    Args:
+        payments (List[Payment]): The confirmed payments
+    """
+    if not payments:
+        return
+
+    now = timezone.now()
+    totals: Dict[int, Decimal] = defaultdict(lambda: Decimal("0.00"))
+    for payment in payments:
+        totals[payment.user_id] += payment.amount
+
+    credit = Case(
+        *[When(pk=user_id, then=Value(amount)) for user_id, amount in totals.items()],
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+    User.objects.filter(pk__in=totals).update(funding_wallet=F("funding_wallet") + credit)
+
+    Transaction.objects.bulk_create(
+        [
+            Transaction(
+                user_id=payment.user_id,
+                transaction_type="DEPOSIT",
+                amount=payment.amount,
+                status="COMPLETED",
+                transaction_id=f"PAY-{payment.pk}",
+                description=f"Deposit verified on chain: {payment.transaction_id}",
+                completed_at=now,
+            )
+            for payment in payments
+        ]
+    )
+
+    create_notifications(
+        [
+            Notification(
+                user_id=user_id,
+                title="Deposit confirmed",
+                message=f"${amount} has been added to your funding wallet.",
+                notification_type="success",
+            )
+            for user_id, amount in totals.items()
+        ]
+    )
+
+    # bulk_create does not send post_save
+    total_amount = sum(totals.values(), Decimal("0.00"))
+    record_transaction(timezone.localdate(now), "DEPOSIT", "COMPLETED", len(payments), total_amount)
+    for user_id in totals:
+        mark_user_active(user_id, timezone.localdate(now))
+    record_completed_deposits(len(payments), total_amount)
+
+
+def apply_results(
+    results: Iterable[Tuple[Payment, TransferCheck]], max_attempts: Optional[int] = None
+) -> Dict[str, int]:
+    """
+    Save the outcome of a batch of checks.
+
+    Args:
+        results (Iterable[Tuple[Payment, TransferCheck]]): Payments with their outcomes
+        max_attempts (Optional[int]): Checks allowed before an unconfirmed payment fails
+
+    Returns:
+        Dict[str, int]: Number of payments 'confirmed', 'failed' and 'retried'
+    """
+    max_attempts = max_attempts or settings.PAYMENT_VERIFIER_MAX_ATTEMPTS
+    results = list(results)
+    now = timezone.now()
+    counts = {"confirmed": 0, "failed": 0, "retried": 0}
+
+    with transaction.atomic():
+        # Staff may have settled some payments by hand while they were checked
+        still_pending = set(
+            Payment.objects.select_for_update()
+            .filter(pk__in=[payment.pk for payment, _ in results], status="pending")
+            .values_list("pk", flat=True)
+        )
+
+        confirmed, failed = [], []
+        updated = []
+        for payment, check in results:
+            if payment.pk not in still_pending:
+                continue
+
+            payment.updated_at = now
+            if check.status == CONFIRMED:
+                payment.status = "completed"
+                payment.verified_at = now
+                payment.next_verification_at = None
+                confirmed.append(payment)
+            elif check.status == FAILED or payment.verification_attempts >= max_attempts:
+                payment.status = "failed"
+                payment.next_verification_at = None
+                payment.notes = check.reason or "Payment could not be confirmed on chain"
+                failed.append(payment)
+            else:
+                payment.next_verification_at = now + backoff_delay(payment.verification_attempts)
+                payment.notes = check.reason
+                counts["retried"] += 1
+            updated.append(payment)
+
+        Payment.objects.bulk_update(
+            updated, ["status", "notes", "verified_at", "next_verification_at", "updated_at"]
+        )
+        credit_payments(confirmed)
+        create_notifications(
+            [
+                Notification(
+                    user_id=payment.user_id,
+                    title="Deposit failed",
+                    message=(
+                        f"We could not verify your payment of ${payment.amount}: {payment.notes}"
+                    ),
+                    notification_type="error",
+                )
+                for payment in failed
+            ]
+        )
+
+    counts["confirmed"] = len(confirmed)
+    counts["failed"] = len(failed)
+    return counts
+
+
+def verify_pending_payments(
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    max_batches: int = 0,
+    client: Optional[BaseExplorerClient] = None,
+) -> Dict[str, int]:
+    """
+    Verify pending payments until none are due.
+
+    Args:
+        batch_size (Optional[int]): Payments claimed per batch
+        concurrency (Optional[int]): Explorer lookups in flight per batch
+        max_batches (int): Stop after this many batches; 0 runs until no payments are due
+        client (Optional[BaseExplorerClient]): The explorer to query; the configured
+            client if omitted
+
+    Returns:
+        Dict[str, int]: Totals of 'confirmed', 'failed' and 'retried' payments and 'batches' run
+    """
+    batch_size = batch_size or settings.PAYMENT_VERIFIER_BATCH_SIZE
+    concurrency = concurrency or settings.PAYMENT_VERIFIER_CONCURRENCY
+    client = client or get_explorer_client()
+    totals = {"confirmed": 0, "failed": 0, "retried": 0, "batches": 0}
+
+    while not max_batches or totals["batches"] < max_batches:
+        payments = claim_payments(batch_size)
+        if not payments:
+            break
+
+        counts = apply_results(check_payments(payments, client, concurrency))
+        for key, value in counts.items():
+            totals[key] += value
+        totals["batches"] += 1
+        logger.info(
+            f"Payment batch verified: confirmed={counts['confirmed']}, "
+            f"failed={counts['failed']}, retried={counts['retried']}"
+        )
+
+    return totals
+
+
+def verify_webhook_signature(body: bytes, timestamp: str, signature: str) -> bool:
+    """
+    Check a webhook delivery's HMAC-SHA256 signature.
+
+    The provider signs ``"{timestamp}.{body}"`` with PAYMENT_WEBHOOK_SECRET.
+    Deliveries older than PAYMENT_WEBHOOK_TOLERANCE seconds are rejected so
+    a captured request can't be replayed.
+
+    Args:
+        body (bytes): The raw request body
+        timestamp (str): The X-Signature-Timestamp header (Unix seconds)
+        signature (str): The X-Signature header (hex digest)
+
+    Returns:
+        bool: Whether the delivery is authentic and recent
+    """
+    secret = settings.PAYMENT_WEBHOOK_SECRET
+    if not secret or not timestamp or not signature:
+        return False
+
+    try:
+        age = abs(time.time() - int(timestamp))
+    except ValueError:
+        return False
+    if age > settings.PAYMENT_WEBHOOK_TOLERANCE:
+        return False
+
+    expected = hmac.new(
+        secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256
+    ).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def record_payment_events(events: List[Dict[str, Any]]) -> int:
+    """
+    Append webhook events to the inbox with a single INSERT.
+
+    Redelivered events are silently dropped by the unique constraint.
+
+    Args:
+        events (List[Dict[str, Any]]): Events with 'transaction_id', 'token_id',
+            'amount' and 'status'
+
+    Returns:
+        int: The number of events in the delivery
+
+    Raises:
+        ValueError: If an event is missing fields or has an invalid hash, amount or status
+    """
+    rows = []
+    for event in events:
+        try:
+            transaction_id = normalize_transaction_hash(event["transaction_id"])
+            token_id = str(event["token_id"]).strip()
+            amount = Decimal(str(event["amount"]))
+            status = event["status"]
+        except (KeyError, TypeError, ArithmeticError):
+            raise ValueError("Each event needs transaction_id, token_id, amount and status")
+        except ValueError as e:
+            raise ValueError(f"Invalid event: {e}")
+        if not token_id or status not in (CONFIRMED, FAILED):
+            raise ValueError(f"Invalid event for transaction {transaction_id}")
+
+        rows.append(
+            PaymentEvent(
+                transaction_id=transaction_id,
+                token_id=token_id,
+                amount=amount,
+                status=status,
+                payload=event,
+            )
+        )
+
+    PaymentEvent.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def process_payment_events(
+    batch_size: int = EVENT_BATCH_SIZE, max_batches: int = 0
+) -> Dict[str, int]:
+    """
+    Settle pending payments from the webhook inbox.
+
+    Each batch of unprocessed events is claimed with SKIP LOCKED, matched
+    to pending payments by transaction and token ID and applied through the
+    same bulk crediting as on-chain verification. Events without a pending
+    payment are marked processed too; the verifier still checks any payment
+    submitted later.
+
+    Args:
+        batch_size (int): Events settled per transaction
+        max_batches (int): Stop after this many batches; 0 runs until the inbox is empty
+
+    Returns:
+        Dict[str, int]: Totals of 'events', 'confirmed', 'failed' and 'batches'
+    """
+    totals = {"events": 0, "confirmed": 0, "failed": 0, "batches": 0}
+
+    while not max_batches or totals["batches"] < max_batches:
+        with transaction.atomic():
+            events = list(
+                PaymentEvent.objects.filter(processed_at__isnull=True)
+                .select_for_update(skip_locked=True)
+                .order_by("id")[:batch_size]
+            )
+            if not events:
+                break
+
+            payments = {
+                (payment.transaction_id, payment.token_id): payment
+                for payment in Payment.objects.filter(
+                    transaction_id__in=[event.transaction_id for event in events], status="pending"
+                )
+            }
+
+            results = []
+            for event in events:
+                payment = payments.get((event.transaction_id, event.token_id))
+                if payment is None:
+                    continue
+                if event.status == CONFIRMED and event.amount >= payment.amount:
+                    results.append((payment, TransferCheck(CONFIRMED, amount=event.amount)))
+                elif event.status == CONFIRMED:
+                    results.append(
+                        (
+                            payment,
+                            TransferCheck(
+                                FAILED,
+                                amount=event.amount,
+                                reason=(
+                                    f"Transfer of {event.amount} is less than "
+                                    f"the submitted {payment.amount}"
+                                ),
+                            ),
+                        )
+                    )
+                else:
+                    results.append(
+                        (
+                            payment,
+                            TransferCheck(
+                                FAILED,
+                                reason=event.payload.get("reason")
+                                or "Payment failed at the provider",
+                            ),
+                        )
+                    )
+
+            counts = apply_results(results)
+            PaymentEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                processed_at=timezone.now()
+            )
+
+        totals["events"] += len(events)
+        totals["confirmed"] += counts["confirmed"]
+        totals["failed"] += counts["failed"]
+        totals["batches"] += 1
+        logger.info(
+            f"Payment events processed: events={len(events)}, "
+            f"confirmed={counts['confirmed']}, failed={counts['failed']}"
+        )
+
+    return totals
@@ -1,5 +1,7 @@
 from django import template
 
+from core.counts import format_count
+
 register = template.Library()
 
 @register.filter
@@ -8,4 +10,12 @@ def split(value, arg):
     Split a string into a list using the provided delimiter
     Usage: {{ "a,b,c"|split:"," }}
     """
-    return value.split(arg) 
\ No newline at end of file
+    return value.split(arg)
+
+@register.filter
+def approx_count(value):
+    """
+    Render a row count, abbreviating planner estimates as "~1.2M"
+    Usage: {{ total_users|approx_count }}
+    """
+    return format_count(value)
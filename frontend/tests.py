@@ -1,3 +1,572 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from decimal import Decimal
+import csv
+import hashlib
+import hmac
+import io
+import json
+import time
 
-# Create your tests here.
+from django.core.management import call_command
+from django.utils import timezone
+
+from transactions.models import Transaction, Withdrawal
+from users.models import Notification
+from .explorers import (
+    CONFIRMED, FAILED, TRANSFER_TOPIC, EtherscanExplorerClient, ExplorerError, StubExplorerClient, TransferCheck,
+)
+from .models import Payment, PaymentEvent
+from .payments import verify_pending_payments
+
+User = get_user_model()
+
+
+def tx_hash(label):
+    return '0x' + hashlib.sha256(label.encode()).hexdigest()
+
+
+class AdminExportTests(TestCase):
+    """
+    Test suite for the streaming admin exports
+    """
+
+    def setUp(self):
+        """
+        Set up a staff user and some transactions to export
+        """
+        self.admin_user = User.objects.create_user(
+            username="exportadmin",
+            email="exportadmin@example.com",
+            password="adminpassword123",
+            is_staff=True
+        )
+        self.user = User.objects.create_user(
+            username="alice",
+            email="alice@example.com",
+            password="testpassword123"
+        )
+        for i, (user, transaction_type) in enumerate([
+            (self.user, 'DEPOSIT'),
+            (self.user, 'WITHDRAWAL'),
+            (self.admin_user, 'DEPOSIT'),
+        ]):
+            Transaction.objects.create(
+                user=user,
+                transaction_type=transaction_type,
+                amount=Decimal("10.00") * (i + 1),
+                status='COMPLETED',
+                transaction_id=f"EXP-{i}",
+                description="Export test"
+            )
+        self.client.force_login(self.admin_user)
+
+    def test_export_requires_staff(self):
+        """
+        Test that non-staff users cannot export data
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('admin:export_users'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_export_deposits_csv_applies_filters(self):
+        """
+        Test that the deposit export streams CSV honouring the search filter
+        """
+        response = self.client.get(reverse('admin:export_deposits'), {'search': 'alice'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0][:3], ['id', 'transaction_id', 'username'])
+        self.assertEqual([row[1] for row in rows[1:]], ['EXP-0'])
+
+    def test_csv_cells_are_not_evaluated_as_formulas(self):
+        """
+        Test that text starting with a formula character is escaped in CSV exports
+        """
+        from .exports import stream_csv
+
+        rows = [('=HYPERLINK("http://x")', '+1', '-2', '@SUM(A1)', 'plain', Decimal('-5.00'))]
+        output = ''.join(stream_csv(rows, ['a', 'b', 'c', 'd', 'e', 'f']))
+
+        self.assertEqual(
+            list(csv.reader(io.StringIO(output)))[1],
+            ['\'=HYPERLINK("http://x")', "'+1", "'-2", "'@SUM(A1)", 'plain', '-5.00'],
+        )
+
+    def test_export_users_ndjson(self):
+        """
+        Test that the user export can be streamed as NDJSON
+        """
+        response = self.client.get(reverse('admin:export_users'), {'format': 'ndjson', 'sort': 'username'})
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        usernames = [json.loads(line)['username'] for line in lines]
+        self.assertEqual(usernames, ['alice', 'exportadmin'])
+
+
+class AdminListQueryCountTests(TestCase):
+    """
+    Test suite for the number of queries behind the admin list pages
+    """
+
+    def setUp(self):
+        """
+        Set up a staff user and a plan for the listed users to subscribe to
+        """
+        from plans.models import Plan
+
+        self.admin_user = User.objects.create_user(
+            username="listadmin",
+            email="listadmin@example.com",
+            password="adminpassword123",
+            is_staff=True
+        )
+        self.plan = Plan.objects.create(
+            name="Gold", description="Gold plan", price=Decimal("100.00"), duration_days=30
+        )
+        self.rows = 0
+        self.client.force_login(self.admin_user)
+
+    def _add_rows(self, count):
+        """Add users, each with a subscription, a deposit and a withdrawal."""
+        from plans.models import Subscription as PlanSubscription
+        from subscriptions.models import Wallet
+
+        for _ in range(count):
+            self.rows += 1
+            user = User.objects.create_user(
+                username=f"lister{self.rows}",
+                email=f"lister{self.rows}@example.com",
+                password="testpassword123"
+            )
+            PlanSubscription.objects.create(
+                user=user, plan=self.plan, status='active',
+                start_date=timezone.now(), end_date=timezone.now() + timezone.timedelta(days=30)
+            )
+            Transaction.objects.create(
+                user=user,
+                transaction_type='DEPOSIT',
+                amount=Decimal("25.00"),
+                status='COMPLETED',
+                transaction_id=f"LIST-{self.rows}",
+                description="List test"
+            )
+            wallet = Wallet.objects.create(user=user, wallet_type='FUNDING', balance=Decimal("50.00"))
+            withdrawal_transaction = Transaction.objects.create(
+                user=user,
+                transaction_type='WITHDRAWAL',
+                amount=Decimal("30.00"),
+                status='PENDING',
+                transaction_id=f"LISTW-{self.rows}",
+                description="List test"
+            )
+            Withdrawal.objects.create(
+                user=user, amount=Decimal("30.00"), withdrawal_type='WALLET',
+                transaction=withdrawal_transaction, wallet=wallet
+            )
+
+    def _count_queries(self, url):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        # Warm the caches the page reads first
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_admin_pages_run_a_constant_number_of_queries(self):
+        """
+        Test that a page of ten rows costs as many queries as a page of one
+        """
+        urls = [
+            reverse('admin:dashboard'),
+            reverse('admin:manage_users'),
+            reverse('admin:manage_withdrawals'),
+            reverse('admin:manage_deposits'),
+        ]
+        self._add_rows(1)
+        single = {url: self._count_queries(url)[0] for url in urls}
+
+        self._add_rows(9)
+        for url in urls:
+            queries, response = self._count_queries(url)
+            self.assertEqual(queries, single[url], url)
+            self.assertContains(response, 'lister10')
+
+        response = self._count_queries(reverse('admin:manage_users'))[1]
+        self.assertContains(response, 'Gold')
+
+
+class BalanceAdjustmentTests(TestCase):
+    """
+    Test suite for the bulk balance adjustment upload
+    """
+
+    def setUp(self):
+        """
+        Set up a staff user and two users with funded wallets
+        """
+        self.admin_user = User.objects.create_user(
+            username="adjustadmin",
+            email="adjustadmin@example.com",
+            password="adminpassword123",
+            is_staff=True
+        )
+        self.alice = User.objects.create_user(
+            username="alice",
+            email="alice@example.com",
+            password="testpassword123",
+            funding_wallet=Decimal("100.00")
+        )
+        self.bob = User.objects.create_user(
+            username="bob",
+            email="bob@example.com",
+            password="testpassword123",
+            starter_wallet=Decimal("20.00")
+        )
+        self.client.force_login(self.admin_user)
+
+    def _upload(self, content):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        upload = SimpleUploadedFile('adjustments.csv', content.encode(), content_type='text/csv')
+        return self.client.post(reverse('admin:bulk_adjust_balances'), {'file': upload})
+
+    def test_upload_applies_rows_and_reports_each_one(self):
+        """
+        Test that valid rows are applied and invalid ones are reported without stopping the upload
+        """
+        response = self._upload(
+            "user,wallet,amount,reason\n"
+            "alice,funding,25.50,Bonus\n"
+            f"id:{self.bob.pk},starter_wallet,-15,Correction\n"
+            "bob,starter,-10,Overdraw\n"
+            "carol,funding,5,Missing user\n"
+            "alice,savings,5,Bad wallet\n"
+            "alice,funding,1e30,Too large\n"
+            "alice,funding,99999900.00,Over the column limit\n"
+            f"{self.alice.pk},funding,5,Digits are a username\n"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(
+            [(row['line'], row['status']) for row in rows],
+            [('2', 'applied'), ('3', 'applied'), ('4', 'rejected'), ('5', 'rejected'), ('6', 'rejected'),
+             ('7', 'rejected'), ('8', 'rejected'), ('9', 'rejected')],
+        )
+        self.assertEqual(rows[2]['message'], 'Insufficient balance (5.00)')
+        self.assertEqual(rows[3]['message'], 'User not found')
+        self.assertEqual(rows[5]['message'], 'Amount must be non-zero and below 100,000,000')
+        self.assertEqual(rows[6]['message'], 'Balance would exceed 100,000,000')
+        self.assertEqual(rows[7]['message'], 'User not found')
+
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual(self.alice.funding_wallet, Decimal("125.50"))
+        self.assertEqual(self.bob.starter_wallet, Decimal("5.00"))
+        adjustment = Transaction.objects.get(transaction_id=rows[0]['transaction_id'])
+        self.assertEqual(adjustment.transaction_type, 'ADJUSTMENT')
+        self.assertEqual(adjustment.amount, Decimal("25.50"))
+
+    def test_upload_rejects_missing_columns(self):
+        """
+        Test that a CSV without the required columns is refused before anything is applied
+        """
+        response = self._upload("user,amount\nalice,10\n")
+
+        self.assertRedirects(response, reverse('admin:bulk_adjust_balances'))
+        self.assertFalse(Transaction.objects.filter(transaction_type='ADJUSTMENT').exists())
+
+    def test_chunk_runs_a_constant_number_of_queries(self):
+        """
+        Test that applying a chunk costs the same number of queries for one row or many
+        """
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from .balance_adjustments import apply_adjustment_chunk
+
+        def apply(count):
+            rows = [
+                {'line': i, 'user': 'alice', 'wallet': 'funding', 'amount': '1.00', 'reason': 'Test'}
+                for i in range(count)
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                results = apply_adjustment_chunk(rows, self.admin_user)
+            self.assertTrue(all(result['status'] == 'applied' for result in results))
+            return len(queries)
+
+        apply(1)
+        self.assertEqual(apply(10), apply(1))
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.funding_wallet, Decimal("112.00"))
+
+    def test_user_balance_adjusts_a_wallet(self):
+        """
+        Test that the single-user balance page debits the chosen wallet
+        """
+        response = self.client.post(
+            reverse('admin:user_balance', args=[self.alice.pk]),
+            {'action': 'remove', 'wallet': 'funding_wallet', 'amount': '40', 'reason': 'Refund'},
+        )
+
+        self.assertRedirects(response, reverse('admin:user_balance', args=[self.alice.pk]))
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.funding_wallet, Decimal("60.00"))
+        self.assertTrue(Transaction.objects.filter(user=self.alice, transaction_type='ADJUSTMENT').exists())
+
+        response = self.client.get(reverse('admin:user_balance', args=[self.alice.pk]))
+        self.assertContains(response, 'data-balance="60.00"')
+        self.assertContains(self.client.get(reverse('admin:bulk_adjust_balances')), 'user, wallet, amount, reason')
+
+
+@override_settings(PAYMENT_EXPLORER_CLIENT='frontend.explorers.StubExplorerClient', PAYMENT_VERIFIER_MAX_ATTEMPTS=3)
+class PaymentVerificationTests(TestCase):
+    """
+    Test suite for the background payment verifier
+    """
+
+    def setUp(self):
+        """
+        Set up test data
+        """
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass12345')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass12345')
+        StubExplorerClient.transfers = {}
+        self.addCleanup(setattr, StubExplorerClient, 'transfers', {})
+
+    def create_payment(self, user, amount, transaction_hash):
+        return Payment.objects.create(
+            user=user, amount=Decimal(amount), transaction_id=transaction_hash, token_id='USDT'
+        )
+
+    def test_confirmed_payments_are_credited_in_bulk(self):
+        """
+        Test that confirmed payments credit the funding wallet once per user
+        """
+        self.create_payment(self.alice, '50.00', tx_hash('a1'))
+        self.create_payment(self.alice, '25.00', tx_hash('a2'))
+        self.create_payment(self.bob, '10.00', tx_hash('b1'))
+        StubExplorerClient.transfers = {
+            tx_hash('a1'): TransferCheck(CONFIRMED),
+            tx_hash('a2'): TransferCheck(CONFIRMED),
+            tx_hash('b1'): TransferCheck(FAILED, reason='No token transfer to the receiving address'),
+        }
+
+        totals = verify_pending_payments(batch_size=2, concurrency=2)
+
+        self.assertEqual((totals['confirmed'], totals['failed'], totals['batches']), (2, 1, 2))
+        self.alice.refresh_from_db()
+        self.bob.refresh_from_db()
+        self.assertEqual(self.alice.funding_wallet, Decimal('75.00'))
+        self.assertEqual(self.bob.funding_wallet, Decimal('0.00'))
+        self.assertEqual(
+            Transaction.objects.filter(user=self.alice, transaction_type='DEPOSIT', status='COMPLETED').count(), 2
+        )
+        self.assertEqual(Notification.objects.filter(user=self.alice, notification_type='success').count(), 1)
+        self.assertEqual(Payment.objects.get(transaction_id=tx_hash('b1')).status, 'failed')
+
+        # Settled payments are not checked or credited again
+        self.assertEqual(verify_pending_payments()['batches'], 0)
+
+    def test_unconfirmed_payments_back_off_then_fail(self):
+        """
+        Test that unconfirmed payments are rescheduled and eventually failed
+        """
+        payment = self.create_payment(self.alice, '40.00', tx_hash('slow'))
+        StubExplorerClient.transfers = {tx_hash('slow'): ExplorerError('rate limited')}
+
+        totals = verify_pending_payments()
+        payment.refresh_from_db()
+        self.assertEqual(totals['retried'], 1)
+        self.assertEqual(payment.status, 'pending')
+        self.assertGreater(payment.next_verification_at, timezone.now())
+
+        # Not due yet, so nothing is claimed
+        self.assertEqual(verify_pending_payments()['batches'], 0)
+
+        for _ in range(2):
+            Payment.objects.filter(pk=payment.pk).update(next_verification_at=timezone.now())
+            call_command('verify_payments', stdout=io.StringIO())
+
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'failed')
+        self.assertEqual(payment.verification_attempts, 3)
+        self.alice.refresh_from_db()
+        self.assertEqual(self.alice.funding_wallet, Decimal('0.00'))
+
+
+class PaymentSubmissionTests(TestCase):
+    """
+    Test suite for validating submitted payments
+    """
+
+    def setUp(self):
+        """
+        Set up test data
+        """
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pass12345')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pass12345')
+
+    def submit(self, user, transaction_id, sender_address):
+        self.client.force_login(user)
+        return self.client.post(reverse('frontend:submit_payment'), json.dumps({
+            'amount_paid': '25.00', 'transaction_id': transaction_id,
+            'sender_address': sender_address, 'token_id': 'USDT',
+        }), content_type='application/json')
+
+    def test_hashes_and_senders_are_normalized_and_checked(self):
+        """
+        Test that hashes are stored in one form and wallets are tied to one user
+        """
+        transaction_hash = tx_hash('paid')
+        sender = '0x' + 'Ab' * 20
+
+        response = self.submit(self.alice, f'  {transaction_hash.upper().replace("0X", "0x")} ', sender)
+        self.assertEqual(response.status_code, 200)
+        payment = Payment.objects.get(user=self.alice)
+        self.assertEqual((payment.transaction_id, payment.sender_address), (transaction_hash, sender.lower()))
+
+        # The same hash in another case is a duplicate
+        response = self.submit(self.alice, transaction_hash.replace('0x', '0X'), sender)
+        self.assertEqual(response.json()['message'], 'Transaction ID already exists.')
+
+        response = self.submit(self.alice, 'not-a-hash', sender)
+        self.assertEqual(response.status_code, 400)
+        response = self.submit(self.alice, tx_hash('short')[:40], sender)
+        self.assertEqual(response.status_code, 400)
+
+        # Another user can't pay from alice's wallet
+        response = self.submit(self.bob, tx_hash('other'), sender)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['message'], 'This wallet address is linked to another account.')
+        self.assertFalse(Payment.objects.filter(user=self.bob).exists())
+
+    @override_settings(
+        PAYMENT_RECEIVING_ADDRESS='0x' + '1' * 40, PAYMENT_TOKEN_CONTRACT='0x' + '2' * 40,
+        PAYMENT_TOKEN_DECIMALS=6, PAYMENT_REQUIRED_CONFIRMATIONS=1,
+    )
+    def test_only_transfers_from_the_sender_are_credited(self):
+        """
+        Test that the explorer ignores transfers sent from another wallet
+        """
+        sender, other = '0x' + '3' * 40, '0x' + '4' * 40
+        receipt = {'status': '0x1', 'blockNumber': '0x10', 'logs': [{
+            'address': '0x' + '2' * 40,
+            'topics': [TRANSFER_TOPIC, '0x' + '0' * 24 + sender[2:], '0x' + '0' * 24 + '1' * 40],
+            'data': hex(25 * 10 ** 6),
+        }]}
+
+        class Response:
+            def __init__(self, result):
+                self.result = result
+
+            def raise_for_status(self):
+                pass
+
+            def json(self):
+                return {'result': self.result}
+
+        class Session:
+            def get(self, url, params, timeout):
+                return Response(receipt if params['action'] == 'eth_getTransactionReceipt' else '0x20')
+
+        client = EtherscanExplorerClient(api_url='https://explorer.invalid/api', api_key='')
+        client.session = Session()
+
+        self.assertEqual(client.check_transfer(tx_hash('paid'), Decimal('25.00'), sender).status, CONFIRMED)
+        self.assertEqual(client.check_transfer(tx_hash('paid'), Decimal('25.00'), other).status, FAILED)
+
+
+    @override_settings(PAYMENT_RECEIVING_ADDRESS='0xF6823b403aC8d2A682CdF8b47299A85AaD8265ADC')
+    def test_malformed_receiving_address_is_refused(self):
+        """
+        Test that the explorer refuses a receiving address no transfer could match
+        """
+        from django.core.exceptions import ImproperlyConfigured
+
+        with self.assertRaises(ImproperlyConfigured):
+            EtherscanExplorerClient(api_url='https://explorer.invalid/api', api_key='')
+
+    @override_settings(PAYMENT_RECEIVING_ADDRESS='0x' + 'ab' * 20)
+    def test_fund_page_shows_the_configured_address(self):
+        """
+        Test that users are told to pay the address the verifier checks
+        """
+        self.client.force_login(self.alice)
+
+        response = self.client.get(reverse('frontend:fund_account'))
+
+        self.assertContains(response, '0x' + 'ab' * 20)
+
+
+@override_settings(PAYMENT_WEBHOOK_SECRET='webhook-secret')
+class PaymentWebhookTests(TestCase):
+    """
+    Test suite for the payment provider webhook and its inbox consumer
+    """
+
+    def setUp(self):
+        """
+        Set up test data
+        """
+        self.user = User.objects.create_user(username='payer', email='payer@example.com', password='pass12345')
+        Payment.objects.create(user=self.user, amount=Decimal('30.00'), transaction_id=tx_hash('w1'), token_id='USDT')
+        Payment.objects.create(user=self.user, amount=Decimal('20.00'), transaction_id=tx_hash('w2'), token_id='USDT')
+
+    def post_events(self, data, secret='webhook-secret'):
+        body = json.dumps(data).encode()
+        timestamp = str(int(time.time()))
+        signature = hmac.new(secret.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+        return self.client.post(
+            reverse('frontend:payment_webhook'), body, content_type='application/json',
+            HTTP_X_SIGNATURE=signature, HTTP_X_SIGNATURE_TIMESTAMP=timestamp
+        )
+
+    def test_signed_events_are_stored_once(self):
+        """
+        Test that signed deliveries are stored and redeliveries are deduplicated
+        """
+        events = {'events': [
+            {'transaction_id': tx_hash('w1'), 'token_id': 'USDT', 'amount': '30.00', 'status': 'confirmed'},
+            {'transaction_id': tx_hash('w2'), 'token_id': 'USDT', 'amount': '20.00', 'status': 'failed'},
+        ]}
+
+        self.assertEqual(self.post_events(events).status_code, 200)
+        self.assertEqual(self.post_events(events).status_code, 200)
+        self.assertEqual(PaymentEvent.objects.count(), 2)
+        # Nothing is credited in-request
+        self.assertFalse(Transaction.objects.exists())
+
+        self.assertEqual(self.post_events(events, secret='wrong').status_code, 403)
+        response = self.post_events({'transaction_id': tx_hash('w3'), 'amount': '5'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_consumer_settles_payments(self):
+        """
+        Test that the inbox consumer credits confirmed payments and fails the rest
+        """
+        self.post_events({'events': [
+            {'transaction_id': tx_hash('w1'), 'token_id': 'USDT', 'amount': '30.00', 'status': 'confirmed'},
+            {'transaction_id': tx_hash('w2'), 'token_id': 'USDT', 'amount': '20.00', 'status': 'failed'},
+            {'transaction_id': tx_hash('unknown'), 'token_id': 'USDT', 'amount': '99.00', 'status': 'confirmed'},
+        ]})
+
+        out = io.StringIO()
+        call_command('process_payment_events', stdout=out)
+
+        self.assertIn('3 events, 1 confirmed, 1 failed', out.getvalue())
+        self.assertEqual(Payment.objects.get(transaction_id=tx_hash('w1')).status, 'completed')
+        self.assertEqual(Payment.objects.get(transaction_id=tx_hash('w2')).status, 'failed')
+        self.assertFalse(PaymentEvent.objects.filter(processed_at__isnull=True).exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.funding_wallet, Decimal('30.00'))
@@ -28,6 +28,9 @@ urlpatterns = [
     path('dashboard/withdrawal/', views.withdrawal, name='withdrawal'),
     path('dashboard/profile/', views.profile, name='profile'),
     
+    # Payment provider webhooks
+    path('webhooks/payments/', views.payment_webhook, name='payment_webhook'),
+    
     # Admin URLs
     path('admin/dashboard/', admin_views.admin_dashboard, name='admin_dashboard'),
     path('admin/users/', admin_views.manage_users, name='manage_users'),
@@ -3,16 +3,21 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, get_user_model
 from django.contrib import messages
 from users.models import User, Notification
+from users.notifications import get_notification_page, get_unread_count
 from subscriptions.models import Subscription, Plan, Referral, Wallet
 from transactions.models import Transaction, Withdrawal
 from django.http import JsonResponse
 from .models import Payment
 from decimal import Decimal
+import decimal
 import json
-import uuid
 from django.core.paginator import Paginator
 from django.utils import timezone
 from django.urls import reverse
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .payments import MAX_EVENTS_PER_DELIVERY, normalize_submission, record_payment_events, verify_webhook_signature
 
 User = get_user_model()
 
@@ -66,17 +71,15 @@ def dashboard(request):
         'available_plans': Plan.objects.all(),
         'user_plan': user_plan,
         'current_plan': current_plan,
-        'unread_notifications_count': request.user.notifications.filter(read=False).count()
+        'unread_notifications_count': get_unread_count(request.user.pk)
     }
     return render(request, 'dashboard/dashboard.html', context)
 
-WALLET_ADDRESS = "0xF6823b403aC8d2A682CdF8b47299A85AaD8265ADC"
-
 @login_required
 def fund_account(request):
     if request.method == 'GET':
         context = {
-            'wallet_address': WALLET_ADDRESS
+            'wallet_address': settings.PAYMENT_RECEIVING_ADDRESS
         }
         return render(request, 'dashboard/fund_account.html', context)
     
@@ -98,11 +101,15 @@ def fund_account(request):
                     'message': 'Amount must be greater than 0.'
                 }, status=400)
 
-            # Check if transaction_id is unique
-            if Payment.objects.filter(transaction_id=transaction_id).exists():
+            # Normalize the hash and tie the sending wallet to this user
+            try:
+                transaction_id, sender_address = normalize_submission(
+                    request.user, transaction_id, request.POST.get('sender_address', '')
+                )
+            except ValueError as e:
                 return JsonResponse({
                     'status': 'error',
-                    'message': 'Transaction ID already exists.'
+                    'message': str(e)
                 }, status=400)
 
             # Create new payment record
@@ -110,6 +117,7 @@ def fund_account(request):
                 user=request.user,
                 amount=amount,
                 transaction_id=transaction_id,
+                sender_address=sender_address,
                 token_id=token_id,
                 status='pending'
             )
@@ -165,8 +173,8 @@ def referrals(request):
     """User referrals view with pagination."""
     # Get or generate referral code
     if not request.user.referral_code:
-        request.user.referral_code = str(uuid.uuid4())[:8].upper()
-        request.user.save()
+        request.user.referral_code = request.user.generate_referral_code()
+        request.user.save(update_fields=['referral_code'])
     
     # Generate referral URL
     referral_url = request.build_absolute_uri(
@@ -199,11 +207,11 @@ def referrals(request):
 @login_required
 def notifications(request):
     """User notifications view."""
-    notifications = request.user.notifications.all()
-    # Mark notifications as read
-    notifications.update(read=True)
+    # First page only; the rest is loaded from users:notification_list on scroll
+    notifications, next_before = get_notification_page(request.user.pk)
     context = {
-        'notifications': notifications
+        'notifications': notifications,
+        'next_before': next_before,
     }
     return render(request, 'dashboard/notifications.html', context)
 
@@ -379,11 +387,15 @@ def submit_payment(request):
                 'message': 'Amount must be greater than 0.'
             }, status=400)
 
-        # Check if transaction_id is unique
-        if Payment.objects.filter(transaction_id=transaction_id).exists():
+        # Normalize the hash and tie the sending wallet to this user
+        try:
+            transaction_id, sender_address = normalize_submission(
+                request.user, transaction_id, data.get('sender_address', '')
+            )
+        except ValueError as e:
             return JsonResponse({
                 'status': 'error',
-                'message': 'Transaction ID already exists.'
+                'message': str(e)
             }, status=400)
 
         # Create new payment record
@@ -391,6 +403,7 @@ def submit_payment(request):
             user=request.user,
             amount=amount,
             transaction_id=transaction_id,
+            sender_address=sender_address,
             token_id=token_id,
             status='pending'
         )
@@ -491,3 +504,44 @@ def subscribe_plan(request, plan_id):
     except Exception as e:
         messages.error(request, 'An error occurred while processing your subscription.')
         return redirect('frontend:dashboard')
+
+@csrf_exempt
+@require_POST
+def payment_webhook(request):
+    """
+    Receive signed payment confirmations from the payment provider.
+
+    Events are appended to the inbox with one INSERT and settled later by
+    process_payment_events, so bursts never touch wallet or transaction rows.
+    """
+    if not verify_webhook_signature(
+        request.body,
+        request.headers.get('X-Signature-Timestamp', ''),
+        request.headers.get('X-Signature', ''),
+    ):
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Invalid signature.'
+        }, status=403)
+
+    try:
+        data = json.loads(request.body)
+        events = data['events'] if isinstance(data, dict) and 'events' in data else [data]
+        if not isinstance(events, list) or len(events) > MAX_EVENTS_PER_DELIVERY:
+            raise ValueError(f'Send between 1 and {MAX_EVENTS_PER_DELIVERY} events per delivery.')
+        received = record_payment_events(events)
+    except json.JSONDecodeError:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Invalid JSON data.'
+        }, status=400)
+    except ValueError as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+
+    return JsonResponse({
+        'status': 'success',
+        'received': received
+    })
@@ -3,15 +3,39 @@ Caching module for the subscriptions app.
 
 This module provides functions for caching and retrieving frequently accessed data,
 such as subscription plans, queue positions, and wallet balances.
+
+Plans and queue positions are read on most pages and change rarely, so they
+are also kept in process by a ``TieredCache``. A hit is then a dictionary
+lookup instead of a Redis round trip. Invalidations reach the other worker
+processes within ``LOCAL_CACHE_SYNC_INTERVAL`` seconds. Plan keys embed the
+generation of the ``plans`` namespace, so invalidating every plan is a single
+INCR and never touches the database.
+
+Plans, queue positions and wallet balances are loaded through
+``get_or_compute``. Only one worker rebuilds an invalidated or expiring key
+while the others wait for it or keep serving the current value.
+
+Invalidations run once the writing transaction commits. A reader that loaded
+the old rows while it was open can't store them afterwards, since the
+invalidation also discards anything computed while it happened.
+
+Pages listing many users should use the batch getters, ``get_wallet_balances``
+and ``get_subscriptions_for_users``, or the request-scoped loaders built on
+them. Those read every key in one round trip and resolve the misses with a
+single ``IN`` query.
 """
 
 from django.core.cache import cache
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from typing import List, Dict, Any, Optional, Union
+from typing import Iterable, List, Dict, Any, Optional, Tuple, Union
 from decimal import Decimal
 import logging
 
+from core.loaders import BatchLoader, request_loader
+from core.tiered_cache import TieredCache, get_many_or_compute, get_or_compute, invalidate
+
 from .models import Plan, Queue, Wallet, Subscription, Referral
 
 logger = logging.getLogger(__name__)
@@ -29,6 +53,33 @@ QUEUE_CACHE_TIMEOUT = 60 * 5  # 5 minutes
 WALLET_CACHE_TIMEOUT = 60 * 5  # 5 minutes
 SUBSCRIPTION_CACHE_TIMEOUT = 60 * 15  # 15 minutes
 
+# In-process tier for plans and queue positions
+LOCAL_CACHE_SIZE = 512
+LOCAL_CACHE_TIMEOUT = 60 * 5  # 5 minutes
+LOCAL_CACHE_SYNC_INTERVAL = 1  # second
+
+# Versioned namespace shared by the plan list and the individual plans
+PLANS_NAMESPACE = 'plans'
+
+local_cache = TieredCache(
+    'subscriptions_cache', LOCAL_CACHE_SIZE, LOCAL_CACHE_TIMEOUT, LOCAL_CACHE_SYNC_INTERVAL
+)
+
+
+def _plan_dict(plan: Plan) -> Dict[str, Any]:
+    """Convert a plan to a dictionary for serialization."""
+    return {
+        'id': plan.id,
+        'name': plan.name,
+        'plan_type': plan.plan_type,
+        'contribution_amount': float(plan.contribution_amount),
+        'max_members': plan.max_members,
+        'deduction_repurchase': float(plan.deduction_repurchase),
+        'deduction_maintenance': float(plan.deduction_maintenance),
+        'withdrawable_amount': float(plan.withdrawable_amount),
+        'next_plan_id': plan.next_plan_id,
+    }
+
 
 def get_all_plans() -> List[Dict[str, Any]]:
     """
@@ -37,34 +88,12 @@ def get_all_plans() -> List[Dict[str, Any]]:
     Returns:
         List[Dict[str, Any]]: List of plans as dictionaries
     """
-    # Try to get plans from cache
-    plans = cache.get(PLANS_CACHE_KEY)
-    
-    if plans is None:
+    def load():
         logger.debug("Plans cache miss, fetching from database")
-        # Cache miss, get from database
-        plans_queryset = Plan.objects.all().order_by('price')
-        
-        # Convert to list of dictionaries for serialization
-        plans = [
-            {
-                'id': plan.id,
-                'name': plan.name,
-                'price': float(plan.price),
-                'queue_size': plan.queue_size,
-                'repurchase_percentage': float(plan.repurchase_percentage),
-                'maintenance_percentage': float(plan.maintenance_percentage),
-                'created_at': plan.created_at.isoformat() if plan.created_at else None,
-            }
-            for plan in plans_queryset
-        ]
-        
-        # Cache the plans
-        cache.set(PLANS_CACHE_KEY, plans, PLANS_CACHE_TIMEOUT)
-    else:
-        logger.debug("Plans cache hit")
+        return [_plan_dict(plan) for plan in Plan.objects.all().order_by('contribution_amount')]
     
-    return plans
+    cache_key = local_cache.versioned_key(PLANS_NAMESPACE, PLANS_CACHE_KEY)
+    return local_cache.get_or_set(cache_key, load, PLANS_CACHE_TIMEOUT)
 
 
 def get_plan(plan_id: int) -> Optional[Dict[str, Any]]:
@@ -77,37 +106,16 @@ def get_plan(plan_id: int) -> Optional[Dict[str, Any]]:
     Returns:
         Optional[Dict[str, Any]]: The plan as a dictionary, or None if not found
     """
-    cache_key = PLAN_CACHE_KEY_TEMPLATE.format(plan_id)
-    
-    # Try to get plan from cache
-    plan = cache.get(cache_key)
-    
-    if plan is None:
+    def load():
         logger.debug(f"Plan {plan_id} cache miss, fetching from database")
-        # Cache miss, get from database
         try:
-            plan_obj = Plan.objects.get(id=plan_id)
-            
-            # Convert to dictionary for serialization
-            plan = {
-                'id': plan_obj.id,
-                'name': plan_obj.name,
-                'price': float(plan_obj.price),
-                'queue_size': plan_obj.queue_size,
-                'repurchase_percentage': float(plan_obj.repurchase_percentage),
-                'maintenance_percentage': float(plan_obj.maintenance_percentage),
-                'created_at': plan_obj.created_at.isoformat() if plan_obj.created_at else None,
-            }
-            
-            # Cache the plan
-            cache.set(cache_key, plan, PLANS_CACHE_TIMEOUT)
+            return _plan_dict(Plan.objects.get(id=plan_id))
         except Plan.DoesNotExist:
             logger.warning(f"Plan with ID {plan_id} not found")
             return None
-    else:
-        logger.debug(f"Plan {plan_id} cache hit")
     
-    return plan
+    cache_key = local_cache.versioned_key(PLANS_NAMESPACE, PLAN_CACHE_KEY_TEMPLATE.format(plan_id))
+    return local_cache.get_or_set(cache_key, load, PLANS_CACHE_TIMEOUT)
 
 
 def get_queue_positions(plan_id: int) -> List[Dict[str, Any]]:
@@ -120,18 +128,12 @@ def get_queue_positions(plan_id: int) -> List[Dict[str, Any]]:
     Returns:
         List[Dict[str, Any]]: List of queue positions as dictionaries
     """
-    cache_key = QUEUE_POSITIONS_CACHE_KEY_TEMPLATE.format(plan_id)
-    
-    # Try to get queue positions from cache
-    positions = cache.get(cache_key)
-    
-    if positions is None:
+    def load():
         logger.debug(f"Queue positions for plan {plan_id} cache miss, fetching from database")
-        # Cache miss, get from database
         queue_queryset = Queue.objects.filter(plan_id=plan_id).order_by('position')
         
         # Convert to list of dictionaries for serialization
-        positions = [
+        return [
             {
                 'id': queue.id,
                 'position': queue.position,
@@ -142,13 +144,32 @@ def get_queue_positions(plan_id: int) -> List[Dict[str, Any]]:
             }
             for queue in queue_queryset
         ]
-        
-        # Cache the queue positions
-        cache.set(cache_key, positions, QUEUE_CACHE_TIMEOUT)
-    else:
-        logger.debug(f"Queue positions for plan {plan_id} cache hit")
     
-    return positions
+    cache_key = QUEUE_POSITIONS_CACHE_KEY_TEMPLATE.format(plan_id)
+    return local_cache.get_or_set(cache_key, load, QUEUE_CACHE_TIMEOUT)
+
+
+# A wallet is identified by (user_id, wallet_type, plan_id)
+WalletKey = Tuple[int, str, Optional[int]]
+
+
+def _wallet_cache_key(user_id: int, wallet_type: str, plan_id: Optional[int] = None) -> str:
+    # Only PLAN wallets are told apart by plan
+    plan_id = plan_id if wallet_type == 'PLAN' else None
+    return WALLET_BALANCE_CACHE_KEY_TEMPLATE.format(user_id, f"{wallet_type}_{plan_id}" if plan_id else wallet_type)
+
+
+def _subscription_dict(sub: Subscription) -> Dict[str, Any]:
+    """Convert a subscription to a dictionary for serialization."""
+    return {
+        'id': sub.id,
+        'plan_id': sub.plan_id,
+        'plan_name': sub.plan.name if sub.plan else None,
+        'status': sub.status,
+        'queue_position': sub.queue_position,
+        'joined_at': sub.joined_at.isoformat() if sub.joined_at else None,
+        'completed_at': sub.completed_at.isoformat() if sub.completed_at else None,
+    }
 
 
 def get_wallet_balance(user_id: int, wallet_type: str, plan_id: Optional[int] = None) -> Optional[Decimal]:
@@ -161,38 +182,71 @@ def get_wallet_balance(user_id: int, wallet_type: str, plan_id: Optional[int] =
         plan_id (Optional[int]): The ID of the plan (required for PLAN wallet type)
         
     Returns:
-        Optional[Decimal]: The wallet balance, or None if not found
+        Optional[Decimal]: The wallet balance, or 0.00 if not found
     """
-    cache_key = WALLET_BALANCE_CACHE_KEY_TEMPLATE.format(user_id, f"{wallet_type}_{plan_id}" if plan_id else wallet_type)
+    def load():
+        logger.debug(f"Wallet balance for user {user_id}, type {wallet_type}, plan {plan_id} cache miss, fetching from database")
+        wallet_queryset = Wallet.objects.filter(user_id=user_id, wallet_type=wallet_type)
+        
+        if plan_id and wallet_type == 'PLAN':
+            wallet_queryset = wallet_queryset.filter(plan_id=plan_id)
+        
+        wallet = wallet_queryset.first()
+        if wallet is None:
+            logger.warning(f"Wallet not found for user {user_id}, type {wallet_type}, plan {plan_id}")
+            return None
+        return wallet.balance
     
-    # Try to get wallet balance from cache
-    balance = cache.get(cache_key)
+    try:
+        balance = get_or_compute(cache, _wallet_cache_key(user_id, wallet_type, plan_id), load, WALLET_CACHE_TIMEOUT)
+    except Exception as e:
+        logger.error(f"Error getting wallet balance: {e}")
+        return Decimal('0.00')
     
-    if balance is None:
-        logger.debug(f"Wallet balance for user {user_id}, type {wallet_type}, plan {plan_id} cache miss, fetching from database")
-        # Cache miss, get from database
-        try:
-            wallet_queryset = Wallet.objects.filter(user_id=user_id, wallet_type=wallet_type)
-            
-            if plan_id and wallet_type == 'PLAN':
-                wallet_queryset = wallet_queryset.filter(plan_id=plan_id)
-            
-            wallet = wallet_queryset.first()
-            
-            if wallet:
-                balance = wallet.balance
-                # Cache the balance
-                cache.set(cache_key, balance, WALLET_CACHE_TIMEOUT)
-            else:
-                logger.warning(f"Wallet not found for user {user_id}, type {wallet_type}, plan {plan_id}")
-                return Decimal('0.00')
-        except Exception as e:
-            logger.error(f"Error getting wallet balance: {e}")
-            return Decimal('0.00')
-    else:
-        logger.debug(f"Wallet balance for user {user_id}, type {wallet_type}, plan {plan_id} cache hit")
+    return Decimal('0.00') if balance is None else balance
+
+
+def _load_wallet_balances(wallets: List[WalletKey]) -> Dict[WalletKey, Decimal]:
+    """Resolve wallet balances with one query, matching get_wallet_balance's rules."""
+    logger.debug(f"Wallet balances cache miss for {len(wallets)} wallets, fetching from database")
+    rows = (
+        Wallet.objects
+        .filter(user_id__in={user_id for user_id, _, _ in wallets}, wallet_type__in={wallet_type for _, wallet_type, _ in wallets})
+        .order_by('pk')
+        .values_list('user_id', 'wallet_type', 'plan_id', 'balance')
+    )
     
-    return balance
+    # The first wallet by ID wins, as with QuerySet.first()
+    first_by_type = {}
+    first_by_plan = {}
+    for user_id, wallet_type, plan_id, balance in rows:
+        first_by_type.setdefault((user_id, wallet_type), balance)
+        first_by_plan.setdefault((user_id, wallet_type, plan_id), balance)
+    
+    balances = {}
+    for user_id, wallet_type, plan_id in wallets:
+        if plan_id and wallet_type == 'PLAN':
+            balance = first_by_plan.get((user_id, wallet_type, plan_id))
+        else:
+            balance = first_by_type.get((user_id, wallet_type))
+        if balance is not None:
+            balances[(user_id, wallet_type, plan_id)] = balance
+    return balances
+
+
+def get_wallet_balances(wallets: Iterable[WalletKey]) -> Dict[WalletKey, Decimal]:
+    """
+    Get many wallet balances with one cache round trip and at most one query.
+    
+    Args:
+        wallets (Iterable[WalletKey]): (user_id, wallet_type, plan_id) for each wallet
+        
+    Returns:
+        Dict[WalletKey, Decimal]: The balance of each wallet, 0.00 if not found
+    """
+    keys = {wallet: _wallet_cache_key(*wallet) for wallet in wallets}
+    balances = get_many_or_compute(cache, keys, _load_wallet_balances, WALLET_CACHE_TIMEOUT)
+    return {wallet: balances.get(wallet, Decimal('0.00')) for wallet in keys}
 
 
 def get_user_subscriptions(user_id: int) -> List[Dict[str, Any]]:
@@ -205,62 +259,87 @@ def get_user_subscriptions(user_id: int) -> List[Dict[str, Any]]:
     Returns:
         List[Dict[str, Any]]: List of subscriptions as dictionaries
     """
-    cache_key = USER_SUBSCRIPTIONS_CACHE_KEY_TEMPLATE.format(user_id)
+    def load():
+        logger.debug(f"Subscriptions for user {user_id} cache miss, fetching from database")
+        subscription_queryset = Subscription.objects.filter(user_id=user_id).select_related('plan')
+        return [_subscription_dict(sub) for sub in subscription_queryset]
     
-    # Try to get subscriptions from cache
-    subscriptions = cache.get(cache_key)
+    cache_key = USER_SUBSCRIPTIONS_CACHE_KEY_TEMPLATE.format(user_id)
+    return get_or_compute(cache, cache_key, load, SUBSCRIPTION_CACHE_TIMEOUT)
+
+
+def _load_subscriptions(user_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """Resolve the subscriptions of many users with one query."""
+    logger.debug(f"Subscriptions cache miss for {len(user_ids)} users, fetching from database")
+    subscriptions = {user_id: [] for user_id in user_ids}
+    for sub in Subscription.objects.filter(user_id__in=user_ids).select_related('plan').order_by('pk'):
+        subscriptions[sub.user_id].append(_subscription_dict(sub))
+    return subscriptions
+
+
+def get_subscriptions_for_users(user_ids: Iterable[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Get the subscriptions of many users with one cache round trip and at most one query.
     
-    if subscriptions is None:
-        logger.debug(f"Subscriptions for user {user_id} cache miss, fetching from database")
-        # Cache miss, get from database
-        subscription_queryset = Subscription.objects.filter(user_id=user_id)
+    Args:
+        user_ids (Iterable[int]): The IDs of the users
         
-        # Convert to list of dictionaries for serialization
-        subscriptions = [
-            {
-                'id': sub.id,
-                'plan_id': sub.plan_id,
-                'plan_name': sub.plan.name if sub.plan else None,
-                'status': sub.status,
-                'created_at': sub.created_at.isoformat() if sub.created_at else None,
-                'approved_at': sub.approved_at.isoformat() if sub.approved_at else None,
-                'completed_at': sub.completed_at.isoformat() if sub.completed_at else None,
-            }
-            for sub in subscription_queryset
-        ]
+    Returns:
+        Dict[int, List[Dict[str, Any]]]: Each user's subscriptions as dictionaries
+    """
+    keys = {user_id: USER_SUBSCRIPTIONS_CACHE_KEY_TEMPLATE.format(user_id) for user_id in user_ids}
+    return get_many_or_compute(cache, keys, _load_subscriptions, SUBSCRIPTION_CACHE_TIMEOUT)
+
+
+def wallet_balance_loader(request) -> BatchLoader:
+    """
+    Get the request's loader for wallet balances, keyed by (user_id, wallet_type, plan_id).
+    
+    Args:
+        request (HttpRequest): The current request
         
-        # Cache the subscriptions
-        cache.set(cache_key, subscriptions, SUBSCRIPTION_CACHE_TIMEOUT)
-    else:
-        logger.debug(f"Subscriptions for user {user_id} cache hit")
+    Returns:
+        BatchLoader: Coalesces the request's lookups into get_wallet_balances calls
+    """
+    return request_loader(request, 'wallet_balances', get_wallet_balances, Decimal('0.00'))
+
+
+def subscriptions_loader(request) -> BatchLoader:
+    """
+    Get the request's loader for user subscriptions, keyed by user ID.
     
-    return subscriptions
+    Args:
+        request (HttpRequest): The current request
+        
+    Returns:
+        BatchLoader: Coalesces the request's lookups into get_subscriptions_for_users calls
+    """
+    return request_loader(request, 'user_subscriptions', get_subscriptions_for_users, [])
 
 
 def invalidate_plans_cache():
-    """Invalidate the plans cache."""
+    """Invalidate the plans cache once the current transaction commits."""
     logger.debug("Invalidating plans cache")
-    cache.delete(PLANS_CACHE_KEY)
     
-    # Also invalidate individual plan caches
-    for plan in Plan.objects.all():
-        cache.delete(PLAN_CACHE_KEY_TEMPLATE.format(plan.id))
+    # Bumping the generation retires the plan list and every individual plan
+    transaction.on_commit(lambda: local_cache.invalidate_namespace(PLANS_NAMESPACE))
 
 
 def invalidate_queue_cache(plan_id: int):
     """
-    Invalidate the queue cache for a specific plan.
+    Invalidate the queue cache for a specific plan once the current transaction commits.
     
     Args:
         plan_id (int): The ID of the plan
     """
     logger.debug(f"Invalidating queue cache for plan {plan_id}")
-    cache.delete(QUEUE_POSITIONS_CACHE_KEY_TEMPLATE.format(plan_id))
+    cache_key = QUEUE_POSITIONS_CACHE_KEY_TEMPLATE.format(plan_id)
+    transaction.on_commit(lambda: local_cache.delete(cache_key))
 
 
 def invalidate_wallet_cache(user_id: int, wallet_type: str, plan_id: Optional[int] = None):
     """
-    Invalidate the wallet cache for a specific user and wallet type.
+    Invalidate the wallet cache for a specific user and wallet type once the current transaction commits.
     
     Args:
         user_id (int): The ID of the user
@@ -268,19 +347,20 @@ def invalidate_wallet_cache(user_id: int, wallet_type: str, plan_id: Optional[in
         plan_id (Optional[int]): The ID of the plan (required for PLAN wallet type)
     """
     logger.debug(f"Invalidating wallet cache for user {user_id}, type {wallet_type}, plan {plan_id}")
-    cache_key = WALLET_BALANCE_CACHE_KEY_TEMPLATE.format(user_id, f"{wallet_type}_{plan_id}" if plan_id else wallet_type)
-    cache.delete(cache_key)
+    cache_key = _wallet_cache_key(user_id, wallet_type, plan_id)
+    transaction.on_commit(lambda: invalidate(cache, [cache_key]))
 
 
 def invalidate_subscription_cache(user_id: int):
     """
-    Invalidate the subscription cache for a specific user.
+    Invalidate the subscription cache for a specific user once the current transaction commits.
     
     Args:
         user_id (int): The ID of the user
     """
     logger.debug(f"Invalidating subscription cache for user {user_id}")
-    cache.delete(USER_SUBSCRIPTIONS_CACHE_KEY_TEMPLATE.format(user_id))
+    cache_key = USER_SUBSCRIPTIONS_CACHE_KEY_TEMPLATE.format(user_id)
+    transaction.on_commit(lambda: invalidate(cache, [cache_key]))
 
 
 # Signal handlers to automatically invalidate cache when models change
@@ -0,0 +1,37 @@
+"""Credit deferred referral bonuses in batches."""
+
+from django.core.management.base import BaseCommand
+
+from subscriptions.referral_credits import credit_referral_bonuses
+
+
+class Command(BaseCommand):
+    """Credit pending referral bonuses until none are left."""
+
+    help = (
+        "Credit pending referral bonuses to referral wallets in batches. Run it "
+        "periodically when REFERRAL_BONUS_DEFERRED is enabled."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            "--batch-size", type=int, help="Number of referrals credited per batch."
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=0,
+            help="Stop after this many batches. Defaults to running until none are pending.",
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        batch_size = max(options["batch_size"], 1) if options["batch_size"] else None
+        result = credit_referral_bonuses(batch_size=batch_size, max_batches=options["max_batches"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Credited {result['referrals']} referral bonuses "
+                f"to {result['referrers']} referrers in {result['batches']} batches."
+            )
+        )
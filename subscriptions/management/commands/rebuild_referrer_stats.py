@@ -0,0 +1,84 @@
+"""Rebuild the per-referrer referral stats."""
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from subscriptions.models import Referral, ReferrerStats
+from subscriptions.referral_stats import LEADERBOARD_CACHE_KEY
+
+
+class Command(BaseCommand):
+    """Recompute ReferrerStats in ranges of referrer ids."""
+
+    help = "Recompute the per-referrer referral stats from the Referral and user tables."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Number of referrer ids rebuilt per database transaction.",
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        User = get_user_model()
+        chunk_size = max(options["chunk_size"], 1)
+
+        ids = User.objects.order_by("pk").values_list("pk", flat=True)
+        first, last = ids.first(), ids.last()
+        if first is None:
+            self.stdout.write("Nothing to rebuild.")
+            return
+
+        rows = 0
+        for start in range(first, last + 1, chunk_size):
+            rows += self._rebuild(start, start + chunk_size)
+
+        cache.delete(LEADERBOARD_CACHE_KEY)
+        self.stdout.write(self.style.SUCCESS(f"Referrer stats rebuilt: {rows} referrers."))
+
+    @transaction.atomic
+    def _rebuild(self, start, end):
+        """Replace the stats rows for referrers with ids in [start, end)."""
+        User = get_user_model()
+        stats = {}
+
+        signups = (
+            User.objects.filter(referred_by_id__gte=start, referred_by_id__lt=end)
+            .order_by()
+            .values("referred_by_id")
+            .annotate(count=Count("id"))
+        )
+        for row in signups:
+            stats[row["referred_by_id"]] = ReferrerStats(
+                referrer_id=row["referred_by_id"], total_referrals=row["count"]
+            )
+
+        bonuses = (
+            Referral.objects.filter(
+                referrer_id__gte=start, referrer_id__lt=end, credited_at__isnull=False
+            )
+            .order_by()
+            .values("referrer_id")
+            .annotate(
+                bonus_count=Count("id"),
+                lifetime_bonus=Sum("bonus_amount"),
+                active_referrals=Count("referred_user_id", distinct=True),
+            )
+        )
+        for row in bonuses:
+            row_stats = stats.setdefault(
+                row["referrer_id"], ReferrerStats(referrer_id=row["referrer_id"])
+            )
+            row_stats.bonus_count = row["bonus_count"]
+            row_stats.lifetime_bonus = row["lifetime_bonus"] or 0
+            row_stats.active_referrals = row["active_referrals"]
+
+        ReferrerStats.objects.filter(referrer_id__gte=start, referrer_id__lt=end).delete()
+        ReferrerStats.objects.bulk_create(stats.values())
+        return len(stats)
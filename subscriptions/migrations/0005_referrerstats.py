@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-19 14:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("subscriptions", "0004_remove_queueposition_subscription_and_more"),
+        ("users", "0010_referralpath"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReferrerStats",
+            fields=[
+                (
+                    "referrer",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="referrer_stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("total_referrals", models.IntegerField(default=0)),
+                ("active_referrals", models.IntegerField(default=0)),
+                ("bonus_count", models.IntegerField(default=0)),
+                ("lifetime_bonus", models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["-lifetime_bonus", "referrer"], name="referrer_leaderboard_idx"
+                    )
+                ],
+            },
+        ),
+    ]
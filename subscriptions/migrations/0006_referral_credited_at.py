@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-19 15:02
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_referrals_credited(apps, schema_editor):
+    """Bonuses recorded before deferred crediting were paid when created."""
+    Referral = apps.get_model("subscriptions", "Referral")
+    Referral.objects.filter(credited_at__isnull=True).update(credited_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("subscriptions", "0005_referrerstats"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="referral",
+            name="credited_at",
+            field=models.DateTimeField(
+                blank=True, help_text="When the bonus was paid into the referral wallet", null=True
+            ),
+        ),
+        migrations.RunPython(mark_existing_referrals_credited, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="referral",
+            index=models.Index(
+                condition=models.Q(("credited_at__isnull", True)),
+                fields=["id"],
+                name="referral_pending_credit_idx",
+            ),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from decimal import Decimal
@@ -524,12 +525,18 @@ class Referral(models.Model):
                                    help_text="Subscription that triggered this referral bonus")
     bonus_amount = models.DecimalField(max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
+    credited_at = models.DateTimeField(null=True, blank=True,
+                                       help_text="When the bonus was paid into the referral wallet")
 
     class Meta:
         """
         Meta options for the Referral model.
         """
         unique_together = [['referrer', 'referred_user', 'subscription']]
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(credited_at__isnull=True),
+                         name='referral_pending_credit_idx'),
+        ]
 
     def __str__(self) -> str:
         """
@@ -541,7 +548,7 @@ class Referral(models.Model):
         return f"{self.referrer.username} referred {self.referred_user.username} - ${self.bonus_amount} bonus"
 
     @classmethod
-    def create_referral_bonus(cls, subscription: Subscription) -> Optional['Referral']:
+    def create_referral_bonus(cls, subscription: Subscription, deferred: Optional[bool] = None) -> Optional['Referral']:
         """
         Create a referral bonus when a user subscribes to a plan.
 
@@ -549,30 +556,54 @@ class Referral(models.Model):
         creates a referral record, adds the bonus to the referrer's referral wallet, and
         creates a transaction record for the bonus.
 
+        In deferred mode only the referral record is inserted. It stays pending
+        until subscriptions.referral_credits credits it in a batch.
+
         Args:
             subscription: The subscription that triggered the referral bonus
+            deferred: Record a pending accrual instead of crediting now;
+                defaults to the REFERRAL_BONUS_DEFERRED setting
 
         Returns:
             Optional[Referral]: The created referral record, or None if the user has no referrer
         """
         user = subscription.user
-        referrer = user.referred_by
+        if deferred is None:
+            deferred = settings.REFERRAL_BONUS_DEFERRED
 
-        if not referrer:
+        if not user.referred_by_id:
             return None
 
         # Calculate 5% bonus
         bonus_amount = subscription.plan.contribution_amount * Decimal('0.05')
 
+        if deferred:
+            return cls.objects.create(
+                referrer_id=user.referred_by_id,
+                referred_user=user,
+                subscription=subscription,
+                bonus_amount=bonus_amount
+            )
+
+        referrer = user.referred_by
+
         with transaction.atomic():
             # Create referral record
             referral = cls.objects.create(
                 referrer=referrer,
                 referred_user=user,
                 subscription=subscription,
-                bonus_amount=bonus_amount
+                bonus_amount=bonus_amount,
+                credited_at=timezone.now()
             )
 
+            # Update the referrer's totals and leaderboard entry
+            from .referral_stats import record_referral_bonus
+            first_for_user = not cls.objects.filter(
+                referrer=referrer, referred_user=user, credited_at__isnull=False
+            ).exclude(pk=referral.pk).exists()
+            record_referral_bonus(referral, first_for_user)
+
             # Add bonus to referrer's referral wallet
             referral_wallet = Wallet.get_or_create_wallet(
                 user=referrer,
@@ -600,4 +631,37 @@ class Referral(models.Model):
 
             return referral
 
+
+class ReferrerStats(models.Model):
+    """
+    Pre-aggregated referral totals for one referrer.
+
+    ``total_referrals`` counts users who signed up with the referrer's code,
+    ``active_referrals`` counts those who have earned the referrer at least
+    one bonus, and ``lifetime_bonus`` is the sum of all referral bonuses.
+    Maintained incrementally by subscriptions.referral_stats so referral pages
+    and the leaderboard read one row instead of aggregating Referral.
+    """
+    referrer = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                    related_name='referrer_stats')
+    total_referrals = models.IntegerField(default=0)
+    active_referrals = models.IntegerField(default=0)
+    bonus_count = models.IntegerField(default=0)
+    lifetime_bonus = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-lifetime_bonus', 'referrer'], name='referrer_leaderboard_idx'),
+        ]
+
+    def __str__(self) -> str:
+        """
+        Return a string representation of the stats row.
+
+        Returns:
+            str: The referrer ID with referral count and lifetime bonus
+        """
+        return f"Referrer {self.referrer_id}: {self.total_referrals} referrals, ${self.lifetime_bonus}"
+
 # Withdrawal model is now in transactions app
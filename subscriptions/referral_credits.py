@@ -0,0 +1,175 @@
+"""
+Batched crediting of deferred referral bonuses.
+
+With ``REFERRAL_BONUS_DEFERRED`` enabled, ``Referral.create_referral_bonus``
+only inserts the referral record, leaving ``credited_at`` empty. The
+``credit_referral_bonuses`` command drains those pending accruals in batches:
+each batch is summed per referrer, every referral wallet is credited with one
+UPDATE and each referrer gets one REFERRAL_BONUS transaction, however many
+bonuses they earned since the last run.
+"""
+
+import logging
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Min, Q, Value, When
+from django.utils import timezone
+
+from .cache import invalidate_wallet_cache
+from .models import Referral, Wallet
+from .referral_stats import record_referral_bonuses
+
+logger = logging.getLogger("agape.subscriptions")
+
+# Defaults used when the settings are missing
+DEFAULT_CREDIT_BATCH_SIZE = 500
+
+
+def credit_referral_batch(batch_size: Optional[int] = None) -> Dict[str, int]:
+    """
+    Credit one batch of pending referral bonuses.
+
+    Pending referrals are claimed with SKIP LOCKED, so several workers can
+    run at once without crediting the same bonus twice.
+
+    Args:
+        batch_size (Optional[int]): Maximum number of referrals to credit;
+            defaults to REFERRAL_CREDIT_BATCH_SIZE
+
+    Returns:
+        Dict[str, int]: Number of 'referrals' credited and 'referrers' paid
+    """
+    from transactions.models import Transaction
+    from transactions.rollups import mark_user_active, record_transaction
+
+    batch_size = batch_size or getattr(
+        settings, "REFERRAL_CREDIT_BATCH_SIZE", DEFAULT_CREDIT_BATCH_SIZE
+    )
+    now = timezone.now()
+
+    with transaction.atomic():
+        pending = list(
+            Referral.objects.select_for_update(skip_locked=True)
+            .filter(credited_at__isnull=True)
+            .order_by("id")
+            .values("id", "referrer_id", "referred_user_id", "bonus_amount")[:batch_size]
+        )
+        if not pending:
+            return {"referrals": 0, "referrers": 0}
+
+        totals: Dict[int, Decimal] = defaultdict(lambda: Decimal("0.00"))
+        counts: Dict[int, int] = defaultdict(int)
+        pairs = set()
+        for referral in pending:
+            totals[referral["referrer_id"]] += referral["bonus_amount"]
+            counts[referral["referrer_id"]] += 1
+            pairs.add((referral["referrer_id"], referral["referred_user_id"]))
+
+        # Referred users who already earned their referrer a bonus are not new active referrals
+        pair_filter = Q()
+        for referrer_id, referred_user_id in pairs:
+            pair_filter |= Q(referrer_id=referrer_id, referred_user_id=referred_user_id)
+        already_active = set(
+            Referral.objects.filter(pair_filter, credited_at__isnull=False)
+            .values_list("referrer_id", "referred_user_id")
+            .distinct()
+        )
+        new_active: Dict[int, int] = defaultdict(int)
+        for referrer_id, referred_user_id in pairs - already_active:
+            new_active[referrer_id] += 1
+
+        # Create any missing referral wallets, then credit them all in one UPDATE
+        referral_wallets = Wallet.objects.filter(
+            user_id__in=totals, wallet_type="REFERRAL", plan__isnull=True
+        )
+        existing = set(referral_wallets.values_list("user_id", flat=True))
+        Wallet.objects.bulk_create(
+            [
+                Wallet(user_id=referrer_id, wallet_type="REFERRAL", balance=0)
+                for referrer_id in totals
+                if referrer_id not in existing
+            ]
+        )
+        wallet_ids = dict(
+            referral_wallets.order_by()
+            .values("user_id")
+            .annotate(wallet_id=Min("id"))
+            .values_list("user_id", "wallet_id")
+        )
+        credit = Case(
+            *[
+                When(pk=wallet_ids[referrer_id], then=Value(amount))
+                for referrer_id, amount in totals.items()
+            ],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        Wallet.objects.filter(pk__in=wallet_ids.values()).update(
+            balance=F("balance") + credit, updated_at=now
+        )
+        # The UPDATE skips the post_save receiver that drops cached balances
+        for referrer_id in totals:
+            invalidate_wallet_cache(referrer_id, "REFERRAL")
+
+        Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    user_id=referrer_id,
+                    transaction_type="REFERRAL_BONUS",
+                    amount=amount,
+                    status="COMPLETED",
+                    transaction_id=f"REF-{uuid.uuid4().hex[:12]}",
+                    description=f"Referral bonuses ({counts[referrer_id]})",
+                    completed_at=now,
+                )
+                for referrer_id, amount in totals.items()
+            ]
+        )
+
+        Referral.objects.filter(pk__in=[referral["id"] for referral in pending]).update(
+            credited_at=now
+        )
+
+        for referrer_id, amount in totals.items():
+            record_referral_bonuses(
+                referrer_id, counts[referrer_id], amount, new_active[referrer_id]
+            )
+
+        # bulk_create does not send post_save
+        day = timezone.localdate(now)
+        record_transaction(
+            day, "REFERRAL_BONUS", "COMPLETED", len(totals), sum(totals.values(), Decimal("0.00"))
+        )
+        for referrer_id in totals:
+            mark_user_active(referrer_id, day)
+
+    logger.info(f"Credited {len(pending)} referral bonuses to {len(totals)} referrers")
+    return {"referrals": len(pending), "referrers": len(totals)}
+
+
+def credit_referral_bonuses(
+    batch_size: Optional[int] = None, max_batches: int = 0
+) -> Dict[str, int]:
+    """
+    Credit pending referral bonuses until none are left.
+
+    Args:
+        batch_size (Optional[int]): Referrals credited per batch
+        max_batches (int): Stop after this many batches; 0 means no limit
+
+    Returns:
+        Dict[str, int]: Totals for 'batches', 'referrals' and 'referrers'
+    """
+    totals = {"batches": 0, "referrals": 0, "referrers": 0}
+    while not max_batches or totals["batches"] < max_batches:
+        result = credit_referral_batch(batch_size)
+        if not result["referrals"]:
+            break
+        totals["batches"] += 1
+        totals["referrals"] += result["referrals"]
+        totals["referrers"] += result["referrers"]
+    return totals
@@ -0,0 +1,242 @@
+"""
+Per-referrer referral totals and the referral leaderboard.
+
+``ReferrerStats`` rows are maintained incrementally: sign-ups with a referral
+code bump ``total_referrals`` through the signal handlers below, and
+``Referral.create_referral_bonus`` and the deferred credit job in
+subscriptions.referral_credits record every bonus they pay. Referral pages
+read one row, and the top of the leaderboard is an index scan kept warm in
+the cache. A change that affects the cached board invalidates it once
+committed, and the next reader rebuilds it from the table, so concurrent
+updates never overwrite each other's entries. Ranks are read from the cached
+board; referrers below it are unranked. Run ``rebuild_referrer_stats`` to
+recompute the rows from the Referral and user tables.
+"""
+
+import logging
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.tiered_cache import get_or_compute, invalidate
+
+from .models import Referral, ReferrerStats
+
+logger = logging.getLogger("agape.subscriptions")
+
+User = get_user_model()
+
+# Cache keys
+LEADERBOARD_CACHE_KEY = "referral_leaderboard"
+
+# Number of leaderboard entries kept in the cache
+LEADERBOARD_SIZE = 100
+
+# Cache timeouts (in seconds)
+LEADERBOARD_TIMEOUT = 60 * 60  # 1 hour
+
+
+def _increment(referrer_id: int, **deltas: Any) -> None:
+    """Add deltas to a referrer's stats row, creating it on the first event."""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if ReferrerStats.objects.filter(referrer_id=referrer_id).update(**updates):
+        return
+
+    try:
+        with transaction.atomic():
+            ReferrerStats.objects.create(referrer_id=referrer_id, **deltas)
+    except IntegrityError:
+        # Another writer created the row first
+        ReferrerStats.objects.filter(referrer_id=referrer_id).update(**updates)
+
+
+def record_referral_bonus(referral: Referral, first_for_user: bool) -> None:
+    """
+    Add a paid referral bonus to the referrer's stats.
+
+    Args:
+        referral (Referral): The referral record that was just created
+        first_for_user (bool): True if this is the first bonus the referred user
+            has earned the referrer, which makes them an active referral
+    """
+    record_referral_bonuses(
+        referral.referrer_id, 1, referral.bonus_amount, 1 if first_for_user else 0
+    )
+
+
+def record_referral_bonuses(
+    referrer_id: int, count: int, amount: Decimal, new_active: int = 0
+) -> None:
+    """
+    Add a batch of paid referral bonuses to a referrer's stats.
+
+    Args:
+        referrer_id (int): The ID of the referrer
+        count (int): Number of bonuses paid
+        amount (Decimal): Total paid
+        new_active (int): Referred users earning the referrer their first bonus
+    """
+    _increment(referrer_id, bonus_count=count, lifetime_bonus=amount, active_referrals=new_active)
+    transaction.on_commit(lambda: _refresh_leaderboard_entry(referrer_id))
+
+
+def record_signup(referrer_id: int, delta: int = 1) -> None:
+    """
+    Count a user signing up with (or moving away from) a referrer's code.
+
+    Args:
+        referrer_id (int): The ID of the referrer
+        delta (int): 1 for a new referral, -1 for one that left
+    """
+    _increment(referrer_id, total_referrals=delta)
+    transaction.on_commit(lambda: _refresh_leaderboard_entry(referrer_id))
+
+
+def get_referrer_stats(user) -> ReferrerStats:
+    """
+    Get a user's referral stats.
+
+    Args:
+        user (User): The referrer
+
+    Returns:
+        ReferrerStats: The stats row, or an unsaved all-zero row if the user
+            has never referred anyone
+    """
+    try:
+        return ReferrerStats.objects.get(referrer=user)
+    except ReferrerStats.DoesNotExist:
+        return ReferrerStats(referrer=user, lifetime_bonus=Decimal("0.00"))
+
+
+def _leaderboard_entries(queryset) -> List[Dict[str, Any]]:
+    rows = queryset.values(
+        "referrer_id",
+        "referrer__username",
+        "total_referrals",
+        "active_referrals",
+        "lifetime_bonus",
+    )
+    return [
+        {
+            "user_id": row["referrer_id"],
+            "username": row["referrer__username"],
+            "total_referrals": row["total_referrals"],
+            "active_referrals": row["active_referrals"],
+            "lifetime_bonus": row["lifetime_bonus"],
+        }
+        for row in rows
+    ]
+
+
+def _rank(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    entries.sort(key=lambda entry: (-entry["lifetime_bonus"], entry["user_id"]))
+    for position, entry in enumerate(entries, start=1):
+        entry["rank"] = position
+    return entries
+
+
+def get_leaderboard(limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Get the top referrers by lifetime bonus.
+
+    Args:
+        limit (int): Number of entries to return, at most LEADERBOARD_SIZE
+
+    Returns:
+        List[Dict[str, Any]]: Ranked entries with rank, user_id, username,
+            total_referrals, active_referrals and lifetime_bonus
+    """
+
+    def load():
+        logger.debug("Referral leaderboard cache miss, fetching from database")
+        return _rank(
+            _leaderboard_entries(
+                ReferrerStats.objects.filter(lifetime_bonus__gt=0).order_by(
+                    "-lifetime_bonus", "referrer_id"
+                )[:LEADERBOARD_SIZE]
+            )
+        )
+
+    limit = max(1, min(limit, LEADERBOARD_SIZE))
+    return get_or_compute(cache, LEADERBOARD_CACHE_KEY, load, LEADERBOARD_TIMEOUT)[:limit]
+
+
+def get_leaderboard_rank(user) -> Optional[int]:
+    """
+    Get a referrer's position on the leaderboard.
+
+    Args:
+        user (User): The referrer
+
+    Returns:
+        Optional[int]: The 1-based rank, or None if the user is not among
+            the top LEADERBOARD_SIZE referrers
+    """
+    for entry in get_leaderboard(LEADERBOARD_SIZE):
+        if entry["user_id"] == user.pk:
+            return entry["rank"]
+    return None
+
+
+def _refresh_leaderboard_entry(referrer_id: int) -> None:
+    """
+    Invalidate the cached leaderboard if a referrer's change affects it.
+
+    The board is dropped rather than edited in place, so two updates can't
+    each write back a copy missing the other's change. It is left alone
+    when the referrer neither is on it nor now qualifies for it.
+    """
+    entry = cache.get(LEADERBOARD_CACHE_KEY)
+    if entry is None:
+        return
+    entries = entry[0]
+
+    if not any(board_entry["user_id"] == referrer_id for board_entry in entries):
+        bonus = (
+            ReferrerStats.objects.filter(referrer_id=referrer_id)
+            .values_list("lifetime_bonus", flat=True)
+            .first()
+        )
+        if not bonus:
+            return
+        if len(entries) >= LEADERBOARD_SIZE and bonus < entries[-1]["lifetime_bonus"]:
+            return
+
+    invalidate(cache, [LEADERBOARD_CACHE_KEY])
+
+
+# Signal handlers to count referred sign-ups
+
+
+@receiver(post_save, sender=User)
+def count_referred_signup(sender, instance, created, raw=False, **kwargs):
+    """Count sign-ups against their referrer and follow referrer changes."""
+    if raw:
+        return
+    if created:
+        if instance.referred_by_id:
+            record_signup(instance.referred_by_id)
+        return
+
+    # User.save resets the remembered referrer after this handler runs
+    if not hasattr(instance, "_loaded_referred_by_id") or "referred_by_id" not in instance.__dict__:
+        return
+    if instance._loaded_referred_by_id != instance.referred_by_id:
+        if instance._loaded_referred_by_id:
+            record_signup(instance._loaded_referred_by_id, -1)
+        if instance.referred_by_id:
+            record_signup(instance.referred_by_id)
+
+
+@receiver(post_delete, sender=User)
+def uncount_referred_signup(sender, instance, **kwargs):
+    """Remove a deleted user from their referrer's total."""
+    if instance.referred_by_id:
+        record_signup(instance.referred_by_id, -1)
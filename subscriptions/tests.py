@@ -388,3 +388,305 @@ class SubscriptionAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['position'], 1)
         self.assertEqual(response.data['plan_name'], "Test Plan")
+
+
+class ReferrerStatsTests(TestCase):
+    """
+    Test suite for incrementally maintained referrer stats and the leaderboard
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.referrer = User.objects.create_user(
+            username="referrer", email="referrer@example.com", password="testpass123"
+        )
+        self.referred = User.objects.create_user(
+            username="referred", email="referred@example.com", password="testpass123",
+            referred_by=self.referrer
+        )
+        self.plan = Plan.objects.create(
+            name="Starter",
+            plan_type="STARTER",
+            contribution_amount=Decimal("100.00"),
+            total_received=Decimal("0.00"),
+            max_members=13,
+            deduction_repurchase=Decimal("7.69"),
+            deduction_maintenance=Decimal("15.38"),
+            withdrawable_amount=Decimal("76.93"),
+        )
+
+    def _pay_bonus(self):
+        subscription = Subscription.objects.create(user=self.referred, plan=self.plan, status='ACTIVE')
+        return Referral.create_referral_bonus(subscription)
+
+    def test_signup_and_bonus_update_stats(self):
+        """
+        Test that sign-ups and bonuses are added to the referrer's row
+        """
+        from .referral_stats import get_referrer_stats
+
+        self._pay_bonus()
+        self._pay_bonus()
+
+        stats = get_referrer_stats(self.referrer)
+        self.assertEqual(stats.total_referrals, 1)
+        self.assertEqual(stats.active_referrals, 1)
+        self.assertEqual(stats.bonus_count, 2)
+        self.assertEqual(stats.lifetime_bonus, Decimal("10.00"))
+
+    def test_cached_leaderboard_picks_up_new_bonuses(self):
+        """
+        Test that a cached leaderboard is rebuilt after a bonus and serves ranks without queries
+        """
+        from .referral_stats import get_leaderboard, get_leaderboard_rank
+
+        self.assertEqual(get_leaderboard(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self._pay_bonus()
+
+        leaderboard = get_leaderboard()
+        self.assertEqual(len(leaderboard), 1)
+        self.assertEqual(leaderboard[0]['username'], 'referrer')
+        self.assertEqual(leaderboard[0]['rank'], 1)
+        self.assertEqual(leaderboard[0]['lifetime_bonus'], Decimal("5.00"))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_leaderboard_rank(self.referrer), 1)
+            self.assertIsNone(get_leaderboard_rank(self.referred))
+
+    def test_rebuild_matches_incremental_stats(self):
+        """
+        Test that the rebuild command reproduces the maintained rows
+        """
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import ReferrerStats
+
+        self._pay_bonus()
+        fields = ('referrer_id', 'total_referrals', 'active_referrals', 'bonus_count', 'lifetime_bonus')
+        expected = list(ReferrerStats.objects.values_list(*fields))
+
+        call_command('rebuild_referrer_stats', stdout=StringIO())
+
+        self.assertEqual(list(ReferrerStats.objects.values_list(*fields)), expected)
+
+    def test_referral_overview_is_paginated(self):
+        """
+        Test that the referral overview lists one page of referrals at a time
+        """
+        from unittest.mock import patch
+        from django.http import HttpResponse
+        from .views import REFERRALS_PER_PAGE
+
+        for _ in range(REFERRALS_PER_PAGE + 1):
+            self._pay_bonus()
+        self.client.force_login(self.referrer)
+
+        with patch('subscriptions.views.render', return_value=HttpResponse()) as render:
+            self.client.get(reverse('subscriptions:referral_overview'), {'page': 2})
+
+        context = render.call_args.args[2]
+        self.assertEqual(len(context['referrals']), 1)
+        self.assertEqual(context['page_obj'].number, 2)
+        self.assertEqual(context['stats']['total_earnings'], Decimal("5.00") * (REFERRALS_PER_PAGE + 1))
+
+    def test_leaderboard_api(self):
+        """
+        Test the top-N leaderboard endpoint
+        """
+        self._pay_bonus()
+        self.client.force_login(self.referrer)
+
+        response = self.client.get(reverse('subscriptions:referral_leaderboard'), {'limit': 5})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['leaderboard'][0]['lifetime_bonus'], '5.00')
+
+
+class DeferredReferralCreditTests(TestCase):
+    """
+    Test suite for pending referral accruals and the batch crediting job
+    """
+
+    def setUp(self):
+        self.referrer = User.objects.create_user(
+            username="hotreferrer", email="hot@example.com", password="testpass123"
+        )
+        self.plan = Plan.objects.create(
+            name="Starter",
+            plan_type="STARTER",
+            contribution_amount=Decimal("100.00"),
+            total_received=Decimal("0.00"),
+            max_members=13,
+            deduction_repurchase=Decimal("7.69"),
+            deduction_maintenance=Decimal("15.38"),
+            withdrawable_amount=Decimal("76.93"),
+        )
+        self.subscriptions = []
+        for i in range(3):
+            user = User.objects.create_user(
+                username=f"member{i}", email=f"member{i}@example.com", password="testpass123",
+                referred_by=self.referrer
+            )
+            self.subscriptions.append(Subscription.objects.create(user=user, plan=self.plan, status='ACTIVE'))
+
+    def test_deferred_bonus_is_single_insert(self):
+        """
+        Test that a deferred bonus only inserts the referral record
+        """
+        with self.assertNumQueries(1):
+            referral = Referral.create_referral_bonus(self.subscriptions[0], deferred=True)
+
+        self.assertIsNone(referral.credited_at)
+        self.assertFalse(Wallet.objects.filter(user=self.referrer).exists())
+
+    def test_batch_credits_once_per_referrer(self):
+        """
+        Test that a batch pays each referrer with one wallet credit and one transaction
+        """
+        from transactions.models import Transaction
+        from .referral_credits import credit_referral_bonuses
+        from .referral_stats import get_referrer_stats
+
+        for subscription in self.subscriptions:
+            Referral.create_referral_bonus(subscription, deferred=True)
+
+        result = credit_referral_bonuses()
+
+        self.assertEqual(result, {'batches': 1, 'referrals': 3, 'referrers': 1})
+        wallet = Wallet.objects.get(user=self.referrer, wallet_type='REFERRAL')
+        self.assertEqual(wallet.balance, Decimal("15.00"))
+        self.assertEqual(Transaction.objects.filter(user=self.referrer, transaction_type='REFERRAL_BONUS').count(), 1)
+        self.assertFalse(Referral.objects.filter(credited_at__isnull=True).exists())
+
+        stats = get_referrer_stats(self.referrer)
+        self.assertEqual(stats.bonus_count, 3)
+        self.assertEqual(stats.active_referrals, 3)
+        self.assertEqual(stats.lifetime_bonus, Decimal("15.00"))
+
+        # Nothing left to credit
+        self.assertEqual(credit_referral_bonuses()['referrals'], 0)
+
+    def test_batch_refreshes_cached_referral_balance(self):
+        """
+        Test that crediting a batch drops the referrer's cached referral balance
+        """
+        from django.core.cache import cache
+        from transactions.models import Transaction
+        from .cache import get_wallet_balance
+        from .referral_credits import credit_referral_bonuses
+
+        cache.clear()
+        Wallet.objects.create(user=self.referrer, wallet_type='REFERRAL', balance=Decimal("0.00"))
+        self.assertEqual(get_wallet_balance(self.referrer.pk, 'REFERRAL'), Decimal("0.00"))
+        for subscription in self.subscriptions:
+            Referral.create_referral_bonus(subscription, deferred=True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            credit_referral_bonuses()
+
+        self.assertEqual(get_wallet_balance(self.referrer.pk, 'REFERRAL'), Decimal("15.00"))
+        bonus = Transaction.objects.get(user=self.referrer, transaction_type='REFERRAL_BONUS')
+        self.assertRegex(bonus.transaction_id, r'^REF-[0-9a-f]{12}$')
+
+
+class SubscriptionCacheTests(TestCase):
+    """
+    Test suite for the cached plan lookups
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        from .cache import local_cache
+
+        cache.clear()
+        local_cache.clear_local()
+        self.plan = Plan.objects.create(
+            name="Starter",
+            plan_type="STARTER",
+            contribution_amount=Decimal("100.00"),
+            total_received=Decimal("0.00"),
+            max_members=13,
+            deduction_repurchase=Decimal("7.69"),
+            deduction_maintenance=Decimal("15.38"),
+            withdrawable_amount=Decimal("76.93"),
+        )
+
+    def test_plan_lookups_are_cached_until_the_plan_changes(self):
+        """
+        Test that repeated plan lookups run no queries and a save invalidates them
+        """
+        from .cache import get_all_plans, get_plan
+
+        self.assertEqual(get_plan(self.plan.id)['contribution_amount'], 100.0)
+        self.assertEqual([plan['name'] for plan in get_all_plans()], ["Starter"])
+        with self.assertNumQueries(0):
+            get_plan(self.plan.id)
+            get_all_plans()
+
+        # Invalidation bumps the generation on commit without loading the plans
+        self.plan.name = "Starter Plus"
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                self.plan.save()
+            self.assertEqual(get_plan(self.plan.id)['name'], "Starter")
+
+        self.assertEqual(get_plan(self.plan.id)['name'], "Starter Plus")
+        self.assertEqual([plan['name'] for plan in get_all_plans()], ["Starter Plus"])
+
+        plan_id = self.plan.id
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.delete()
+        self.assertIsNone(get_plan(plan_id))
+
+    def test_wallet_invalidation_waits_for_commit(self):
+        """
+        Test that a wallet change only invalidates its cached balance once committed
+        """
+        from .cache import get_wallet_balance
+
+        user = User.objects.create_user(username="walletcache", email="walletcache@example.com", password="testpass123")
+        wallet = Wallet.objects.create(user=user, wallet_type='FUNDING', balance=Decimal("10.00"))
+        self.assertEqual(get_wallet_balance(user.id, 'FUNDING'), Decimal("10.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            wallet.balance = Decimal("25.00")
+            wallet.save()
+            # Other readers may still load the old row until the commit
+            self.assertEqual(get_wallet_balance(user.id, 'FUNDING'), Decimal("10.00"))
+
+        self.assertEqual(get_wallet_balance(user.id, 'FUNDING'), Decimal("25.00"))
+
+    def test_batch_lookups_use_one_query_for_all_misses(self):
+        """
+        Test that wallet balances and subscriptions for many users are fetched together
+        """
+        from django.test import RequestFactory
+        from .cache import get_subscriptions_for_users, get_wallet_balances, wallet_balance_loader
+
+        users = [
+            User.objects.create_user(username=f"batch{i}", email=f"batch{i}@example.com", password="testpass123")
+            for i in range(3)
+        ]
+        for i, user in enumerate(users[:2]):
+            Wallet.objects.create(user=user, wallet_type='FUNDING', balance=Decimal("10.00") * (i + 1))
+        Subscription.objects.create(user=users[0], plan=self.plan, status='ACTIVE')
+        keys = [(user.id, 'FUNDING', None) for user in users]
+
+        with self.assertNumQueries(1):
+            balances = get_wallet_balances(keys)
+        self.assertEqual(list(balances.values()), [Decimal("10.00"), Decimal("20.00"), Decimal("0.00")])
+        with self.assertNumQueries(0):
+            get_wallet_balances(keys[:2])
+
+        with self.assertNumQueries(1):
+            subscriptions = get_subscriptions_for_users([user.id for user in users])
+        self.assertEqual([sub['plan_name'] for sub in subscriptions[users[0].id]], ["Starter"])
+        self.assertEqual(subscriptions[users[2].id], [])
+
+        # Lookups deferred during a request are resolved in one batch
+        loader = wallet_balance_loader(RequestFactory().get('/'))
+        loader.defer(*keys)
+        self.assertEqual([loader.load(key) for key in keys], list(balances.values()))
+        self.assertEqual(loader.batches, 1)
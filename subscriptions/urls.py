@@ -21,4 +21,5 @@ urlpatterns = [
     
     # Referrals
     path('referrals/', views.referral_overview, name='referral_overview'),
+    path('referrals/leaderboard/', views.referral_leaderboard, name='referral_leaderboard'),
 ]
@@ -8,10 +8,12 @@ from django.utils import timezone
 from django.db.models import F, Q, Max
 from django.http import JsonResponse
 from django.contrib.auth import get_user_model
+from django.core.paginator import Paginator
 from .models import (
     Subscription, Plan, Contribution, Queue, Wallet, Referral
 )
 from .forms import SubscriptionForm
+from .referral_stats import get_leaderboard, get_leaderboard_rank, get_referrer_stats
 import logging
 from typing import Dict, Any
 
@@ -20,6 +22,9 @@ logger = logging.getLogger('agape.subscriptions')
 
 User = get_user_model()
 
+# Referral rows shown per page of the referral overview
+REFERRALS_PER_PAGE = 20
+
 class PlanListView(LoginRequiredMixin, ListView):
     model = Plan
     template_name = 'subscriptions/plan_list.html'
@@ -167,20 +172,39 @@ def wallet_overview(request):
 
 @login_required
 def referral_overview(request):
-    # Get referrals made by this user
-    referrals = Referral.objects.filter(referrer=request.user).select_related('referred')
-    
-    # Calculate statistics
-    total_referrals = referrals.count()
-    active_referrals = referrals.filter(status='ACTIVE').count()
-    total_earnings = sum(ref.amount for ref in referrals if ref.status == 'PAID')
-    
+    # Get referrals made by this user, one page at a time
+    referral_list = Referral.objects.filter(referrer=request.user).select_related(
+        'referred_user', 'subscription__plan'
+    ).order_by('-created_at', '-pk')
+    paginator = Paginator(referral_list, REFERRALS_PER_PAGE)
+    page_obj = paginator.get_page(request.GET.get('page', 1))
+
+    # Totals are maintained incrementally on the referrer's stats row
+    stats = get_referrer_stats(request.user)
+
     context = {
-        'referrals': referrals,
+        'referrals': page_obj.object_list,
+        'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
         'stats': {
-            'total_referrals': total_referrals,
-            'active_referrals': active_referrals,
-            'total_earnings': total_earnings
+            'total_referrals': stats.total_referrals,
+            'active_referrals': stats.active_referrals,
+            'total_earnings': stats.lifetime_bonus,
+            'leaderboard_rank': get_leaderboard_rank(request.user),
         }
     }
     return render(request, 'subscriptions/referral_overview.html', context)
+
+@login_required
+def referral_leaderboard(request):
+    """Return the top referrers by lifetime referral bonus."""
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'limit must be a number'}, status=400)
+
+    leaderboard = [
+        {**entry, 'lifetime_bonus': str(entry['lifetime_bonus'])}
+        for entry in get_leaderboard(limit)
+    ]
+    return JsonResponse({'status': 'success', 'leaderboard': leaderboard})
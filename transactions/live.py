@@ -0,0 +1,235 @@
+"""
+Live "today" counters for the admin dashboards.
+
+Deposits, withdrawals, sign-ups and pending withdrawals are counted in the
+cache with atomic ``incr`` as transactions, withdrawals and users are
+committed. Django-redis makes these Redis INCRBY calls shared by every
+worker; without REDIS_URL the settings fall back to locmem, which is
+per-process but keeps the same API. Reading the whole set is a single
+``get_many``, so opening the dashboard or polling the live stats costs one
+cache round trip instead of a dozen aggregates.
+
+Under ASGI the admin dashboard keeps one Server-Sent Events stream open
+(``transactions:live_dashboard_stream``) that re-reads the counters on the
+server and only sends them when they change; under WSGI it polls
+``transactions:live_dashboard_stats`` instead.
+"""
+
+import asyncio
+import json
+from decimal import Decimal
+from typing import Dict, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Transaction, Withdrawal
+
+# Cache keys
+LIVE_COUNTER_KEY_TEMPLATE = "live_stats_{}_{}"
+PENDING_WITHDRAWALS_KEY = "live_stats_pending_withdrawals"
+
+# Daily counters outlive their day so late readers still see the final value
+LIVE_COUNTER_TIMEOUT = 60 * 60 * 48  # 48 hours
+# The pending gauge is re-seeded from the database this often to correct drift
+PENDING_WITHDRAWALS_TIMEOUT = 60 * 60  # 1 hour
+
+# How often an open stream re-reads the counters, how long an unchanged
+# stream waits before a keepalive, and how long one connection lasts
+LIVE_STREAM_INTERVAL = 5  # seconds
+LIVE_STREAM_KEEPALIVE = 25  # seconds
+LIVE_STREAM_DURATION = 30 * 60  # 30 minutes
+# Delay before the browser reconnects after a stream ends
+LIVE_STREAM_RETRY_MS = 3000
+
+DAILY_COUNTERS = [
+    "deposits_count",
+    "deposits_amount_cents",
+    "withdrawals_count",
+    "withdrawals_amount_cents",
+    "new_users",
+]
+
+
+def _counter_key(name: str, day=None) -> str:
+    day = day or timezone.localdate()
+    return LIVE_COUNTER_KEY_TEMPLATE.format(day.isoformat(), name)
+
+
+def _to_cents(amount: Decimal) -> int:
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def increment(key: str, delta: int, timeout: Optional[int] = LIVE_COUNTER_TIMEOUT) -> None:
+    """
+    Atomically add to a cache counter, creating it if needed.
+
+    Args:
+        key (str): The cache key
+        delta (int): The amount to add (may be negative)
+        timeout (Optional[int]): Expiry used when the counter is created
+    """
+    cache.add(key, 0, timeout)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # The key expired between add() and incr()
+        cache.set(key, delta, timeout)
+
+
+def increment_on_commit(counts: Dict[str, int]) -> None:
+    """
+    Add to today's counters once the surrounding transaction commits.
+
+    Args:
+        counts (Dict[str, int]): Deltas keyed by counter name
+    """
+    day = timezone.localdate()
+
+    def apply():
+        for name, delta in counts.items():
+            if delta:
+                increment(_counter_key(name, day), delta)
+
+    transaction.on_commit(apply)
+
+
+def record_completed_deposits(count: int, amount: Decimal) -> None:
+    """
+    Count deposits completed by a bulk write, which does not send post_save.
+
+    Args:
+        count (int): Number of deposits completed
+        amount (Decimal): Their combined amount
+    """
+    increment_on_commit({"deposits_count": count, "deposits_amount_cents": _to_cents(amount)})
+
+
+def adjust_pending_withdrawals(delta: int) -> None:
+    """
+    Move the pending withdrawals gauge once the surrounding transaction commits.
+
+    The gauge is only adjusted while it is cached; an unseeded gauge is
+    counted from the database on the next read instead.
+
+    Args:
+        delta (int): Change in the number of pending withdrawals
+    """
+
+    def apply():
+        try:
+            cache.incr(PENDING_WITHDRAWALS_KEY, delta)
+        except ValueError:
+            pass
+
+    if delta:
+        transaction.on_commit(apply)
+
+
+def get_live_stats() -> Dict[str, object]:
+    """
+    Read all of today's live counters.
+
+    Returns:
+        Dict[str, object]: Today's counts and amounts plus the pending withdrawals gauge
+    """
+    keys = {_counter_key(name): name for name in DAILY_COUNTERS}
+    values = cache.get_many(list(keys) + [PENDING_WITHDRAWALS_KEY])
+
+    counters = {name: values.get(key, 0) for key, name in keys.items()}
+    pending = values.get(PENDING_WITHDRAWALS_KEY)
+    if pending is None:
+        pending = Withdrawal.objects.filter(status="PENDING").count()
+        cache.add(PENDING_WITHDRAWALS_KEY, pending, PENDING_WITHDRAWALS_TIMEOUT)
+
+    return {
+        "deposits_count": counters["deposits_count"],
+        "deposits_amount": Decimal(counters["deposits_amount_cents"]) / 100,
+        "withdrawals_count": counters["withdrawals_count"],
+        "withdrawals_amount": Decimal(counters["withdrawals_amount_cents"]) / 100,
+        "new_users": counters["new_users"],
+        "pending_withdrawals": pending,
+    }
+
+
+async def live_stats_events(
+    interval: int = LIVE_STREAM_INTERVAL,
+    keepalive: int = LIVE_STREAM_KEEPALIVE,
+    duration: int = LIVE_STREAM_DURATION,
+):
+    """
+    Yield SSE events carrying the live counters whenever they change.
+
+    Args:
+        interval (int): Seconds between reads of the counters
+        keepalive (int): Seconds between keepalives while nothing changes
+        duration (int): Seconds before the stream ends and the browser reconnects
+    """
+    yield f"retry: {LIVE_STREAM_RETRY_MS}\n\n"
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    last_data = None
+    last_sent = loop.time()
+    while True:
+        data = json.dumps(await sync_to_async(get_live_stats)(), cls=DjangoJSONEncoder)
+        if data != last_data:
+            yield f"event: stats\ndata: {data}\n\n"
+            last_data = data
+            last_sent = loop.time()
+        elif loop.time() - last_sent >= keepalive:
+            # Comment line keeps proxies from closing an idle connection
+            yield ": keepalive\n\n"
+            last_sent = loop.time()
+
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return
+        await asyncio.sleep(min(interval, remaining))
+
+
+# Signal handlers that feed the counters
+
+
+@receiver(post_save, sender=Transaction)
+def count_completed_deposit(sender, instance, created, **kwargs):
+    """Count deposits as they complete."""
+    if instance.transaction_type != "DEPOSIT" or instance.status != "COMPLETED":
+        return
+
+    loaded = getattr(instance, "_loaded_values", None) or {}
+    if created or loaded.get("status") != "COMPLETED":
+        record_completed_deposits(1, instance.amount)
+
+
+@receiver(post_save, sender=Withdrawal)
+def count_withdrawal(sender, instance, created, **kwargs):
+    """Count withdrawal requests and track how many are pending."""
+    if created:
+        increment_on_commit(
+            {
+                "withdrawals_count": 1,
+                "withdrawals_amount_cents": _to_cents(instance.amount),
+            }
+        )
+        if instance.status == "PENDING":
+            adjust_pending_withdrawals(1)
+        return
+
+    was_pending = getattr(instance, "_loaded_status", None) == "PENDING"
+    is_pending = instance.status == "PENDING"
+    if was_pending != is_pending:
+        adjust_pending_withdrawals(1 if is_pending else -1)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def count_new_user(sender, instance, created, **kwargs):
+    """Count sign-ups."""
+    if created:
+        increment_on_commit({"new_users": 1})
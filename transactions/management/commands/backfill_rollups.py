@@ -0,0 +1,135 @@
+"""Backfill the daily transaction and user rollups."""
+
+from datetime import date, datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from transactions.models import (
+    DailyActiveUser,
+    DailyTransactionRollup,
+    DailyUserRollup,
+    Transaction,
+)
+
+
+class Command(BaseCommand):
+    """Rebuild the rollups for a range of days."""
+
+    help = "Rebuild the daily transaction and user rollups from the raw tables."
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            "--start",
+            help="First day to rebuild (YYYY-MM-DD). Defaults to the first transaction or sign-up.",
+        )
+        parser.add_argument("--end", help="Last day to rebuild (YYYY-MM-DD). Defaults to today.")
+        parser.add_argument(
+            "--days", type=int, default=7, help="Number of days rebuilt per database transaction."
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        start = self._parse_date(options["start"]) if options["start"] else self._first_day()
+        end = self._parse_date(options["end"]) if options["end"] else timezone.localdate()
+        step = timedelta(days=max(options["days"], 1))
+
+        if start is None:
+            self.stdout.write("Nothing to backfill.")
+            return
+        if start > end:
+            raise CommandError("--start must not be after --end")
+
+        window_start = start
+        while window_start <= end:
+            window_end = min(window_start + step, end + timedelta(days=1))
+            self._rebuild(window_start, window_end)
+            self.stdout.write(
+                f"Rebuilt rollups for {window_start} to {window_end - timedelta(days=1)}"
+            )
+            window_start = window_end
+
+        self.stdout.write(self.style.SUCCESS("Rollup backfill complete."))
+
+    def _parse_date(self, value):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Invalid date: {value}")
+
+    def _first_day(self):
+        User = get_user_model()
+        candidates = [
+            Transaction.objects.order_by("created_at").values_list("created_at", flat=True).first(),
+            User.objects.order_by("date_joined").values_list("date_joined", flat=True).first(),
+        ]
+        candidates = [timezone.localdate(value) for value in candidates if value is not None]
+        return min(candidates) if candidates else None
+
+    def _day_start(self, day):
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    @transaction.atomic
+    def _rebuild(self, start, end):
+        """Replace the rollups for the days in [start, end)."""
+        User = get_user_model()
+        day_range = {"date__gte": start, "date__lt": end}
+
+        DailyTransactionRollup.objects.filter(**day_range).delete()
+        DailyUserRollup.objects.filter(**day_range).delete()
+        DailyActiveUser.objects.filter(**day_range).delete()
+
+        start_at, end_at = self._day_start(start), self._day_start(end)
+
+        transactions = (
+            Transaction.objects.filter(created_at__gte=start_at, created_at__lt=end_at)
+            .annotate(day=TruncDate("created_at"))
+            .order_by()
+        )
+
+        DailyTransactionRollup.objects.bulk_create(
+            [
+                DailyTransactionRollup(
+                    date=row["day"],
+                    transaction_type=row["transaction_type"],
+                    status=row["status"],
+                    count=row["count"],
+                    total_amount=row["total_amount"] or 0,
+                )
+                for row in transactions.values("day", "transaction_type", "status").annotate(
+                    count=Count("id"), total_amount=Sum("amount")
+                )
+            ]
+        )
+
+        DailyActiveUser.objects.bulk_create(
+            (
+                DailyActiveUser(date=row["day"], user_id=row["user_id"])
+                for row in transactions.values("day", "user_id").distinct().iterator()
+            ),
+            batch_size=1000,
+        )
+
+        user_rollups = {}
+        for row in (
+            DailyActiveUser.objects.filter(**day_range).values("date").annotate(count=Count("id"))
+        ):
+            user_rollups[row["date"]] = DailyUserRollup(date=row["date"], active_users=row["count"])
+
+        signups = (
+            User.objects.filter(date_joined__gte=start_at, date_joined__lt=end_at)
+            .annotate(day=TruncDate("date_joined"))
+            .order_by()
+            .values("day")
+            .annotate(count=Count("id"))
+        )
+        for row in signups:
+            rollup = user_rollups.setdefault(row["day"], DailyUserRollup(date=row["day"]))
+            rollup.new_users = row["count"]
+
+        DailyUserRollup.objects.bulk_create(user_rollups.values())
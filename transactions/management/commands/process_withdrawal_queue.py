@@ -0,0 +1,78 @@
+"""Process the withdrawal work queue from the command line."""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.workqueue import (
+    DEFAULT_CLAIM_BATCH_SIZE,
+    WITHDRAWAL_ACTIONS,
+    claim_withdrawals,
+    process_withdrawals,
+)
+
+
+class Command(BaseCommand):
+    """Claim and process withdrawals as a staff account."""
+
+    help = (
+        "Drain the withdrawal work queue in batches. Several copies can run in "
+        "parallel with each other and with admins using the queue screen."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            "--operator",
+            required=True,
+            help="Username of the staff account the batches are processed as.",
+        )
+        parser.add_argument(
+            "--action",
+            required=True,
+            choices=sorted(WITHDRAWAL_ACTIONS),
+            help="What to do with each claimed withdrawal.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_CLAIM_BATCH_SIZE,
+            help="Number of withdrawals claimed per batch.",
+        )
+        parser.add_argument(
+            "--max-batches",
+            type=int,
+            default=0,
+            help="Stop after this many batches. Defaults to running until the queue is empty.",
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        User = get_user_model()
+        try:
+            operator = User.objects.get(username=options["operator"], is_staff=True)
+        except User.DoesNotExist:
+            raise CommandError(f"No staff user named {options['operator']}")
+
+        batches = processed = skipped = 0
+        while not options["max_batches"] or batches < options["max_batches"]:
+            claimed = claim_withdrawals(operator, limit=max(options["batch_size"], 1))
+            if not claimed:
+                break
+
+            result = process_withdrawals(
+                [withdrawal.pk for withdrawal in claimed], options["action"], operator
+            )
+            batches += 1
+            processed += len(result["processed"])
+            skipped += len(result["skipped"])
+            self.stdout.write(
+                f"Batch {batches}: {len(result['processed'])} processed, "
+                f"{len(result['skipped'])} skipped"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Withdrawal queue drained: {processed} processed, {skipped} skipped "
+                f"in {batches} batches."
+            )
+        )
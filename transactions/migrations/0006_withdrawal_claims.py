@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0005_daily_rollups"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="withdrawal",
+            name="claimed_by",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Operator or worker currently processing this withdrawal",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="claimed_withdrawals",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="withdrawal",
+            name="claimed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="withdrawal",
+            index=models.Index(fields=["status", "created_at"], name="withdrawal_queue_idx"),
+        ),
+    ]
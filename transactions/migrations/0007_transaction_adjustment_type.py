@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+TRANSACTION_TYPES = [
+    ("DEPOSIT", "Deposit"),
+    ("WITHDRAWAL", "Withdrawal"),
+    ("REFERRAL_BONUS", "Referral Bonus"),
+    ("SUBSCRIPTION_PAYMENT", "Subscription Payment"),
+    ("QUEUE_PAYMENT", "Queue Payment"),
+    ("ADJUSTMENT", "Balance Adjustment"),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transactions", "0006_withdrawal_claims"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transaction",
+            name="transaction_type",
+            field=models.CharField(choices=TRANSACTION_TYPES, max_length=20),
+        ),
+        migrations.AlterField(
+            model_name="dailytransactionrollup",
+            name="transaction_type",
+            field=models.CharField(choices=TRANSACTION_TYPES, max_length=20),
+        ),
+    ]
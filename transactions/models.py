@@ -19,6 +19,7 @@ class Transaction(models.Model):
         ('REFERRAL_BONUS', 'Referral Bonus'),
         ('SUBSCRIPTION_PAYMENT', 'Subscription Payment'),
         ('QUEUE_PAYMENT', 'Queue Payment'),
+        ('ADJUSTMENT', 'Balance Adjustment'),
     ]
 
     STATUS_CHOICES = [
@@ -37,6 +38,32 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the values the transaction was loaded with.
+
+        The rollup signal handlers compare against these to move a transaction
+        between (type, status) buckets when it is updated.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        """
+        Save the transaction and reset the remembered values.
+
+        post_save handlers run inside ``super().save()`` and still see the
+        previous values in ``_loaded_values``.
+        """
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            'transaction_type': self.transaction_type,
+            'status': self.status,
+            'amount': self.amount,
+        }
+
     def __str__(self) -> str:
         """
         Return a string representation of the transaction.
@@ -75,6 +102,69 @@ class Withdrawal(models.Model):
     wallet = models.ForeignKey('subscriptions.Wallet', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     processed_at = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='claimed_withdrawals',
+        help_text="Operator or worker currently processing this withdrawal"
+    )
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='withdrawal_queue_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the status the withdrawal was loaded with.
+
+        Used by the live dashboard counters to track pending withdrawals.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = dict(zip(field_names, values)).get('status')
+        return instance
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        """
+        Save the withdrawal and reset the remembered status.
+        """
+        super().save(*args, **kwargs)
+        self._loaded_status = self.status
+
+    def approve(self, processed_by: Optional[Any] = None) -> None:
+        """
+        Approve the withdrawal and complete its transaction.
+
+        Args:
+            processed_by (Optional[User]): The operator approving the withdrawal
+
+        Raises:
+            ValueError: If the withdrawal is not pending or is claimed by someone else
+        """
+        self._process('approve', processed_by)
+
+    def reject(self, processed_by: Optional[Any] = None) -> None:
+        """
+        Reject the withdrawal, fail its transaction and refund the wallet.
+
+        Args:
+            processed_by (Optional[User]): The operator rejecting the withdrawal
+
+        Raises:
+            ValueError: If the withdrawal is not pending or is claimed by someone else
+        """
+        self._process('reject', processed_by)
+
+    def _process(self, action: str, processed_by: Optional[Any]) -> None:
+        from .workqueue import process_withdrawals
+
+        result = process_withdrawals([self.pk], action, processed_by)
+        if self.pk not in result['processed']:
+            raise ValueError(f"Cannot {action} withdrawal {self.pk}: it is not pending or is being processed")
+
+        self.refresh_from_db(fields=['status', 'processed_at', 'claimed_by', 'claimed_at'])
+        self._loaded_status = self.status
 
     def __str__(self) -> str:
         """
@@ -84,3 +174,68 @@ class Withdrawal(models.Model):
             str: The username, amount, and withdrawal type
         """
         return f"{self.user.username} - ${self.amount} - {self.get_withdrawal_type_display()}"
+
+class DailyTransactionRollup(models.Model):
+    """
+    Pre-aggregated transaction totals for one day, type and status.
+
+    Rows are maintained incrementally as transactions are saved (see
+    transactions.rollups) and can be rebuilt with the backfill_rollups
+    management command. Dashboards and the time-series API read these
+    instead of scanning the transaction table.
+    """
+    date = models.DateField()
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    status = models.CharField(max_length=20, choices=Transaction.STATUS_CHOICES)
+    count = models.BigIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['date']
+        unique_together = [['date', 'transaction_type', 'status']]
+
+    def __str__(self) -> str:
+        """
+        Return a string representation of the rollup.
+
+        Returns:
+            str: The date, transaction type, status and count
+        """
+        return f"{self.date} - {self.transaction_type}/{self.status} - {self.count}"
+
+class DailyUserRollup(models.Model):
+    """
+    Pre-aggregated user activity for one day.
+
+    ``new_users`` counts sign-ups and ``active_users`` counts distinct users
+    with at least one transaction created on that day.
+    """
+    date = models.DateField(unique=True)
+    new_users = models.IntegerField(default=0)
+    active_users = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self) -> str:
+        """
+        Return a string representation of the rollup.
+
+        Returns:
+            str: The date with new and active user counts
+        """
+        return f"{self.date} - {self.new_users} new, {self.active_users} active"
+
+class DailyActiveUser(models.Model):
+    """
+    Marks a user as active on a day.
+
+    Used to keep ``DailyUserRollup.active_users`` distinct and to count
+    distinct active users over multi-day periods.
+    """
+    date = models.DateField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = [['date', 'user']]
+
@@ -0,0 +1,338 @@
+"""
+Daily rollups for the admin dashboards.
+
+Transaction and user saves incrementally maintain ``DailyTransactionRollup``,
+``DailyUserRollup`` and ``DailyActiveUser`` so that dashboard totals and the
+time-series API read a handful of small rows instead of scanning the
+transaction and user tables. Code that changes transactions with
+``QuerySet.update()`` or ``bulk_update()`` bypasses the signal handlers below
+and must call ``record_transaction_changes`` itself.
+
+Every rollup write is deferred until the caller's transaction commits and
+then runs on its own. Many writers update the same daily row, so holding
+its lock for the rest of the writer's transaction would serialize them.
+Rolled-back changes are never counted.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import partial
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    DailyActiveUser,
+    DailyTransactionRollup,
+    DailyUserRollup,
+    Transaction,
+)
+
+logger = logging.getLogger("agape.transactions")
+
+
+def _to_date(value: Any) -> date:
+    """Return the local date of a datetime, or the value itself if it is a date."""
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _increment(model, lookup: Dict[str, Any], **deltas: Any) -> None:
+    """Add deltas to a rollup row once the current transaction commits."""
+    transaction.on_commit(partial(_apply_increment, model, lookup, deltas))
+
+
+def _apply_increment(model, lookup: Dict[str, Any], deltas: Dict[str, Any]) -> None:
+    """Add deltas to a rollup row, creating it if this is the first event for the key."""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # Another writer created the row first
+        model.objects.filter(**lookup).update(**updates)
+
+
+def record_transaction(
+    day: date, transaction_type: str, status: str, count: int, amount: Decimal
+) -> None:
+    """
+    Add a count and amount to a day's (type, status) bucket.
+
+    Args:
+        day (date): The day the transaction was created
+        transaction_type (str): The transaction type
+        status (str): The transaction status
+        count (int): Number of transactions to add (negative to remove)
+        amount (Decimal): Amount to add (negative to remove)
+    """
+    _increment(
+        DailyTransactionRollup,
+        {"date": day, "transaction_type": transaction_type, "status": status},
+        count=count,
+        total_amount=amount,
+    )
+
+
+def record_transaction_change(instance: Transaction, old_status: str) -> None:
+    """
+    Move a transaction from its old status bucket to its current one.
+
+    Args:
+        instance (Transaction): The transaction with its new status
+        old_status (str): The status the rollups currently count it under
+    """
+    record_transaction_changes([(instance, old_status)])
+
+
+def record_transaction_changes(changes: Iterable[Tuple[Transaction, str]]) -> None:
+    """
+    Move a batch of transactions between status buckets.
+
+    Bulk status updates, which do not send post_save, call this once for the
+    whole batch. Changes to the same bucket are summed first, so the number
+    of rollup writes depends on the number of buckets, not rows.
+
+    Args:
+        changes (Iterable[Tuple[Transaction, str]]): Pairs of a transaction with its new
+            status and the status the rollups currently count it under
+    """
+    deltas: Dict[Tuple[date, str, str], List[Any]] = defaultdict(lambda: [0, Decimal("0.00")])
+    for instance, old_status in changes:
+        if old_status == instance.status:
+            continue
+        day = _to_date(instance.created_at)
+        old_bucket = deltas[(day, instance.transaction_type, old_status)]
+        old_bucket[0] -= 1
+        old_bucket[1] -= instance.amount
+        new_bucket = deltas[(day, instance.transaction_type, instance.status)]
+        new_bucket[0] += 1
+        new_bucket[1] += instance.amount
+
+    for (day, transaction_type, status), (count, amount) in deltas.items():
+        if count or amount:
+            record_transaction(day, transaction_type, status, count, amount)
+
+
+def mark_user_active(user_id: int, day: date) -> None:
+    """
+    Count a user as active on a day, once.
+
+    Args:
+        user_id (int): The ID of the user
+        day (date): The day the user was active
+    """
+    transaction.on_commit(partial(_apply_user_active, user_id, day))
+
+
+def _apply_user_active(user_id: int, day: date) -> None:
+    with transaction.atomic():
+        _, created = DailyActiveUser.objects.get_or_create(date=day, user_id=user_id)
+        if created:
+            _apply_increment(DailyUserRollup, {"date": day}, {"active_users": 1})
+
+
+def record_new_user(day: date) -> None:
+    """
+    Count a sign-up.
+
+    Args:
+        day (date): The day the user joined
+    """
+    _increment(DailyUserRollup, {"date": day}, new_users=1)
+
+
+def period_totals(start: date, end: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Summarise the rollups between two dates.
+
+    Args:
+        start (date): First day of the period (inclusive)
+        end (Optional[date]): Last day of the period (exclusive); open-ended if omitted
+
+    Returns:
+        Dict[str, Any]: Deposit, withdrawal, transaction and user totals for the period
+    """
+    date_filter = Q(date__gte=start)
+    if end is not None:
+        date_filter &= Q(date__lt=end)
+
+    deposits = Q(transaction_type="DEPOSIT", status="COMPLETED")
+    withdrawals = Q(transaction_type="WITHDRAWAL", status="COMPLETED")
+    totals = DailyTransactionRollup.objects.filter(date_filter).aggregate(
+        deposits_count=Sum("count", filter=deposits),
+        deposits_amount=Sum("total_amount", filter=deposits),
+        withdrawals_count=Sum("count", filter=withdrawals),
+        withdrawals_amount=Sum("total_amount", filter=withdrawals),
+        transactions_count=Sum("count"),
+    )
+    totals["new_users"] = DailyUserRollup.objects.filter(date_filter).aggregate(
+        total=Sum("new_users")
+    )["total"]
+
+    # A single day can read the maintained distinct count directly
+    if end is not None and end - start == timedelta(days=1):
+        totals["active_users"] = (
+            DailyUserRollup.objects.filter(date=start)
+            .values_list("active_users", flat=True)
+            .first()
+        )
+    else:
+        totals["active_users"] = DailyActiveUser.objects.filter(date_filter).aggregate(
+            total=Count("user", distinct=True)
+        )["total"]
+
+    for key, value in totals.items():
+        if value is None:
+            totals[key] = Decimal("0.00") if key.endswith("_amount") else 0
+    return totals
+
+
+def lifetime_totals(transaction_type: str) -> Dict[str, Any]:
+    """
+    Return the all-time count and amount for a transaction type, across statuses.
+
+    Args:
+        transaction_type (str): The transaction type
+
+    Returns:
+        Dict[str, Any]: The 'count' and 'amount' totals
+    """
+    totals = DailyTransactionRollup.objects.filter(transaction_type=transaction_type).aggregate(
+        count=Sum("count"), amount=Sum("total_amount")
+    )
+    return {
+        "count": totals["count"] or 0,
+        "amount": totals["amount"] or Decimal("0.00"),
+    }
+
+
+TIMESERIES_BUCKETS = {
+    "day": None,
+    "week": TruncWeek,
+    "month": TruncMonth,
+}
+
+TIMESERIES_METRICS = {
+    "deposits": Q(transaction_type="DEPOSIT", status="COMPLETED"),
+    "withdrawals": Q(transaction_type="WITHDRAWAL", status="COMPLETED"),
+    "referral_bonuses": Q(transaction_type="REFERRAL_BONUS", status="COMPLETED"),
+    "transactions": Q(),
+    "new_users": None,
+    "active_users": None,
+}
+
+
+def timeseries(metric: str, bucket: str, start: date, end: date) -> List[Dict[str, Any]]:
+    """
+    Return a metric bucketed by day, week or month, read from the rollups.
+
+    Args:
+        metric (str): One of TIMESERIES_METRICS
+        bucket (str): One of TIMESERIES_BUCKETS
+        start (date): First day to include
+        end (date): Last day to include
+
+    Returns:
+        List[Dict[str, Any]]: One point per non-empty bucket, oldest first
+
+    Raises:
+        ValueError: If the metric or bucket is not supported
+    """
+    if metric not in TIMESERIES_METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+    if bucket not in TIMESERIES_BUCKETS:
+        raise ValueError(f"Unknown bucket: {bucket}")
+
+    trunc = TIMESERIES_BUCKETS[bucket]
+    bucket_expression = trunc("date") if trunc else F("date")
+
+    if metric == "active_users":
+        # Distinct users per bucket, so weeks and months don't double count
+        rows = (
+            DailyActiveUser.objects.filter(date__gte=start, date__lte=end)
+            .annotate(bucket=bucket_expression)
+            .values("bucket")
+            .annotate(count=Count("user", distinct=True))
+            .order_by("bucket")
+        )
+        return [{"bucket": row["bucket"].isoformat(), "count": row["count"]} for row in rows]
+
+    if metric == "new_users":
+        rows = (
+            DailyUserRollup.objects.filter(date__gte=start, date__lte=end)
+            .annotate(bucket=bucket_expression)
+            .values("bucket")
+            .annotate(count=Sum("new_users"))
+            .order_by("bucket")
+        )
+        return [{"bucket": row["bucket"].isoformat(), "count": row["count"] or 0} for row in rows]
+
+    rows = (
+        DailyTransactionRollup.objects.filter(
+            TIMESERIES_METRICS[metric], date__gte=start, date__lte=end
+        )
+        .annotate(bucket=bucket_expression)
+        .values("bucket")
+        .annotate(count=Sum("count"), amount=Sum("total_amount"))
+        .order_by("bucket")
+    )
+    return [
+        {
+            "bucket": row["bucket"].isoformat(),
+            "count": row["count"] or 0,
+            "amount": str((row["amount"] or Decimal("0")).quantize(Decimal("0.01"))),
+        }
+        for row in rows
+    ]
+
+
+# Signal handlers that keep the rollups current
+
+
+@receiver(post_save, sender=Transaction)
+def update_rollups_on_transaction_save(sender, instance, created, **kwargs):
+    """Add new transactions to the rollups and re-bucket changed ones."""
+    day = _to_date(instance.created_at)
+    loaded = getattr(instance, "_loaded_values", None)
+
+    if created:
+        record_transaction(day, instance.transaction_type, instance.status, 1, instance.amount)
+        mark_user_active(instance.user_id, day)
+    elif loaded is not None:
+        old_key = (loaded.get("transaction_type"), loaded.get("status"), loaded.get("amount"))
+        new_key = (instance.transaction_type, instance.status, instance.amount)
+        if None not in old_key and old_key != new_key:
+            record_transaction(day, old_key[0], old_key[1], -1, -old_key[2])
+            record_transaction(day, new_key[0], new_key[1], 1, new_key[2])
+
+
+@receiver(post_delete, sender=Transaction)
+def update_rollups_on_transaction_delete(sender, instance, **kwargs):
+    """Remove deleted transactions from the rollups."""
+    record_transaction(
+        _to_date(instance.created_at),
+        instance.transaction_type,
+        instance.status,
+        -1,
+        -instance.amount,
+    )
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def update_rollups_on_user_signup(sender, instance, created, **kwargs):
+    """Count new sign-ups."""
+    if created:
+        record_new_user(_to_date(instance.date_joined))
@@ -3,8 +3,16 @@ from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
+from django.core.management import call_command
+from django.utils import timezone
+from datetime import timedelta
 from decimal import Decimal
-from .models import Transaction, Withdrawal
+import io
+from .models import Transaction, Withdrawal, DailyTransactionRollup, DailyUserRollup, DailyActiveUser
+from .rollups import period_totals
+from .live import get_live_stats
+from .workqueue import claim_withdrawals, process_withdrawals
+from django.core.cache import cache
 from subscriptions.models import Plan, Subscription, Wallet
 
 User = get_user_model()
@@ -349,3 +357,408 @@ class WithdrawalAPITests(APITestCase):
         # Check that the amount was refunded to the wallet
         self.wallet.refresh_from_db()
         self.assertEqual(self.wallet.balance, Decimal('300.00'))  # 200 + 100
+
+class DailyRollupTests(TestCase):
+    """
+    Test suite for the daily dashboard rollups
+    """
+
+    def setUp(self):
+        """
+        Set up test data
+        """
+        # Rollups are written once the writer's transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user(
+                username="rollupuser",
+                email="rollup@example.com",
+                password="testpassword123"
+            )
+            self.admin_user = User.objects.create_user(
+                username="rollupadmin",
+                email="rollupadmin@example.com",
+                password="adminpassword123",
+                is_staff=True
+            )
+        self.today = timezone.localdate()
+
+    def create_transaction(self, transaction_type, amount, status='COMPLETED'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Transaction.objects.create(
+                user=self.user,
+                transaction_type=transaction_type,
+                amount=Decimal(amount),
+                status=status,
+                transaction_id=f"ROLL-{Transaction.objects.count()}",
+                description="Rollup test"
+            )
+
+    def test_rollups_follow_transaction_saves(self):
+        """
+        Test that creating and updating transactions maintains the rollups
+        """
+        self.create_transaction('DEPOSIT', '100.00')
+        pending = self.create_transaction('DEPOSIT', '50.00', status='PENDING')
+
+        totals = period_totals(self.today, self.today + timedelta(days=1))
+        self.assertEqual(totals['deposits_count'], 1)
+        self.assertEqual(totals['deposits_amount'], Decimal('100.00'))
+        self.assertEqual(totals['transactions_count'], 2)
+        self.assertEqual(totals['active_users'], 1)
+        self.assertEqual(totals['new_users'], 2)
+
+        pending = Transaction.objects.get(pk=pending.pk)
+        pending.status = 'COMPLETED'
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.save()
+
+        totals = period_totals(self.today, self.today + timedelta(days=1))
+        self.assertEqual(totals['deposits_count'], 2)
+        self.assertEqual(totals['deposits_amount'], Decimal('150.00'))
+        self.assertEqual(totals['transactions_count'], 2)
+
+    def test_rollups_are_written_after_commit(self):
+        """
+        Test that the rollup rows aren't touched inside the writer's transaction
+        """
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Transaction.objects.create(
+                user=self.user,
+                transaction_type='DEPOSIT',
+                amount=Decimal('10.00'),
+                status='COMPLETED',
+                transaction_id="ROLL-UNCOMMITTED",
+                description="Rollup test"
+            )
+
+        self.assertFalse(DailyTransactionRollup.objects.exists())
+        self.assertFalse(DailyActiveUser.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(DailyTransactionRollup.objects.get().total_amount, Decimal('10.00'))
+        self.assertTrue(DailyActiveUser.objects.filter(user=self.user).exists())
+
+    def test_backfill_matches_incremental_rollups(self):
+        """
+        Test that the backfill command rebuilds the same totals
+        """
+        self.create_transaction('DEPOSIT', '100.00')
+        self.create_transaction('WITHDRAWAL', '30.00')
+        expected = period_totals(self.today, self.today + timedelta(days=1))
+
+        DailyTransactionRollup.objects.all().delete()
+        DailyUserRollup.objects.all().delete()
+        DailyActiveUser.objects.all().delete()
+        call_command('backfill_rollups', stdout=io.StringIO())
+
+        self.assertEqual(period_totals(self.today, self.today + timedelta(days=1)), expected)
+
+    def test_timeseries_api(self):
+        """
+        Test that the time-series endpoint buckets rollup data
+        """
+        self.create_transaction('DEPOSIT', '100.00')
+        self.create_transaction('DEPOSIT', '25.00')
+        self.client.force_login(self.admin_user)
+
+        response = self.client.get(
+            reverse('transactions:dashboard_timeseries'), {'metric': 'deposits', 'bucket': 'day'}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['points'], [
+            {'bucket': self.today.isoformat(), 'count': 2, 'amount': '125.00'}
+        ])
+
+        response = self.client.get(reverse('transactions:dashboard_timeseries'), {'metric': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class LiveStatsTests(TestCase):
+    """
+    Test suite for the live dashboard counters
+    """
+
+    def setUp(self):
+        """
+        Set up test data
+        """
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create_user(
+                username="liveuser",
+                email="live@example.com",
+                password="testpassword123"
+            )
+        self.admin_user = User.objects.create_user(
+            username="liveadmin",
+            email="liveadmin@example.com",
+            password="adminpassword123",
+            is_staff=True
+        )
+        self.wallet = Wallet.objects.create(user=self.user, wallet_type='FUNDING', balance=Decimal("500.00"))
+
+    def test_counters_follow_commits(self):
+        """
+        Test that deposits, withdrawals and sign-ups are counted after commit
+        """
+        self.assertEqual(get_live_stats()['pending_withdrawals'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deposit = Transaction.objects.create(
+                user=self.user,
+                transaction_type="DEPOSIT",
+                amount=Decimal("40.00"),
+                status="PENDING",
+                transaction_id="LIVE-1"
+            )
+            withdrawal = Withdrawal.objects.create(
+                user=self.user,
+                amount=Decimal("25.50"),
+                withdrawal_type="WALLET",
+                wallet=self.wallet,
+                transaction=Transaction.objects.create(
+                    user=self.user,
+                    transaction_type="WITHDRAWAL",
+                    amount=Decimal("25.50"),
+                    status="PENDING",
+                    transaction_id="LIVE-W1"
+                )
+            )
+
+        stats = get_live_stats()
+        self.assertEqual(stats['deposits_count'], 0)
+        self.assertEqual(stats['withdrawals_count'], 1)
+        self.assertEqual(stats['withdrawals_amount'], Decimal("25.50"))
+        self.assertEqual(stats['new_users'], 1)
+        self.assertEqual(stats['pending_withdrawals'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            deposit.status = "COMPLETED"
+            deposit.save()
+            # Saving again without a status change must not count twice
+            deposit.save()
+            withdrawal.status = "APPROVED"
+            withdrawal.save()
+
+        stats = get_live_stats()
+        self.assertEqual(stats['deposits_count'], 1)
+        self.assertEqual(stats['deposits_amount'], Decimal("40.00"))
+        self.assertEqual(stats['pending_withdrawals'], 0)
+
+    def test_rolled_back_saves_are_not_counted(self):
+        """
+        Test that nothing is counted until the transaction commits
+        """
+        with self.captureOnCommitCallbacks(execute=False):
+            Transaction.objects.create(
+                user=self.user,
+                transaction_type="DEPOSIT",
+                amount=Decimal("10.00"),
+                status="COMPLETED",
+                transaction_id="LIVE-2"
+            )
+
+        self.assertEqual(get_live_stats()['deposits_count'], 0)
+
+    def test_live_stats_endpoint(self):
+        """
+        Test that the polled live stats are staff-only and return the counters
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('transactions:live_dashboard_stats'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('transactions:live_dashboard_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stats']['new_users'], 1)
+
+    async def test_live_stats_stream(self):
+        """
+        Test that the live stats stream is staff-only and starts with the counters
+        """
+        import json
+
+        url = reverse('transactions:live_dashboard_stream')
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+        await self.async_client.aforce_login(self.admin_user)
+        with self.settings(NOTIFICATION_PUSH_ENABLED=True):
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            events = aiter(response.streaming_content)
+            self.assertTrue((await anext(events)).startswith(b'retry:'))
+            event = (await anext(events)).decode()
+        self.assertTrue(event.startswith('event: stats\n'))
+        self.assertEqual(json.loads(event.split('data: ', 1)[1])['new_users'], 1)
+
+    def test_live_stats_stream_falls_back_to_polling(self):
+        """
+        Test that the stream ends at once under WSGI and the dashboard polls instead
+        """
+        self.client.force_login(self.admin_user)
+        url = reverse('transactions:live_dashboard_stream')
+
+        self.assertEqual(self.client.get(url).status_code, 204)
+        with self.settings(NOTIFICATION_PUSH_ENABLED=True):
+            self.assertEqual(self.client.get(url).status_code, 204)
+
+        response = self.client.get(reverse('transactions:admin_dashboard'))
+        self.assertNotContains(response, url)
+        self.assertContains(response, reverse('transactions:live_dashboard_stats'))
+
+
+class WithdrawalQueueTests(TestCase):
+    """
+    Test suite for the withdrawal work queue
+    """
+
+    def setUp(self):
+        """
+        Set up test data
+        """
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="queueuser",
+            email="queue@example.com",
+            password="testpassword123"
+        )
+        self.operator = User.objects.create_user(
+            username="operator1",
+            email="operator1@example.com",
+            password="adminpassword123",
+            is_staff=True
+        )
+        self.other_operator = User.objects.create_user(
+            username="operator2",
+            email="operator2@example.com",
+            password="adminpassword123",
+            is_staff=True
+        )
+        self.wallet = Wallet.objects.create(user=self.user, wallet_type='FUNDING', balance=Decimal("0.00"))
+        self.withdrawals = [self.create_withdrawal(index, "10.00") for index in range(4)]
+
+    def create_withdrawal(self, index, amount):
+        transaction_obj = Transaction.objects.create(
+            user=self.user,
+            transaction_type="WITHDRAWAL",
+            amount=Decimal(amount),
+            status="PENDING",
+            transaction_id=f"QUEUE-{index}",
+            description="Queue test"
+        )
+        return Withdrawal.objects.create(
+            user=self.user,
+            amount=Decimal(amount),
+            withdrawal_type="WALLET",
+            wallet=self.wallet,
+            transaction=transaction_obj
+        )
+
+    def test_claims_do_not_overlap(self):
+        """
+        Test that operators claim disjoint batches and can't process each other's claims
+        """
+        first = claim_withdrawals(self.operator, limit=3)
+        second = claim_withdrawals(self.other_operator, limit=3)
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({w.pk for w in first} & {w.pk for w in second})
+
+        result = process_withdrawals([first[0].pk], 'approve', self.other_operator)
+        self.assertEqual(result['processed'], [])
+        self.assertEqual(result['skipped'], [first[0].pk])
+
+    def test_bulk_approve_and_reject(self):
+        """
+        Test that a batch updates withdrawals, transactions, refunds and rollups
+        """
+        from subscriptions.cache import get_wallet_balance
+
+        ids = [w.pk for w in claim_withdrawals(self.operator)]
+        # Cache the balance so the refund has to invalidate it
+        self.assertEqual(get_wallet_balance(self.user.pk, 'FUNDING'), Decimal("0.00"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = process_withdrawals(ids[:2], 'approve', self.operator)
+        self.assertEqual(result['processed'], ids[:2])
+        with self.captureOnCommitCallbacks(execute=True):
+            result = process_withdrawals(ids[2:], 'reject', self.operator)
+        self.assertEqual(result['processed'], ids[2:])
+        self.assertEqual(get_wallet_balance(self.user.pk, 'FUNDING'), Decimal("20.00"))
+
+        statuses = dict(Withdrawal.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[pk] for pk in ids], ['APPROVED', 'APPROVED', 'REJECTED', 'REJECTED'])
+        self.assertFalse(Withdrawal.objects.filter(claimed_by__isnull=False).exists())
+        self.assertEqual(Transaction.objects.filter(status='COMPLETED').count(), 2)
+        self.assertEqual(Transaction.objects.filter(status='FAILED', completed_at__isnull=False).count(), 2)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("20.00"))
+
+        today = timezone.localdate()
+        totals = period_totals(today, today + timedelta(days=1))
+        self.assertEqual(totals['withdrawals_count'], 2)
+        self.assertEqual(totals['withdrawals_amount'], Decimal("20.00"))
+
+        # Processing again is a no-op
+        result = process_withdrawals(ids, 'reject', self.operator)
+        self.assertEqual(result['processed'], [])
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("20.00"))
+
+    def test_queue_api(self):
+        """
+        Test claiming and processing through the JSON API
+        """
+        self.client.force_login(self.operator)
+
+        response = self.client.post(
+            reverse('transactions:withdrawal_queue_claim'), {'limit': 2}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        claimed = [w['id'] for w in response.json()['withdrawals']]
+        self.assertEqual(claimed, [w.pk for w in self.withdrawals[:2]])
+
+        response = self.client.post(
+            reverse('transactions:withdrawal_queue_process'),
+            {'ids': claimed, 'action': 'approve'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.json()['processed'], claimed)
+
+        response = self.client.post(
+            reverse('transactions:withdrawal_queue_process'),
+            {'ids': claimed, 'action': 'delete'},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+        # Bodies that aren't JSON objects, and scalar ids, are rejected rather than crashing
+        for name, body in [
+            ('withdrawal_queue_claim', '[1, 2]'),
+            ('withdrawal_queue_process', '"approve"'),
+            ('withdrawal_queue_release', 'not json'),
+            ('withdrawal_queue_process', '{"ids": "12", "action": "approve"}'),
+        ]:
+            response = self.client.post(reverse(f'transactions:{name}'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, (name, body))
+            self.assertEqual(response.json()['status'], 'error')
+
+    def test_drain_command(self):
+        """
+        Test that the management command drains the queue in batches
+        """
+        out = io.StringIO()
+        call_command(
+            'process_withdrawal_queue', operator='operator1', action='approve', batch_size=3, stdout=out
+        )
+
+        self.assertFalse(Withdrawal.objects.filter(status='PENDING').exists())
+        self.assertIn('4 processed, 0 skipped in 2 batches', out.getvalue())
@@ -14,4 +14,10 @@ urlpatterns = [
     path('withdrawals/<int:pk>/approve/', views.approve_withdrawal, name='withdrawal_approve'),
     path('withdrawals/<int:pk>/reject/', views.reject_withdrawal, name='reject_withdrawal'),
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('admin/timeseries/', views.dashboard_timeseries, name='dashboard_timeseries'),
+    path('admin/live/', views.live_dashboard_stats, name='live_dashboard_stats'),
+    path('admin/live/stream/', views.live_dashboard_stream, name='live_dashboard_stream'),
+    path('admin/withdrawals/queue/claim/', views.withdrawal_queue_claim, name='withdrawal_queue_claim'),
+    path('admin/withdrawals/queue/process/', views.withdrawal_queue_process, name='withdrawal_queue_process'),
+    path('admin/withdrawals/queue/release/', views.withdrawal_queue_release, name='withdrawal_queue_release'),
 ] 
\ No newline at end of file
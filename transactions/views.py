@@ -2,16 +2,25 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.db import transaction
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.views.decorators.http import require_http_methods
 from .models import Transaction, Withdrawal
 from .forms import WithdrawalForm
+import json
 import logging
-from datetime import timedelta
+from datetime import date, timedelta
 from django.db.models import Sum, Count
 from django.contrib.auth import get_user_model
+from core.counts import approximate_count
+from .rollups import TIMESERIES_BUCKETS, TIMESERIES_METRICS, period_totals, timeseries
+from .live import get_live_stats, live_stats_events
+from .workqueue import DEFAULT_CLAIM_BATCH_SIZE, WITHDRAWAL_ACTIONS, claim_withdrawals, process_withdrawals, release_withdrawals
 
 # Get a logger for this module
 logger = logging.getLogger('agape.transactions')
@@ -95,15 +104,8 @@ def approve_withdrawal(request, pk):
             )
             return redirect('transactions:withdrawal_detail', pk=pk)
 
-        with transaction.atomic():
-            withdrawal.status = 'APPROVED'
-            withdrawal.processed_at = timezone.now()
-            withdrawal.save()
-
-            # Update transaction status
-            withdrawal.transaction.status = 'COMPLETED'
-            withdrawal.transaction.completed_at = timezone.now()
-            withdrawal.transaction.save()
+        # Locks the row through the work queue so two operators can't both process it
+        withdrawal.approve(processed_by=request.user)
 
         logger.info(
             f"Withdrawal approved: id={withdrawal.id}, user={withdrawal.user.username}, "
@@ -130,15 +132,8 @@ def reject_withdrawal(request, pk):
             )
             return redirect('transactions:withdrawal_detail', pk=pk)
 
-        with transaction.atomic():
-            withdrawal.status = 'REJECTED'
-            withdrawal.processed_at = timezone.now()
-            withdrawal.save()
-
-            # Update transaction status
-            withdrawal.transaction.status = 'FAILED'
-            withdrawal.transaction.completed_at = timezone.now()
-            withdrawal.transaction.save()
+        # Locks the row through the work queue and refunds the wallet
+        withdrawal.reject(processed_by=request.user)
 
         logger.info(
             f"Withdrawal rejected: id={withdrawal.id}, user={withdrawal.user.username}, "
@@ -174,50 +169,27 @@ def admin_dashboard(request):
         start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
         prev_start_date = start_date - timedelta(days=1)
     
-    # Get total users
+    # Get total users (estimated on large tables)
     User = get_user_model()
-    total_users = User.objects.count()
-    
-    # Get total deposits
-    deposits = Transaction.objects.filter(
-        transaction_type='DEPOSIT',
-        status='COMPLETED',
-        created_at__gte=start_date
-    )
-    total_deposits = deposits.count()
-    total_deposits_amount = deposits.aggregate(total=Sum('amount'))['total'] or 0
+    total_users = approximate_count(User)
     
-    # Get previous period deposits
-    prev_deposits = Transaction.objects.filter(
-        transaction_type='DEPOSIT',
-        status='COMPLETED',
-        created_at__gte=prev_start_date,
-        created_at__lt=start_date
-    )
-    prev_deposits_amount = prev_deposits.aggregate(total=Sum('amount'))['total'] or 0
+    # Period totals come from the daily rollups rather than the raw tables
+    end_date = timezone.localdate(now) + timedelta(days=1)
+    current = period_totals(timezone.localdate(start_date), end_date)
+    previous = period_totals(timezone.localdate(prev_start_date), timezone.localdate(start_date))
+
+    total_deposits = current['deposits_count']
+    total_deposits_amount = current['deposits_amount']
+    prev_deposits_amount = previous['deposits_amount']
     
     # Calculate deposits percentage change
     deposits_percent_change = 0
     if prev_deposits_amount > 0:
         deposits_percent_change = ((total_deposits_amount - prev_deposits_amount) / prev_deposits_amount) * 100
     
-    # Get total withdrawals
-    withdrawals = Transaction.objects.filter(
-        transaction_type='WITHDRAWAL',
-        status='COMPLETED',
-        created_at__gte=start_date
-    )
-    total_withdrawals = withdrawals.count()
-    total_withdrawals_amount = withdrawals.aggregate(total=Sum('amount'))['total'] or 0
-    
-    # Get previous period withdrawals
-    prev_withdrawals = Transaction.objects.filter(
-        transaction_type='WITHDRAWAL',
-        status='COMPLETED',
-        created_at__gte=prev_start_date,
-        created_at__lt=start_date
-    )
-    prev_withdrawals_amount = prev_withdrawals.aggregate(total=Sum('amount'))['total'] or 0
+    total_withdrawals = current['withdrawals_count']
+    total_withdrawals_amount = current['withdrawals_amount']
+    prev_withdrawals_amount = previous['withdrawals_amount']
     
     # Calculate withdrawals percentage change
     withdrawals_percent_change = 0
@@ -238,53 +210,29 @@ def admin_dashboard(request):
         created_at__gte=start_date
     ).select_related('user').order_by('-created_at')[:10]
     
-    # Get new users count
-    new_users_count = User.objects.filter(
-        date_joined__gte=start_date
-    ).count()
-    
-    # Get previous period new users
-    prev_new_users_count = User.objects.filter(
-        date_joined__gte=prev_start_date,
-        date_joined__lt=start_date
-    ).count()
+    new_users_count = current['new_users']
+    prev_new_users_count = previous['new_users']
     
     # Calculate new users percentage change
     new_users_percent_change = 0
     if prev_new_users_count > 0:
         new_users_percent_change = ((new_users_count - prev_new_users_count) / prev_new_users_count) * 100
     
-    # Get active users count (users with transactions in the period)
-    active_users_count = User.objects.filter(
-        transaction__created_at__gte=start_date
-    ).distinct().count()
-    
-    # Get previous period active users
-    prev_active_users_count = User.objects.filter(
-        transaction__created_at__gte=prev_start_date,
-        transaction__created_at__lt=start_date
-    ).distinct().count()
+    # Active users are users with transactions in the period
+    active_users_count = current['active_users']
+    prev_active_users_count = previous['active_users']
     
     # Calculate active users percentage change
     active_users_percent_change = 0
     if prev_active_users_count > 0:
         active_users_percent_change = ((active_users_count - prev_active_users_count) / prev_active_users_count) * 100
     
-    # Get pending withdrawals
-    pending_withdrawals = Withdrawal.objects.filter(
-        status='PENDING'
-    ).count()
-    
-    # Get total transactions
-    total_transactions = Transaction.objects.filter(
-        created_at__gte=start_date
-    ).count()
+    # Pending withdrawals come from the live counters
+    live_stats = get_live_stats()
+    pending_withdrawals = live_stats['pending_withdrawals']
     
-    # Get previous period transactions
-    prev_total_transactions = Transaction.objects.filter(
-        created_at__gte=prev_start_date,
-        created_at__lt=start_date
-    ).count()
+    total_transactions = current['transactions_count']
+    prev_total_transactions = previous['transactions_count']
     
     # Calculate transactions percentage change
     transactions_percent_change = 0
@@ -300,12 +248,176 @@ def admin_dashboard(request):
         'total_withdrawals_amount': total_withdrawals_amount,
         'withdrawals_percent_change': withdrawals_percent_change,
         'net_revenue': net_revenue,
+        'net_revenue_percent_change': net_revenue_percent_change,
         'recent_activities': recent_activities,
         'new_users_count': new_users_count,
+        'new_users_percent_change': new_users_percent_change,
         'active_users_count': active_users_count,
+        'active_users_percent_change': active_users_percent_change,
         'pending_withdrawals': pending_withdrawals,
         'total_transactions': total_transactions,
+        'transactions_percent_change': transactions_percent_change,
         'period': period,
+        'live_stats': live_stats,
     }
     
     return render(request, 'admin/dashboard.html', context)
+
+@user_passes_test(lambda u: u.is_staff)
+def dashboard_timeseries(request):
+    """JSON time series for dashboard charts, read from the daily rollups."""
+    metric = request.GET.get('metric', 'deposits')
+    bucket = request.GET.get('bucket', 'day')
+
+    if metric not in TIMESERIES_METRICS or bucket not in TIMESERIES_BUCKETS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f"metric must be one of {sorted(TIMESERIES_METRICS)} and "
+                       f"bucket one of {sorted(TIMESERIES_BUCKETS)}"
+        }, status=400)
+
+    try:
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else timezone.localdate()
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else end - timedelta(days=29)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Dates must be YYYY-MM-DD'}, status=400)
+
+    return JsonResponse({
+        'metric': metric,
+        'bucket': bucket,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'points': timeseries(metric, bucket, start, end),
+    })
+
+
+# How often the admin dashboard polls the live counters when not streaming
+LIVE_POLL_INTERVAL = 5  # seconds
+
+
+@user_passes_test(lambda u: u.is_staff)
+def live_dashboard_stats(request):
+    """Return today's live dashboard counters for the admin dashboard to poll."""
+    return JsonResponse({'status': 'success', 'stats': get_live_stats(), 'poll_interval': LIVE_POLL_INTERVAL})
+
+
+@user_passes_test(lambda u: u.is_staff)
+@require_http_methods(["GET"])
+async def live_dashboard_stream(request):
+    """Server-Sent Events stream of today's live dashboard counters."""
+    if not settings.NOTIFICATION_PUSH_ENABLED or not isinstance(request, ASGIRequest):
+        # Under WSGI the stream would hold a worker for its whole duration;
+        # 204 tells EventSource not to reconnect, and the dashboard polls instead
+        return HttpResponse(status=204)
+
+    response = StreamingHttpResponse(live_stats_events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Withdrawal work queue API
+
+# Upper bound on a single claim so one worker can't hold the whole queue
+MAX_CLAIM_BATCH_SIZE = 500
+
+
+def _queue_payload(request):
+    """Read a work queue request from a JSON body or form data; raises ValueError if it isn't an object."""
+    if request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict):
+            raise ValueError('Request body must be a JSON object')
+        return payload
+    return {
+        'limit': request.POST.get('limit'),
+        'action': request.POST.get('action'),
+        'ids': request.POST.getlist('ids'),
+    }
+
+
+def _id_list(ids):
+    """Reject scalar ids, which would otherwise be iterated character by character."""
+    if not isinstance(ids, (list, tuple)):
+        raise TypeError('ids must be a list')
+    return ids
+
+
+def _serialize_withdrawal(withdrawal):
+    return {
+        'id': withdrawal.id,
+        'user': withdrawal.user.username,
+        'amount': str(withdrawal.amount),
+        'withdrawal_type': withdrawal.withdrawal_type,
+        'created_at': withdrawal.created_at.isoformat(),
+        'claimed_at': withdrawal.claimed_at.isoformat() if withdrawal.claimed_at else None,
+    }
+
+
+@require_POST
+@user_passes_test(lambda u: u.is_staff)
+def withdrawal_queue_claim(request):
+    """Claim the next batch of pending withdrawals for the current operator."""
+    try:
+        payload = _queue_payload(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    try:
+        limit = min(int(payload.get('limit') or DEFAULT_CLAIM_BATCH_SIZE), MAX_CLAIM_BATCH_SIZE)
+    except (TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'limit must be a number'}, status=400)
+
+    withdrawals = claim_withdrawals(request.user, limit=limit)
+    # Usernames for the whole batch in one query
+    users = get_user_model().objects.in_bulk({w.user_id for w in withdrawals})
+    for withdrawal in withdrawals:
+        withdrawal.user = users[withdrawal.user_id]
+
+    return JsonResponse({
+        'status': 'success',
+        'withdrawals': [_serialize_withdrawal(withdrawal) for withdrawal in withdrawals],
+    })
+
+
+@require_POST
+@user_passes_test(lambda u: u.is_staff)
+def withdrawal_queue_process(request):
+    """Approve or reject a batch of withdrawals."""
+    try:
+        payload = _queue_payload(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    try:
+        withdrawal_ids = [int(pk) for pk in _id_list(payload.get('ids') or [])]
+    except (TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'ids must be a list of withdrawal IDs'}, status=400)
+
+    action = payload.get('action')
+    if action not in WITHDRAWAL_ACTIONS:
+        return JsonResponse({
+            'status': 'error',
+            'message': f"action must be one of {sorted(WITHDRAWAL_ACTIONS)}"
+        }, status=400)
+
+    result = process_withdrawals(withdrawal_ids, action, request.user)
+    return JsonResponse({'status': 'success', **result})
+
+
+@require_POST
+@user_passes_test(lambda u: u.is_staff)
+def withdrawal_queue_release(request):
+    """Return the current operator's claimed withdrawals to the queue."""
+    try:
+        payload = _queue_payload(request)
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    try:
+        withdrawal_ids = [int(pk) for pk in _id_list(payload['ids'])] if payload.get('ids') else None
+    except (TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'ids must be a list of withdrawal IDs'}, status=400)
+
+    released = release_withdrawals(request.user, withdrawal_ids)
+    return JsonResponse({'status': 'success', 'released': released})
@@ -0,0 +1,223 @@
+"""
+Withdrawal processing work queue.
+
+Operators and automated workers claim batches of PENDING withdrawals with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent claimers never receive
+the same rows and never wait on each other. A claim is a lease: it records
+who is working on a withdrawal and expires after ``WITHDRAWAL_CLAIM_TIMEOUT``
+so abandoned batches return to the queue.
+
+Claimed withdrawals are approved or rejected in bulk. Each batch updates
+withdrawals and transactions with ``bulk_update`` and refunds rejected
+withdrawals with a single UPDATE on the wallets. Because these bulk writes
+bypass post_save, the rollups and live counters are updated explicitly.
+"""
+
+import logging
+from datetime import timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from .live import adjust_pending_withdrawals
+from .models import Transaction, Withdrawal
+from .rollups import record_transaction_changes
+
+logger = logging.getLogger("agape.transactions")
+
+# Default number of withdrawals claimed at once
+DEFAULT_CLAIM_BATCH_SIZE = 50
+
+# Default lease on claimed withdrawals before other workers may take them
+DEFAULT_CLAIM_TIMEOUT = 15 * 60  # 15 minutes
+
+# Maps an action to the resulting (withdrawal status, transaction status)
+WITHDRAWAL_ACTIONS = {
+    "approve": ("APPROVED", "COMPLETED"),
+    "reject": ("REJECTED", "FAILED"),
+}
+
+
+def get_claim_timeout() -> timedelta:
+    """
+    Return how long a claim is held before it expires.
+
+    Returns:
+        timedelta: The configured WITHDRAWAL_CLAIM_TIMEOUT
+    """
+    return timedelta(seconds=getattr(settings, "WITHDRAWAL_CLAIM_TIMEOUT", DEFAULT_CLAIM_TIMEOUT))
+
+
+def available_withdrawals(worker: Optional[Any] = None):
+    """
+    Return pending withdrawals that a worker may claim or process.
+
+    Args:
+        worker (Optional[User]): The claiming operator; their own claims are included
+
+    Returns:
+        QuerySet: Unclaimed, expired or self-claimed pending withdrawals
+    """
+    claimable = Q(claimed_at__isnull=True) | Q(claimed_at__lt=timezone.now() - get_claim_timeout())
+    if worker is not None:
+        claimable |= Q(claimed_by=worker)
+    return Withdrawal.objects.filter(claimable, status="PENDING")
+
+
+def claim_withdrawals(worker: Any, limit: int = DEFAULT_CLAIM_BATCH_SIZE) -> List[Withdrawal]:
+    """
+    Claim the oldest available pending withdrawals.
+
+    Rows locked by another claimer are skipped rather than waited on.
+
+    Args:
+        worker (User): The operator claiming the batch
+        limit (int): Maximum number of withdrawals to claim
+
+    Returns:
+        List[Withdrawal]: The claimed withdrawals, oldest first
+    """
+    with transaction.atomic():
+        withdrawals = list(
+            available_withdrawals(worker)
+            .select_for_update(skip_locked=True)
+            .order_by("created_at", "pk")[:limit]
+        )
+        if not withdrawals:
+            return []
+
+        now = timezone.now()
+        for withdrawal in withdrawals:
+            withdrawal.claimed_by = worker
+            withdrawal.claimed_at = now
+        Withdrawal.objects.bulk_update(withdrawals, ["claimed_by", "claimed_at"])
+
+    logger.info(f"Withdrawals claimed: worker={worker.username}, count={len(withdrawals)}")
+    return withdrawals
+
+
+def release_withdrawals(worker: Any, withdrawal_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Return a worker's claimed withdrawals to the queue.
+
+    Args:
+        worker (User): The operator releasing their claims
+        withdrawal_ids (Optional[Iterable[int]]): The withdrawals to release; all of
+            the worker's claims if omitted
+
+    Returns:
+        int: The number of withdrawals released
+    """
+    claims = Withdrawal.objects.filter(claimed_by=worker, status="PENDING")
+    if withdrawal_ids is not None:
+        claims = claims.filter(pk__in=list(withdrawal_ids))
+    return claims.update(claimed_by=None, claimed_at=None)
+
+
+def _refund_wallets(withdrawals: List[Withdrawal]) -> None:
+    """
+    Credit rejected withdrawal amounts back to their wallets in one UPDATE.
+
+    The UPDATE skips the wallets' post_save cache receiver, so their cached
+    balances are invalidated here once the transaction commits.
+    """
+    from subscriptions.cache import invalidate_wallet_cache
+    from subscriptions.models import Wallet
+
+    refunds: Dict[int, Decimal] = {}
+    for withdrawal in withdrawals:
+        if withdrawal.wallet_id is not None:
+            refunds[withdrawal.wallet_id] = (
+                refunds.get(withdrawal.wallet_id, Decimal("0.00")) + withdrawal.amount
+            )
+
+    if not refunds:
+        return
+
+    refund_amount = Case(
+        *[When(pk=wallet_id, then=Value(amount)) for wallet_id, amount in refunds.items()],
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    wallets = Wallet.objects.filter(pk__in=refunds)
+    wallets.update(balance=F("balance") + refund_amount, updated_at=timezone.now())
+
+    for user_id, wallet_type, plan_id in wallets.values_list("user_id", "wallet_type", "plan_id"):
+        invalidate_wallet_cache(user_id, wallet_type, plan_id if wallet_type == "PLAN" else None)
+
+
+def process_withdrawals(
+    withdrawal_ids: Iterable[int], action: str, worker: Optional[Any] = None
+) -> Dict[str, List[int]]:
+    """
+    Approve or reject a batch of pending withdrawals.
+
+    Withdrawals that are no longer pending, are claimed by someone else or
+    are locked by a concurrent batch are skipped.
+
+    Args:
+        withdrawal_ids (Iterable[int]): The withdrawals to process
+        action (str): Either 'approve' or 'reject'
+        worker (Optional[User]): The operator processing the batch
+
+    Returns:
+        Dict[str, List[int]]: The 'processed' and 'skipped' withdrawal IDs
+
+    Raises:
+        ValueError: If the action is not supported
+    """
+    if action not in WITHDRAWAL_ACTIONS:
+        raise ValueError(f"Unknown withdrawal action: {action}")
+    withdrawal_status, transaction_status = WITHDRAWAL_ACTIONS[action]
+    withdrawal_ids = list(withdrawal_ids)
+
+    with transaction.atomic():
+        withdrawals = list(
+            available_withdrawals(worker)
+            .filter(pk__in=withdrawal_ids)
+            .select_for_update(skip_locked=True)
+            .order_by("pk")
+        )
+
+        if withdrawals:
+            now = timezone.now()
+            for withdrawal in withdrawals:
+                withdrawal.status = withdrawal_status
+                withdrawal.processed_at = now
+                withdrawal.claimed_by = None
+                withdrawal.claimed_at = None
+            Withdrawal.objects.bulk_update(
+                withdrawals, ["status", "processed_at", "claimed_by", "claimed_at"]
+            )
+
+            transactions = list(
+                Transaction.objects.select_for_update().filter(
+                    pk__in=[w.transaction_id for w in withdrawals if w.transaction_id]
+                )
+            )
+            changes = []
+            for transaction_obj in transactions:
+                changes.append((transaction_obj, transaction_obj.status))
+                transaction_obj.status = transaction_status
+                transaction_obj.completed_at = now
+            Transaction.objects.bulk_update(transactions, ["status", "completed_at"])
+
+            if action == "reject":
+                _refund_wallets(withdrawals)
+
+            # bulk_update does not send post_save
+            record_transaction_changes(changes)
+            adjust_pending_withdrawals(-len(withdrawals))
+
+    processed = [withdrawal.pk for withdrawal in withdrawals]
+    processed_ids = set(processed)
+    skipped = [pk for pk in withdrawal_ids if pk not in processed_ids]
+    logger.info(
+        f"Withdrawals processed: action={action}, "
+        f"worker={getattr(worker, 'username', None)}, "
+        f"processed={len(processed)}, skipped={len(skipped)}"
+    )
+    return {"processed": processed, "skipped": skipped}
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        # Register the user cache, referral tree, notification counter and push signal handlers
+        from . import cache, notifications, push, referral_tree  # noqa: F401
@@ -2,6 +2,8 @@ from django.contrib.auth.backends import ModelBackend
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from .models import User
+from .cache import get_cached_user
+from .throttling import clear_failed_logins, is_login_locked, record_failed_login
 
 class CustomAuthBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
@@ -9,24 +11,23 @@ class CustomAuthBackend(ModelBackend):
             user = User.objects.get(username=username)
             
             # Check if account is locked
-            if user.is_account_locked():
+            if is_login_locked(user):
                 raise ValidationError('Account is temporarily locked due to too many failed login attempts.')
             
             # Verify password
             if user.check_password(password):
-                # Reset failed login attempts on successful login
-                user.reset_failed_logins()
+                # Forget failed attempts on successful login
+                clear_failed_logins(user)
                 return user
             else:
-                # Increment failed login attempts
-                user.increment_failed_login()
+                # Count the failed attempt; the row is only written if this locks the account
+                record_failed_login(user)
                 return None
                 
         except User.DoesNotExist:
             return None
     
     def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return None 
\ No newline at end of file
+        # Served from a cached projection; wallet and security columns load on first use
+        user = get_cached_user(user_id)
+        return user if user and self.user_can_authenticate(user) else None 
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+Caching module for the users app.
+
+Every authenticated request loads ``request.user``. Rather than reading the
+full, wide user row each time, ``get_cached_user`` serves a projection of the
+columns needed for authentication, permissions and page chrome from the cache.
+Wallet balances, two-factor secrets and the other columns are deferred and
+loaded together, in one query, the first time a view touches any of them.
+"""
+
+import logging
+import zlib
+from typing import List, Optional
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# Cache keys
+USER_CACHE_KEY_TEMPLATE = "user_projection_{}"
+
+# Cache timeouts (in seconds)
+USER_CACHE_TIMEOUT = 60 * 15  # 15 minutes
+
+# Columns kept in the cached projection. ``password`` is needed to verify the
+# session auth hash on every request.
+CACHED_USER_FIELDS = [
+    "id",
+    "password",
+    "last_login",
+    "is_superuser",
+    "username",
+    "first_name",
+    "last_name",
+    "email",
+    "is_staff",
+    "is_active",
+    "date_joined",
+    "referral_code",
+    "referred_by",
+    "profile_picture",
+    "two_factor_enabled",
+]
+
+
+def _cached_attnames() -> List[str]:
+    # Model.from_db expects the columns in concrete field order
+    return [
+        field.attname for field in User._meta.concrete_fields if field.name in CACHED_USER_FIELDS
+    ]
+
+
+# Entries written with a different column list are ignored rather than misread
+USER_CACHE_VERSION = zlib.crc32(",".join(_cached_attnames()).encode())
+
+
+def get_cached_user(user_id: int) -> Optional[User]:
+    """
+    Get a user projection from cache or database.
+
+    The returned instance defers every column outside CACHED_USER_FIELDS.
+    Reading any deferred column loads all of them at once (see
+    ``User.refresh_from_db``), and saving the instance writes only the
+    columns it holds.
+
+    Args:
+        user_id (int): The ID of the user
+
+    Returns:
+        Optional[User]: The user, or None if it doesn't exist
+    """
+    cache_key = USER_CACHE_KEY_TEMPLATE.format(user_id)
+    attnames = _cached_attnames()
+
+    # Try to get the projection from cache
+    values = cache.get(cache_key, version=USER_CACHE_VERSION)
+
+    if values is None:
+        logger.debug(f"User {user_id} cache miss, fetching from database")
+        values = User.objects.filter(pk=user_id).values_list(*attnames).first()
+        if values is None:
+            return None
+        cache.set(cache_key, values, USER_CACHE_TIMEOUT, version=USER_CACHE_VERSION)
+    else:
+        logger.debug(f"User {user_id} cache hit")
+
+    user = User.from_db("default", attnames, list(values))
+    user._cached_projection = True
+    return user
+
+
+def invalidate_user_cache(user_id: int):
+    """
+    Invalidate the cached projection for a user.
+
+    The entry is dropped immediately and again after the surrounding
+    transaction commits, so a request that reads the old row before the
+    commit can't leave it cached.
+
+    Args:
+        user_id (int): The ID of the user
+    """
+    logger.debug(f"Invalidating user cache for user {user_id}")
+    cache_key = USER_CACHE_KEY_TEMPLATE.format(user_id)
+    cache.delete(cache_key, version=USER_CACHE_VERSION)
+    transaction.on_commit(lambda: cache.delete(cache_key, version=USER_CACHE_VERSION))
+
+
+# Signal handlers to automatically invalidate cache when users change
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_cache_on_save(sender, instance, **kwargs):
+    """Invalidate the user projection when a user is saved."""
+    invalidate_user_cache(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_user_cache_on_delete(sender, instance, **kwargs):
+    """Invalidate the user projection when a user is deleted."""
+    invalidate_user_cache(instance.pk)
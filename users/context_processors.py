@@ -0,0 +1,24 @@
+"""Template context shared by the dashboard pages."""
+
+from functools import partial
+
+from django.conf import settings
+
+from .notifications import get_unread_count
+
+
+def unread_notifications(request):
+    """
+    Expose the unread notification count to templates.
+
+    Also says how the badge keeps it current. The count is passed as a
+    callable so pages that don't show the badge never look it up.
+    """
+    user = getattr(request, "user", None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {
+        "unread_notifications_count": partial(get_unread_count, user.pk),
+        "notification_push_enabled": settings.NOTIFICATION_PUSH_ENABLED,
+        "notification_poll_interval": settings.NOTIFICATION_POLL_INTERVAL,
+    }
@@ -0,0 +1,41 @@
+"""Backfill the referral closure table."""
+
+from django.core.management.base import BaseCommand
+
+from users.referral_tree import rebuild_tree
+
+
+class Command(BaseCommand):
+    """Rebuild the referral closure table level by level."""
+
+    help = (
+        "Build the referral closure table from User.referred_by. Existing rows are "
+        "kept, so the command can be rerun safely if it is interrupted."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Number of user ids covered by each insert.",
+        )
+        parser.add_argument(
+            "--max-depth", type=int, default=100, help="Deepest referral level to build."
+        )
+        parser.add_argument(
+            "--reset", action="store_true", help="Delete the existing table contents first."
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        written = rebuild_tree(
+            chunk_size=max(options["chunk_size"], 1),
+            max_depth=max(options["max_depth"], 1),
+            reset=options["reset"],
+            stdout=self.stdout,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Referral tree backfill complete: {written} paths written.")
+        )
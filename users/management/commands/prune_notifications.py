@@ -0,0 +1,42 @@
+"""Prune old and over-cap notifications."""
+
+from django.core.management.base import BaseCommand
+
+from users.retention import prune_notifications
+
+
+class Command(BaseCommand):
+    """Apply the notification retention rules."""
+
+    help = (
+        "Delete notifications past their retention age or beyond the per-user caps "
+        "set in NOTIFICATION_RETENTION, one primary key range at a time."
+    )
+
+    def add_arguments(self, parser):
+        """Add the command line options."""
+        parser.add_argument(
+            "--chunk-size", type=int, default=None, help="Number of ids covered by each delete."
+        )
+        parser.add_argument(
+            "--resume", action="store_true", help="Continue from where an interrupted run stopped."
+        )
+        parser.add_argument(
+            "--pause", type=float, default=0, help="Seconds to sleep between chunks."
+        )
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        chunk_size = options["chunk_size"]
+        totals = prune_notifications(
+            chunk_size=max(chunk_size, 1) if chunk_size is not None else None,
+            resume=options["resume"],
+            pause=max(options["pause"], 0),
+            stdout=self.stdout,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Notification pruning complete: {totals['expired']} expired and "
+                f"{totals['over_cap']} over-cap notifications deleted."
+            )
+        )
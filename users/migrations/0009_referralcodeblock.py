@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-19 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0008_notification_link_notification_title_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReferralCodeBlock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("reserved_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
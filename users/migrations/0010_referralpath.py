@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-19 14:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0009_referralcodeblock"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReferralPath",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("depth", models.PositiveIntegerField()),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="referral_descendants",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="referral_ancestors",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["ancestor", "depth"], name="referral_path_downline_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("descendant", "ancestor"), name="unique_referral_path"
+                    )
+                ],
+            },
+        ),
+    ]
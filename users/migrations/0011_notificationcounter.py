@@ -0,0 +1,49 @@
+# Generated by Django 5.2 on 2026-10-19 15:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def count_unread_notifications(apps, schema_editor):
+    """Seed the counters from the notifications that are already unread."""
+    Notification = apps.get_model("users", "Notification")
+    NotificationCounter = apps.get_model("users", "NotificationCounter")
+
+    unread = (
+        Notification.objects.filter(read=False)
+        .order_by()
+        .values("user_id")
+        .annotate(count=models.Count("id"))
+    )
+    NotificationCounter.objects.bulk_create(
+        (NotificationCounter(user_id=row["user_id"], unread=row["count"]) for row in unread.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0010_referralpath"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationCounter",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="notification_counter",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("unread", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_unread_notifications, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_user_search USING fts5("
+    "username, email, content='users_user', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS users_user_search_insert AFTER INSERT ON users_user BEGIN "
+    "INSERT INTO users_user_search(rowid, username, email) VALUES (new.id, new.username, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS users_user_search_delete AFTER DELETE ON users_user BEGIN "
+    "INSERT INTO users_user_search(users_user_search, rowid, username, email) "
+    "VALUES ('delete', old.id, old.username, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS users_user_search_update AFTER UPDATE OF username, email ON users_user BEGIN "
+    "INSERT INTO users_user_search(users_user_search, rowid, username, email) "
+    "VALUES ('delete', old.id, old.username, old.email); "
+    "INSERT INTO users_user_search(rowid, username, email) VALUES (new.id, new.username, new.email); END",
+    "INSERT INTO users_user_search(users_user_search) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS users_user_search_update",
+    "DROP TRIGGER IF EXISTS users_user_search_delete",
+    "DROP TRIGGER IF EXISTS users_user_search_insert",
+    "DROP TABLE IF EXISTS users_user_search",
+]
+
+# Index the expressions Django's icontains compares, so the lookup can use them
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_user_username_trgm "
+    "ON users_user USING gin (UPPER(username::text) gin_trgm_ops)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS users_user_email_trgm "
+    "ON users_user USING gin (UPPER(email::text) gin_trgm_ops)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX CONCURRENTLY IF EXISTS users_user_email_trgm",
+    "DROP INDEX CONCURRENTLY IF EXISTS users_user_username_trgm",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("users", "0012_notification_notification_user_page_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE}),
+        ),
+    ]
@@ -4,11 +4,13 @@ from django.utils.translation import gettext_lazy as _
 from django.core.validators import RegexValidator, MinValueValidator, MinLengthValidator
 from django.utils import timezone
 import uuid
-import random
-import string
 from typing import Optional, Union, List, Dict, Any
 from decimal import Decimal
 
+from .referral_codes import allocate_referral_code
+from .throttling import clear_failed_logins, is_login_locked, record_failed_login
+
+
 class User(AbstractUser):
     """
     Custom User model that extends Django's AbstractUser.
@@ -138,18 +140,15 @@ class User(AbstractUser):
 
     def generate_referral_code(self) -> str:
         """
-        Generate a unique 10-character referral code consisting of uppercase letters and numbers.
+        Allocate a unique 10-character referral code consisting of uppercase letters and numbers.
+
+        Codes come from users.referral_codes, which derives them from a
+        sequence, so no uniqueness check is needed.
 
         Returns:
             str: A unique 10-character referral code
         """
-        while True:
-            # Generate a random 10-character code
-            code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=10))
-
-            # Check if the code is unique
-            if not User.objects.filter(referral_code=code).exists():
-                return code
+        return allocate_referral_code()
 
     def save(self, *args: Any, **kwargs: Any) -> None:
         """
@@ -167,6 +166,44 @@ class User(AbstractUser):
             self.referral_code = self.generate_referral_code()
 
         super().save(*args, **kwargs)
+        self._loaded_referred_by_id = self.referred_by_id
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember the referrer the user was loaded with.
+
+        The referral tree signal handlers compare against it to move a user's
+        downline when their referrer is changed.
+        """
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        if 'referred_by_id' in loaded:
+            instance._loaded_referred_by_id = loaded['referred_by_id']
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None) -> None:
+        """
+        Load all deferred columns together on cached user projections.
+
+        A projection served by ``users.cache.get_cached_user`` defers the
+        wallet and security columns. Without this, each one would be fetched
+        with its own query the first time it's read (the ``balance`` property
+        alone reads nine).
+
+        Args:
+            using (str): The database alias to read from
+            fields (list): The fields to reload, or None for all of them
+            from_queryset (QuerySet): The queryset to read the row from
+
+        Returns:
+            None
+        """
+        if getattr(self, '_cached_projection', False) and fields is not None:
+            deferred = self.get_deferred_fields()
+            if deferred and set(fields) <= deferred:
+                fields = list(deferred)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
 
     @property
     def balance(self) -> float:
@@ -189,26 +226,16 @@ class User(AbstractUser):
         )
 
     def increment_failed_login(self):
-        self.failed_login_attempts += 1
-        self.last_failed_login = timezone.now()
-        
-        # Lock account after 5 failed attempts for 30 minutes
-        if self.failed_login_attempts >= 5:
-            self.account_locked_until = timezone.now() + timezone.timedelta(minutes=30)
-        self.save()
+        """Count a failed login; see users.throttling.record_failed_login."""
+        return record_failed_login(self)
     
     def reset_failed_logins(self):
-        self.failed_login_attempts = 0
-        self.account_locked_until = None
-        self.save()
+        """Forget failed logins; see users.throttling.clear_failed_logins."""
+        clear_failed_logins(self)
     
     def is_account_locked(self):
-        if self.account_locked_until:
-            if timezone.now() < self.account_locked_until:
-                return True
-            else:
-                self.reset_failed_logins()
-        return False
+        """Check the login lock without writing; see users.throttling.is_login_locked."""
+        return is_login_locked(self)
     
     def update_password(self, new_password):
         self.set_password(new_password)
@@ -216,6 +243,45 @@ class User(AbstractUser):
         self.password_changed = True
         self.save()
 
+class ReferralCodeBlock(models.Model):
+    """
+    A block of referral code sequence numbers reserved by one process.
+
+    Only the id matters: block ``n`` covers sequence numbers
+    ``n * REFERRAL_CODE_BLOCK_SIZE`` up to the next block.
+    """
+    reserved_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Referral code block {self.pk}"
+
+
+class ReferralPath(models.Model):
+    """
+    One row per (ancestor, descendant) pair in the referral tree.
+
+    A closure table over ``User.referred_by``: every user has a depth 0 row
+    to themselves and a row to each upline member, with ``depth`` counting
+    the referral levels between them. Downline size, volume and
+    depth-limited listings are then single indexed queries instead of
+    recursive walks. Maintained by users.referral_tree.
+    """
+    ancestor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='referral_descendants')
+    descendant = models.ForeignKey(User, on_delete=models.CASCADE, related_name='referral_ancestors')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['descendant', 'ancestor'], name='unique_referral_path'),
+        ]
+        indexes = [
+            models.Index(fields=['ancestor', 'depth'], name='referral_path_downline_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+
 class Notification(models.Model):
     """
     Represents a notification for a user.
@@ -237,6 +303,10 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pages of a user's notifications, newest first
+            models.Index(fields=['user', '-id'], name='notification_user_page_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title or 'Notification'} - {self.user.username}"
@@ -253,13 +323,31 @@ class Notification(models.Model):
             notification_type=notification_type,
             link=link
         )
-        
-        # Send WebSocket notification here if implemented
+
+        # users.push sends it to the user's open streams once committed
         return notification
 
     def mark_as_read(self):
         """
         Mark the notification as read.
         """
+        from .notifications import mark_notifications_read
+
+        if not self.read:
+            mark_notifications_read(self.user_id, [self.pk])
         self.read = True
-        self.save()
+
+
+class NotificationCounter(models.Model):
+    """
+    A user's unread notification count.
+
+    Kept in its own table so saving a User never overwrites it. Maintained by
+    users.notifications, which also mirrors it in the cache.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='notification_counter')
+    unread = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
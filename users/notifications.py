@@ -0,0 +1,315 @@
+"""
+Unread notification counters for the users app.
+
+Each user's unread count is kept in a ``NotificationCounter`` row and mirrored
+in the cache, so the dashboard badge never has to count rows in the
+notifications table. Creating, reading and deleting notifications through
+``Notification`` or the helpers below keeps the counter in step. Code that
+changes ``Notification.read`` with ``QuerySet.update()`` or bulk-creates
+notifications must call ``adjust_unread_counts`` itself.
+
+``broadcast_notification`` announces something to many users at once with one
+``INSERT ... SELECT`` per chunk of the users table, so the message is sent to
+the database once per chunk rather than once per recipient.
+"""
+
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.tiered_cache import get_or_compute, invalidate
+
+from .models import Notification, NotificationCounter
+from .push import publish, publish_notifications
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Cache keys
+UNREAD_COUNT_KEY_TEMPLATE = "unread_notifications_{}"
+
+# Cache timeouts (in seconds)
+UNREAD_COUNT_TIMEOUT = 60 * 60 * 24  # 24 hours
+
+# Defaults used when the settings are missing
+DEFAULT_BROADCAST_CHUNK_SIZE = 5000
+
+# Notifications shown per page of the notifications list
+NOTIFICATION_PAGE_SIZE = 20
+
+
+def get_unread_count(user_id: int) -> int:
+    """
+    Get a user's unread notification count from cache or the counter row.
+
+    Args:
+        user_id (int): The ID of the user
+
+    Returns:
+        int: The number of unread notifications
+    """
+
+    def load():
+        logger.debug(f"Unread count for user {user_id} cache miss, fetching from database")
+        return (
+            NotificationCounter.objects.filter(user_id=user_id)
+            .values_list("unread", flat=True)
+            .first()
+            or 0
+        )
+
+    return get_or_compute(
+        cache, UNREAD_COUNT_KEY_TEMPLATE.format(user_id), load, UNREAD_COUNT_TIMEOUT
+    )
+
+
+def adjust_unread_counts(deltas: Dict[int, int]) -> None:
+    """
+    Add to several users' unread counters.
+
+    All counters are updated with one statement and rows are only created
+    for users who don't have one yet; the cached counters are dropped once
+    the surrounding transaction commits, and reloaded by the next read.
+
+    Args:
+        deltas (Dict[int, int]): Changes keyed by user ID (negative to subtract)
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    change = Case(
+        *[When(user_id=user_id, then=Value(delta)) for user_id, delta in deltas.items()],
+        output_field=IntegerField(),
+    )
+    updated = NotificationCounter.objects.filter(user_id__in=deltas).update(
+        unread=Greatest(F("unread") + change, 0)
+    )
+    if updated < len(deltas):
+        # First notifications for some users; there is nothing to subtract from
+        existing = set(
+            NotificationCounter.objects.filter(user_id__in=deltas).values_list("user_id", flat=True)
+        )
+        NotificationCounter.objects.bulk_create(
+            [
+                NotificationCounter(user_id=user_id, unread=delta)
+                for user_id, delta in deltas.items()
+                if user_id not in existing and delta > 0
+            ],
+            ignore_conflicts=True,
+        )
+
+    # Drop rather than adjust the cached counts: a reader that loaded the
+    # row before this commit would otherwise refill it with the old count
+    cache_keys = [UNREAD_COUNT_KEY_TEMPLATE.format(user_id) for user_id in deltas]
+    transaction.on_commit(lambda: invalidate(cache, cache_keys))
+
+
+def create_notifications(notifications: List[Notification]) -> List[Notification]:
+    """
+    Insert several notifications and count them as unread.
+
+    Args:
+        notifications (List[Notification]): Unsaved notifications
+
+    Returns:
+        List[Notification]: The created notifications
+    """
+    created = Notification.objects.bulk_create(notifications)
+    adjust_unread_counts(
+        Counter(notification.user_id for notification in created if not notification.read)
+    )
+    publish_notifications(created)
+    return created
+
+
+def broadcast_notification(
+    message: str,
+    title: str = "",
+    notification_type: str = "info",
+    link: Optional[str] = None,
+    users=None,
+    chunk_size: Optional[int] = None,
+) -> int:
+    """
+    Send the same notification to many users.
+
+    Recipients are walked in primary key order, one chunk at a time. Each
+    chunk is inserted with a single ``INSERT ... SELECT`` from the users
+    table, its counters are bumped with one UPDATE, the cached counts are
+    dropped in one round trip and connected users get one push event
+    per chunk. Chunks commit separately, so a broadcast
+    to the whole user base never holds one long transaction.
+
+    Args:
+        message (str): The notification message
+        title (str): The notification title
+        notification_type (str): One of Notification.NOTIFICATION_TYPES
+        link (Optional[str]): Optional link shown with the notification
+        users (QuerySet): Recipients; all active users if omitted
+        chunk_size (Optional[int]): Users per chunk; defaults to
+            NOTIFICATION_BROADCAST_CHUNK_SIZE
+
+    Returns:
+        int: The number of notifications created
+    """
+    if users is None:
+        users = User.objects.filter(is_active=True)
+    chunk_size = chunk_size or getattr(
+        settings, "NOTIFICATION_BROADCAST_CHUNK_SIZE", DEFAULT_BROADCAST_CHUNK_SIZE
+    )
+    users = users.order_by("pk")
+
+    qn = connection.ops.quote_name
+    columns = ", ".join(
+        qn(column)
+        for column in (
+            "user_id",
+            "title",
+            "message",
+            "notification_type",
+            "read",
+            "created_at",
+            "link",
+        )
+    )
+    pk = qn(User._meta.pk.column)
+    created_at = timezone.now()
+    event = {
+        "id": None,
+        "title": title,
+        "message": message,
+        "type": notification_type,
+        "link": link,
+        "created_at": created_at,
+    }
+    sent = 0
+    last_id = 0
+
+    while True:
+        user_ids = list(users.filter(pk__gt=last_id).values_list("pk", flat=True)[:chunk_size])
+        if not user_ids:
+            break
+        last_id = user_ids[-1]
+
+        # Insert and count against the same snapshot of recipients, so a user
+        # joining mid-chunk can't get a notification without a counter bump
+        placeholders = ", ".join(["%s"] * len(user_ids))
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {qn(Notification._meta.db_table)} ({columns}) "
+                    f"SELECT {pk}, %s, %s, %s, %s, %s, %s FROM {qn(User._meta.db_table)} "
+                    f"WHERE {pk} IN ({placeholders})",
+                    [title, message, notification_type, False, created_at, link, *user_ids],
+                )
+                sent += cursor.rowcount
+
+            # Create missing counters at zero first so the UPDATE counts everyone
+            NotificationCounter.objects.bulk_create(
+                [NotificationCounter(user_id=user_id, unread=0) for user_id in user_ids],
+                ignore_conflicts=True,
+            )
+            NotificationCounter.objects.filter(user_id__in=user_ids).update(unread=F("unread") + 1)
+
+            def after_commit(user_ids=user_ids):
+                invalidate(
+                    cache, [UNREAD_COUNT_KEY_TEMPLATE.format(user_id) for user_id in user_ids]
+                )
+                publish(user_ids, event)
+
+            transaction.on_commit(after_commit)
+
+    logger.info(f"Broadcast notification '{title}' to {sent} users")
+    return sent
+
+
+def get_notification_page(
+    user_id: int,
+    before: Optional[int] = None,
+    limit: int = NOTIFICATION_PAGE_SIZE,
+    mark_read: bool = True,
+) -> Tuple[List[Notification], Optional[int]]:
+    """
+    Get one page of a user's notifications, newest first.
+
+    Pages are keyed on the notification ID rather than an offset, so every
+    page is an index range scan of ``limit`` rows however far back the user
+    scrolls. Only the notifications on the page are marked as read.
+
+    Args:
+        user_id (int): The ID of the user
+        before (Optional[int]): Cursor returned with the previous page; the
+            first page if omitted
+        limit (int): Notifications per page
+        mark_read (bool): Mark the unread notifications on the page as read
+
+    Returns:
+        Tuple[List[Notification], Optional[int]]: The page and the cursor for
+            the next one, or None on the last page
+    """
+    notifications = Notification.objects.filter(user_id=user_id).order_by("-id")
+    if before is not None:
+        notifications = notifications.filter(pk__lt=before)
+
+    page = list(notifications[: limit + 1])
+    next_before = page[limit - 1].pk if len(page) > limit else None
+    page = page[:limit]
+
+    if mark_read:
+        unread = [notification.pk for notification in page if not notification.read]
+        if unread:
+            mark_notifications_read(user_id, unread)
+            for notification in page:
+                notification.read = True
+
+    return page, next_before
+
+
+def mark_notifications_read(user_id: int, notification_ids: Iterable[int] = None) -> int:
+    """
+    Mark a user's unread notifications as read.
+
+    Args:
+        user_id (int): The ID of the user
+        notification_ids (Iterable[int]): Only mark these notifications; all if omitted
+
+    Returns:
+        int: The number of notifications that were unread
+    """
+    unread = Notification.objects.filter(user_id=user_id, read=False)
+    if notification_ids is not None:
+        unread = unread.filter(pk__in=notification_ids)
+
+    with transaction.atomic():
+        marked = unread.update(read=True)
+        adjust_unread_counts({user_id: -marked})
+    return marked
+
+
+# Signal handlers to keep the counters in step with single-row changes
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, raw=False, **kwargs):
+    """Count a new unread notification."""
+    if created and not raw and not instance.read:
+        adjust_unread_counts({instance.user_id: 1})
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    """Stop counting an unread notification that was deleted."""
+    if not instance.read:
+        adjust_unread_counts({instance.user_id: -1})
@@ -0,0 +1,308 @@
+"""
+Push delivery of new notifications over Server-Sent Events.
+
+Browsers keep one SSE stream open (``users:notification_stream``). The view
+is async, so under the ASGI application in agape/asgi.py an idle connection
+is a suspended coroutine waiting on a queue rather than a worker thread, and
+one process can hold thousands of them. The stream is only served when
+NOTIFICATION_PUSH_ENABLED is set and the request came through ASGI; otherwise
+the dashboard polls the unread count.
+
+Notifications are published once their transaction commits, and not at all
+while push is disabled. Without NOTIFICATION_PUSH_REDIS_URL the in-process
+broker hands them straight to the streams open on this process. With it,
+events go out on a Redis pub/sub channel and every process relays them to its
+own streams, so it works behind several workers. Events created together,
+such as the notifications of one bulk insert, share a single PUBLISH.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# Redis channel shared by every process
+PUSH_CHANNEL = "notification_push"
+
+# Events buffered per stream; a client that falls further behind misses events
+STREAM_QUEUE_SIZE = 100
+
+# How often an idle stream sends a keepalive, and how long one connection lasts
+PUSH_KEEPALIVE_INTERVAL = 25  # seconds
+PUSH_STREAM_DURATION = 30 * 60  # 30 minutes
+# Delay before the browser reconnects after a stream ends
+PUSH_RETRY_MS = 3000
+
+
+class NotificationBroker:
+    """
+    Routes events to the streams open on this process.
+
+    ``subscribe`` and ``unsubscribe`` run on the event loop; ``deliver`` may be
+    called from any thread and hands each event to the stream's own loop.
+    """
+
+    def __init__(self):
+        """Create a broker with no open streams."""
+        self._streams: Dict[int, Dict[asyncio.Queue, asyncio.AbstractEventLoop]] = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        """
+        Open a stream for a user.
+
+        Args:
+            user_id (int): The ID of the connected user
+
+        Returns:
+            asyncio.Queue: The queue events for this stream are put on
+        """
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        with self._lock:
+            self._streams[user_id][queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        """Close a stream opened with subscribe."""
+        with self._lock:
+            streams = self._streams.get(user_id)
+            if streams is not None:
+                streams.pop(queue, None)
+                if not streams:
+                    del self._streams[user_id]
+
+    def connected(self, user_id: int) -> int:
+        """Return the number of open streams for a user."""
+        return len(self._streams.get(user_id, ()))
+
+    def deliver(self, user_ids: Iterable[int], event: Dict[str, Any]) -> int:
+        """
+        Hand an event to every open stream of the given users.
+
+        Args:
+            user_ids (Iterable[int]): The recipients
+            event (Dict[str, Any]): The event payload
+
+        Returns:
+            int: The number of streams the event was handed to
+        """
+        with self._lock:
+            targets = [
+                (queue, loop)
+                for user_id in user_ids
+                for queue, loop in self._streams.get(user_id, {}).items()
+            ]
+
+        for queue, loop in targets:
+            try:
+                loop.call_soon_threadsafe(_put_event, queue, event)
+            except RuntimeError:
+                # The stream's loop has shut down
+                pass
+        return len(targets)
+
+
+def _put_event(queue: asyncio.Queue, event: Dict[str, Any]) -> None:
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        logger.debug("Notification stream queue full, dropping event")
+
+
+broker = NotificationBroker()
+
+_redis_client = None
+_relay_tasks: Dict[asyncio.AbstractEventLoop, asyncio.Task] = {}
+
+
+def _redis_url() -> Optional[str]:
+    return getattr(settings, "NOTIFICATION_PUSH_REDIS_URL", None)
+
+
+def _redis():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+
+        _redis_client = redis.Redis.from_url(_redis_url())
+    return _redis_client
+
+
+# An event and the users it is pushed to
+Message = Tuple[List[int], Dict[str, Any]]
+
+
+def push_enabled() -> bool:
+    """Return whether notifications are pushed to open streams at all."""
+    return getattr(settings, "NOTIFICATION_PUSH_ENABLED", False)
+
+
+def publish_many(messages: List[Message]) -> None:
+    """
+    Push several events to their users' open streams on every process.
+
+    All the events go out in one Redis PUBLISH. Nothing is sent while push
+    is disabled, since no stream can be listening.
+
+    Args:
+        messages (List[Message]): (recipient IDs, event payload) pairs
+    """
+    if not messages or not push_enabled():
+        return
+
+    payload = json.dumps(
+        {"messages": [{"user_ids": user_ids, "event": event} for user_ids, event in messages]},
+        cls=DjangoJSONEncoder,
+    )
+    if _redis_url():
+        import redis
+
+        try:
+            _redis().publish(PUSH_CHANNEL, payload)
+            return
+        except redis.RedisError as e:
+            logger.warning(f"Publishing notification push to Redis failed, delivering locally: {e}")
+
+    _deliver(json.loads(payload))
+
+
+def publish(user_ids: List[int], event: Dict[str, Any]) -> None:
+    """
+    Push an event to the given users' open streams on every process.
+
+    Args:
+        user_ids (List[int]): The recipients
+        event (Dict[str, Any]): The event payload
+    """
+    publish_many([(user_ids, event)])
+
+
+def _deliver(data: Dict[str, Any]) -> None:
+    """Hand a published payload to the streams open on this process."""
+    for message in data["messages"]:
+        broker.deliver(message["user_ids"], message["event"])
+
+
+async def _relay_from_redis() -> None:
+    """Deliver events published by any process to the streams on this one."""
+    import redis.asyncio as aioredis
+
+    while True:
+        client = aioredis.Redis.from_url(_redis_url())
+        try:
+            async with client.pubsub() as pubsub:
+                await pubsub.subscribe(PUSH_CHANNEL)
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    _deliver(json.loads(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Notification push relay lost its Redis connection: {e}")
+            await asyncio.sleep(PUSH_RETRY_MS / 1000)
+        finally:
+            await client.aclose()
+
+
+def _ensure_relay() -> None:
+    """Start the Redis relay on the running loop if it isn't running yet."""
+    if not _redis_url():
+        return
+    loop = asyncio.get_running_loop()
+    task = _relay_tasks.get(loop)
+    if task is None or task.done():
+        _relay_tasks[loop] = loop.create_task(_relay_from_redis())
+
+
+def notification_event(notification: Notification) -> Dict[str, Any]:
+    """
+    Build the event sent for a notification.
+
+    Args:
+        notification (Notification): The created notification
+
+    Returns:
+        Dict[str, Any]: The event payload
+    """
+    return {
+        "id": notification.pk,
+        "title": notification.title,
+        "message": notification.message,
+        "type": notification.notification_type,
+        "link": notification.link,
+        "created_at": notification.created_at,
+    }
+
+
+def publish_notifications(notifications: Iterable[Notification]) -> None:
+    """
+    Push unread notifications to their users once the transaction commits.
+
+    Args:
+        notifications (Iterable[Notification]): Newly created notifications
+    """
+    if not push_enabled():
+        return
+    messages = [
+        ([notification.user_id], notification_event(notification))
+        for notification in notifications
+        if not notification.read
+    ]
+    if messages:
+        transaction.on_commit(lambda: publish_many(messages))
+
+
+async def notification_events(
+    user_id: int, keepalive: int = PUSH_KEEPALIVE_INTERVAL, duration: int = PUSH_STREAM_DURATION
+):
+    """
+    Yield SSE events for a user's new notifications.
+
+    Args:
+        user_id (int): The ID of the connected user
+        keepalive (int): Seconds between keepalives on an idle stream
+        duration (int): Seconds before the stream ends and the browser reconnects
+    """
+    yield f"retry: {PUSH_RETRY_MS}\n\n"
+
+    _ensure_relay()
+    queue = broker.subscribe(user_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=min(keepalive, remaining))
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: notification\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broker.unsubscribe(user_id, queue)
+
+
+# Signal handler to push single notifications
+
+
+@receiver(post_save, sender=Notification)
+def push_new_notification(sender, instance, created, raw=False, **kwargs):
+    """Push a new notification to the user's open streams."""
+    if created and not raw:
+        publish_notifications([instance])
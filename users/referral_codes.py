@@ -0,0 +1,168 @@
+"""
+Referral code allocation for the users app.
+
+Codes are derived from a sequence rather than drawn at random, so assigning
+one never needs a uniqueness check. Each sequence number is passed through a
+keyed Feistel permutation of the 10-character base36 code space and encoded in
+uppercase base36. Distinct numbers always give distinct codes, and consecutive
+numbers give unrelated-looking codes, so the sign-up order can't be read from
+them.
+
+Sequence numbers are handed out in blocks. A process reserves a block by
+inserting one ``ReferralCodeBlock`` row and then allocates from it in memory,
+so only one in every REFERRAL_CODE_BLOCK_SIZE codes costs a query. The block
+id comes from the database sequence, which is never rolled back on
+PostgreSQL, so two processes can never get the same block.
+"""
+
+import hashlib
+import hmac
+import logging
+import threading
+from typing import Iterable, List
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CODE_LENGTH = 10
+CODE_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+CODE_SPACE = len(CODE_ALPHABET) ** CODE_LENGTH
+
+# The permutation works on 52-bit integers (the smallest even bit width that
+# covers CODE_SPACE) and cycle-walks back into range
+HALF_BITS = 26
+HALF_MASK = (1 << HALF_BITS) - 1
+FEISTEL_ROUNDS = 4
+
+# Defaults used when the settings are missing
+DEFAULT_BLOCK_SIZE = 100
+
+
+def _round_value(key: bytes, round_number: int, half: int) -> int:
+    digest = hmac.new(key, f"{round_number}:{half}".encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:8], "big") & HALF_MASK
+
+
+def _permute(value: int, key: bytes) -> int:
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for round_number in range(FEISTEL_ROUNDS):
+        left, right = right, left ^ _round_value(key, round_number, right)
+    return (left << HALF_BITS) | right
+
+
+def encode_referral_code(number: int) -> str:
+    """
+    Map a sequence number to its referral code.
+
+    Args:
+        number (int): A sequence number in the range [0, CODE_SPACE)
+
+    Returns:
+        str: A 10-character code of uppercase letters and digits
+    """
+    if not 0 <= number < CODE_SPACE:
+        raise ValueError(f"Referral sequence number {number} is out of range")
+
+    key = settings.REFERRAL_CODE_SECRET.encode()
+    value = _permute(number, key)
+    # Cycle-walk: re-permute until the value lands inside the code space
+    while value >= CODE_SPACE:
+        value = _permute(value, key)
+
+    code = []
+    for _ in range(CODE_LENGTH):
+        value, remainder = divmod(value, len(CODE_ALPHABET))
+        code.append(CODE_ALPHABET[remainder])
+    return "".join(reversed(code))
+
+
+class ReferralCodeAllocator:
+    """
+    Hand out referral codes from blocks of sequence numbers held in memory.
+
+    One allocator is shared by every thread in the process.
+    """
+
+    def __init__(self, block_size: int = None):
+        """Create a generator reserving block_size ids at a time."""
+        self.block_size = block_size or getattr(
+            settings, "REFERRAL_CODE_BLOCK_SIZE", DEFAULT_BLOCK_SIZE
+        )
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def _reserve_blocks(self, count: int) -> List[int]:
+        from .models import ReferralCodeBlock
+
+        blocks = ReferralCodeBlock.objects.bulk_create([ReferralCodeBlock() for _ in range(count)])
+        logger.debug(f"Reserved referral code blocks {[block.pk for block in blocks]}")
+        return [block.pk for block in blocks]
+
+    def allocate_many(self, count: int) -> List[str]:
+        """
+        Allocate several referral codes.
+
+        Args:
+            count (int): The number of codes needed
+
+        Returns:
+            List[str]: The allocated codes
+        """
+        numbers = []
+        with self._lock:
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    # Reserve every block still needed in one insert
+                    needed = count - len(numbers)
+                    block_ids = self._reserve_blocks(-(-needed // self.block_size))
+                    for block_id in block_ids[:-1]:
+                        numbers.extend(
+                            range(block_id * self.block_size, (block_id + 1) * self.block_size)
+                        )
+                    self._next = block_ids[-1] * self.block_size
+                    self._end = self._next + self.block_size
+                    continue
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(range(self._next, self._next + take))
+                self._next += take
+
+        return [encode_referral_code(number) for number in numbers[:count]]
+
+    def allocate(self) -> str:
+        """
+        Allocate a single referral code.
+
+        Returns:
+            str: The allocated code
+        """
+        return self.allocate_many(1)[0]
+
+
+allocator = ReferralCodeAllocator()
+
+
+def allocate_referral_code() -> str:
+    """
+    Allocate a referral code from the process-wide allocator.
+
+    Returns:
+        str: A new, unused referral code
+    """
+    return allocator.allocate()
+
+
+def assign_referral_codes(users: Iterable) -> None:
+    """
+    Give every user without a referral code a new one, in memory.
+
+    Use before ``User.objects.bulk_create`` so bulk sign-ups need at most one
+    query for their codes.
+
+    Args:
+        users (Iterable[User]): The users to update
+    """
+    missing = [user for user in users if not user.referral_code]
+    for user, code in zip(missing, allocator.allocate_many(len(missing))):
+        user.referral_code = code
@@ -0,0 +1,295 @@
+"""
+Referral tree queries and maintenance for the users app.
+
+``ReferralPath`` is a closure table over ``User.referred_by``. The signal
+handlers below keep it up to date when users sign up, change referrer or are
+deleted, and the query helpers answer downline questions with a single indexed
+query. Run the ``backfill_referral_paths`` command to build the table for
+existing users.
+"""
+
+import logging
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from .models import ReferralPath, User
+
+logger = logging.getLogger(__name__)
+
+# Subscription statuses that count towards downline volume
+VOLUME_STATUSES = ["ACTIVE", "COMPLETED"]
+
+
+def _depth_filter(prefix: str, max_depth: Optional[int]) -> Q:
+    condition = Q(**{f"{prefix}depth__gte": 1})
+    if max_depth is not None:
+        condition &= Q(**{f"{prefix}depth__lte": max_depth})
+    return condition
+
+
+def get_downline(user: User, max_depth: Optional[int] = None):
+    """
+    Return the users below a user in the referral tree.
+
+    Args:
+        user (User): The upline user
+        max_depth (Optional[int]): Only include members this many levels down or fewer
+
+    Returns:
+        QuerySet: The downline users, annotated with ``referral_depth``
+    """
+    return (
+        User.objects.filter(
+            _depth_filter("referral_ancestors__", max_depth),
+            referral_ancestors__ancestor=user,
+        )
+        .annotate(
+            referral_depth=F("referral_ancestors__depth"),
+        )
+        .order_by("referral_depth", "id")
+    )
+
+
+def get_downline_size(user: User, max_depth: Optional[int] = None) -> int:
+    """
+    Count the users below a user in the referral tree.
+
+    Args:
+        user (User): The upline user
+        max_depth (Optional[int]): Only count members this many levels down or fewer
+
+    Returns:
+        int: The downline size
+    """
+    return ReferralPath.objects.filter(_depth_filter("", max_depth), ancestor=user).count()
+
+
+def get_downline_counts_by_depth(user: User, max_depth: Optional[int] = None) -> Dict[int, int]:
+    """
+    Count the users on each level below a user.
+
+    Args:
+        user (User): The upline user
+        max_depth (Optional[int]): Deepest level to include
+
+    Returns:
+        Dict[int, int]: Member counts keyed by depth
+    """
+    rows = (
+        ReferralPath.objects.filter(_depth_filter("", max_depth), ancestor=user)
+        .values("depth")
+        .annotate(members=Count("id"))
+        .order_by("depth")
+    )
+    return {row["depth"]: row["members"] for row in rows}
+
+
+def get_downline_volume_by_plan(user: User, max_depth: Optional[int] = None) -> List[Dict]:
+    """
+    Sum the contributions of a user's downline, per plan.
+
+    Only active and completed subscriptions count towards the volume.
+
+    Args:
+        user (User): The upline user
+        max_depth (Optional[int]): Only include members this many levels down or fewer
+
+    Returns:
+        List[Dict]: One row per plan with ``plan_id``, ``plan__name``,
+            ``subscriptions``, ``members`` and ``volume``
+    """
+    from subscriptions.models import Subscription
+
+    rows = (
+        Subscription.objects.filter(
+            _depth_filter("user__referral_ancestors__", max_depth),
+            user__referral_ancestors__ancestor=user,
+            status__in=VOLUME_STATUSES,
+        )
+        .values("plan_id", "plan__name")
+        .annotate(
+            subscriptions=Count("id"),
+            members=Count("user_id", distinct=True),
+            volume=Sum("plan__contribution_amount"),
+        )
+        .order_by("plan_id")
+    )
+    return [{**row, "volume": row["volume"] or Decimal("0")} for row in rows]
+
+
+def add_to_tree(user: User) -> None:
+    """
+    Insert the closure rows for a newly created user.
+
+    Args:
+        user (User): The new user
+    """
+    paths = [ReferralPath(ancestor_id=user.pk, descendant_id=user.pk, depth=0)]
+    if user.referred_by_id:
+        paths += [
+            ReferralPath(ancestor_id=ancestor_id, descendant_id=user.pk, depth=depth + 1)
+            for ancestor_id, depth in ReferralPath.objects.filter(
+                descendant_id=user.referred_by_id,
+            ).values_list("ancestor_id", "depth")
+        ]
+    ReferralPath.objects.bulk_create(paths, ignore_conflicts=True)
+
+
+def move_subtree(user: User, old_referrer_id: Optional[int]) -> None:
+    """
+    Re-attach a user and their downline below their new referrer.
+
+    Args:
+        user (User): The user whose ``referred_by`` changed
+        old_referrer_id (Optional[int]): The previous referrer, if any
+    """
+    subtree = dict(ReferralPath.objects.filter(ancestor=user).values_list("descendant_id", "depth"))
+    if not subtree:
+        # The user predates the closure table; the backfill will pick them up
+        return
+
+    if user.referred_by_id in subtree:
+        logger.error(
+            f"Referrer {user.referred_by_id} is in the downline of user {user.pk}; tree not updated"
+        )
+        return
+
+    with transaction.atomic():
+        # Detach the subtree from its old upline
+        ReferralPath.objects.filter(
+            descendant_id__in=subtree.keys(),
+        ).exclude(
+            ancestor_id__in=subtree.keys(),
+        ).delete()
+
+        if user.referred_by_id:
+            upline = ReferralPath.objects.filter(
+                descendant_id=user.referred_by_id,
+            ).values_list("ancestor_id", "depth")
+            ReferralPath.objects.bulk_create(
+                (
+                    ReferralPath(
+                        ancestor_id=ancestor_id,
+                        descendant_id=descendant_id,
+                        depth=depth + 1 + offset,
+                    )
+                    for ancestor_id, depth in upline
+                    for descendant_id, offset in subtree.items()
+                ),
+                batch_size=1000,
+            )
+
+    logger.info(
+        f"Moved {len(subtree)} users from referrer {old_referrer_id} to {user.referred_by_id}"
+    )
+
+
+def rebuild_tree(
+    chunk_size: int = 10000, max_depth: int = 100, reset: bool = False, stdout=None
+) -> int:
+    """
+    Build the closure table from ``User.referred_by``.
+
+    The table is built one level at a time: depth 0 rows for every user, then
+    each level's rows are derived from the previous level with an
+    ``INSERT ... SELECT`` over a range of user ids. Every statement touches at
+    most ``chunk_size`` users, so the build never holds long locks. Rows that
+    already exist are skipped, so an interrupted build can simply be rerun
+    and users signing up meanwhile are not disturbed.
+
+    Args:
+        chunk_size (int): Number of user ids covered by each statement
+        max_depth (int): Stop after this many levels (guards against referral cycles)
+        reset (bool): Delete every existing row first
+        stdout: Optional stream for progress output
+
+    Returns:
+        int: The number of rows written
+    """
+    path_table = connection.ops.quote_name(ReferralPath._meta.db_table)
+    user_table = connection.ops.quote_name(User._meta.db_table)
+    referred_by = connection.ops.quote_name(User._meta.get_field("referred_by").column)
+
+    if reset:
+        ReferralPath.objects.all().delete()
+
+    bounds = User.objects.order_by("pk").values_list("pk", flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        return 0
+
+    def run_chunks(sql: str, params) -> int:
+        written = 0
+        for start in range(first, last + 1, chunk_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(sql, [*params, start, start + chunk_size])
+                written += cursor.rowcount
+        return written
+
+    total = run_chunks(
+        f"INSERT INTO {path_table} (ancestor_id, descendant_id, depth) "
+        f"SELECT u.id, u.id, 0 FROM {user_table} u "
+        f"WHERE u.id >= %s AND u.id < %s AND NOT EXISTS ("
+        f"SELECT 1 FROM {path_table} x WHERE x.descendant_id = u.id AND x.ancestor_id = u.id)",
+        [],
+    )
+    if stdout:
+        stdout.write(f"Depth 0: {total} paths")
+
+    for depth in range(1, max_depth + 1):
+        written = run_chunks(
+            f"INSERT INTO {path_table} (ancestor_id, descendant_id, depth) "
+            f"SELECT p.ancestor_id, u.id, %s FROM {user_table} u "
+            f"JOIN {path_table} p ON p.descendant_id = u.{referred_by} AND p.depth = %s "
+            f"WHERE u.id >= %s AND u.id < %s AND NOT EXISTS ("
+            f"SELECT 1 FROM {path_table} x "
+            f"WHERE x.descendant_id = u.id AND x.ancestor_id = p.ancestor_id)",
+            [depth, depth - 1],
+        )
+        if stdout:
+            stdout.write(f"Depth {depth}: {written} paths")
+        total += written
+        if not written:
+            break
+    else:
+        logger.warning(
+            f"Referral tree build stopped at depth {max_depth}; check for referral cycles"
+        )
+
+    return total
+
+
+# Signal handlers to keep the closure table in sync with referred_by
+
+
+@receiver(post_save, sender=User)
+def update_referral_tree(sender, instance, created, raw=False, **kwargs):
+    """Add new users to the referral tree and move users whose referrer changed."""
+    if raw:
+        return
+    if created:
+        add_to_tree(instance)
+        return
+
+    # Skip instances whose referrer wasn't loaded; User.save resets the
+    # remembered referrer after this handler runs
+    if not hasattr(instance, "_loaded_referred_by_id") or "referred_by_id" not in instance.__dict__:
+        return
+    if instance._loaded_referred_by_id != instance.referred_by_id:
+        move_subtree(instance, instance._loaded_referred_by_id)
+
+
+@receiver(pre_delete, sender=User)
+def detach_referral_subtree(sender, instance, **kwargs):
+    """Cut a deleted user's downline loose from the deleted user's upline."""
+    ReferralPath.objects.filter(
+        descendant_id__in=ReferralPath.objects.filter(ancestor=instance).values("descendant_id"),
+        ancestor_id__in=ReferralPath.objects.filter(descendant=instance, depth__gte=1).values(
+            "ancestor_id"
+        ),
+    ).delete()
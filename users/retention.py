@@ -0,0 +1,248 @@
+"""
+Notification retention.
+
+``NOTIFICATION_RETENTION`` sets, per notification type, how many days
+notifications are kept and how many of the newest each user keeps. The
+``prune_notifications`` command enforces it in two passes:
+
+1. Expired notifications are deleted walking the notifications table in
+   primary key ranges.
+2. Notifications beyond each user's cap are deleted walking the users
+   table in primary key ranges.
+
+Every range is its own short transaction, so no statement holds locks or
+builds replication lag for long. Unread counters are adjusted for the rows
+removed. After each range the position is saved in the cache, and an
+interrupted run can be continued with ``--resume``.
+"""
+
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Notification
+from .notifications import adjust_unread_counts
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# Cache keys
+PRUNE_PROGRESS_KEY = "notification_prune_progress"
+
+# Cache timeouts (in seconds)
+PRUNE_PROGRESS_TIMEOUT = 60 * 60 * 24 * 7  # 7 days
+
+# Defaults used when the settings are missing
+DEFAULT_PRUNE_CHUNK_SIZE = 5000
+
+# Over-cap notifications deleted per statement
+OVER_CAP_BATCH_SIZE = 1000
+
+
+def get_retention_policy() -> Dict[str, Dict[str, int]]:
+    """
+    Get the retention policy.
+
+    Returns:
+        Dict[str, Dict[str, int]]: Per notification type, 'days' to keep and
+            'max_per_user' to keep; 0 or a missing entry means no limit
+    """
+    return getattr(settings, "NOTIFICATION_RETENTION", {})
+
+
+def _can_return_from_delete() -> bool:
+    if connection.vendor == "postgresql":
+        return True
+    return connection.vendor == "sqlite" and connection.Database.sqlite_version_info >= (3, 35)
+
+
+def _delete(notifications) -> int:
+    """
+    Delete notifications and stop counting the unread ones.
+
+    The rows are removed with one DELETE rather than ``QuerySet.delete()``,
+    which would load every row to send post_delete. Where the database
+    supports it the DELETE returns each row's user and read flag, so the
+    unread counts match exactly what was removed. Elsewhere the rows are
+    locked first, so they can't be marked read between counting and deleting.
+    """
+    qn = connection.ops.quote_name
+    table = qn(Notification._meta.db_table)
+    pk = qn(Notification._meta.pk.column)
+    user_column = qn(Notification._meta.get_field("user").column)
+    read_column = qn(Notification._meta.get_field("read").column)
+    columns = f"{user_column}, {read_column}"
+
+    if _can_return_from_delete():
+        sql, params = notifications.order_by().values("pk").query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({sql}) RETURNING {columns}", params)
+            rows = cursor.fetchall()
+        deleted = len(rows)
+        unread = Counter(user_id for user_id, read in rows if not read)
+    else:
+        rows = list(
+            notifications.select_for_update().order_by().values_list("pk", "user_id", "read")
+        )
+        deleted = 0
+        if rows:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {table} WHERE {pk} IN ({', '.join(['%s'] * len(rows))})",
+                    [row[0] for row in rows],
+                )
+                deleted = cursor.rowcount
+        unread = Counter(user_id for _, user_id, read in rows if not read)
+
+    adjust_unread_counts({user_id: -count for user_id, count in unread.items()})
+    return deleted
+
+
+def prune_expired(start: int, end: int, policy: Optional[Dict[str, Dict[str, int]]] = None) -> int:
+    """
+    Delete expired notifications with IDs in [start, end).
+
+    Args:
+        start (int): First notification ID of the range
+        end (int): End of the range (exclusive)
+        policy (Optional[Dict[str, Dict[str, int]]]): Defaults to NOTIFICATION_RETENTION
+
+    Returns:
+        int: The number of notifications deleted
+    """
+    policy = get_retention_policy() if policy is None else policy
+    now = timezone.now()
+
+    expired = Q()
+    for notification_type, rules in policy.items():
+        if rules.get("days"):
+            expired |= Q(
+                notification_type=notification_type,
+                created_at__lt=now - timedelta(days=rules["days"]),
+            )
+    if not expired:
+        return 0
+
+    with transaction.atomic():
+        return _delete(Notification.objects.filter(expired, pk__gte=start, pk__lt=end))
+
+
+def prune_over_cap(start: int, end: int, policy: Optional[Dict[str, Dict[str, int]]] = None) -> int:
+    """
+    Delete the notifications beyond the per-user caps for users with IDs in [start, end).
+
+    Args:
+        start (int): First user ID of the range
+        end (int): End of the range (exclusive)
+        policy (Optional[Dict[str, Dict[str, int]]]): Defaults to NOTIFICATION_RETENTION
+
+    Returns:
+        int: The number of notifications deleted
+    """
+    policy = get_retention_policy() if policy is None else policy
+    deleted = 0
+
+    for notification_type, rules in policy.items():
+        cap = rules.get("max_per_user")
+        if not cap:
+            continue
+        over_cap = (
+            Notification.objects.filter(
+                user_id__gte=start, user_id__lt=end, notification_type=notification_type
+            )
+            .annotate(
+                position=Window(RowNumber(), partition_by=[F("user_id")], order_by=F("id").desc())
+            )
+            .filter(position__gt=cap)
+            .order_by("user_id", "-id")
+            .values_list("pk", flat=True)
+        )
+        # Deleting rows past the cap never brings a kept row over it, so
+        # take fixed-size batches until none are left
+        while True:
+            batch = list(over_cap[:OVER_CAP_BATCH_SIZE])
+            if not batch:
+                break
+            with transaction.atomic():
+                deleted += _delete(Notification.objects.filter(pk__in=batch))
+            if len(batch) < OVER_CAP_BATCH_SIZE:
+                break
+
+    return deleted
+
+
+def _id_bounds(queryset):
+    ids = queryset.order_by("pk").values_list("pk", flat=True)
+    return ids.first(), ids.last()
+
+
+def prune_notifications(
+    chunk_size: Optional[int] = None, resume: bool = False, pause: float = 0, stdout=None
+) -> Dict[str, int]:
+    """
+    Enforce the retention policy over the whole notifications table.
+
+    Args:
+        chunk_size (Optional[int]): IDs covered per range; defaults to
+            NOTIFICATION_PRUNE_CHUNK_SIZE
+        resume (bool): Continue from the position saved by an interrupted run
+        pause (float): Seconds to sleep between ranges to let replicas catch up
+        stdout: Optional stream for progress messages
+
+    Returns:
+        Dict[str, int]: Notifications deleted as 'expired' and 'over_cap'
+    """
+    chunk_size = chunk_size or getattr(
+        settings, "NOTIFICATION_PRUNE_CHUNK_SIZE", DEFAULT_PRUNE_CHUNK_SIZE
+    )
+    policy = get_retention_policy()
+    progress = (cache.get(PRUNE_PROGRESS_KEY) if resume else None) or {
+        "phase": "expired",
+        "position": None,
+    }
+    totals = {"expired": 0, "over_cap": 0}
+
+    passes = [
+        ("expired", Notification.objects.all(), prune_expired),
+        ("over_cap", User.objects.all(), prune_over_cap),
+    ]
+    if progress["phase"] == "over_cap":
+        passes = passes[1:]
+
+    for phase, queryset, prune in passes:
+        first, last = _id_bounds(queryset)
+        if first is None:
+            continue
+        if progress["phase"] == phase and progress["position"] is not None:
+            first = progress["position"]
+
+        for start in range(first, last + 1, chunk_size):
+            end = start + chunk_size
+            totals[phase] += prune(start, end, policy)
+            cache.set(PRUNE_PROGRESS_KEY, {"phase": phase, "position": end}, PRUNE_PROGRESS_TIMEOUT)
+            if stdout is not None:
+                stdout.write(
+                    f"{phase}: ids up to {min(end, last + 1) - 1} of {last}, "
+                    f"{totals[phase]} deleted"
+                )
+            if pause:
+                time.sleep(pause)
+
+        progress = {"phase": None, "position": None}
+
+    cache.delete(PRUNE_PROGRESS_KEY)
+    logger.info(
+        f"Pruned {totals['expired']} expired and {totals['over_cap']} over-cap notifications"
+    )
+    return totals
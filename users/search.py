@@ -0,0 +1,159 @@
+"""
+Substring search over usernames and emails for the admin panel.
+
+Matching is the same case-insensitive "contains" as ``icontains``, served
+from an index on each database:
+
+* PostgreSQL: pg_trgm GIN indexes on ``UPPER(username)`` and
+  ``UPPER(email)``, which are the expressions Django's ``icontains`` compares,
+  so the ORM lookup itself becomes an index scan.
+* SQLite: an FTS5 table with the trigram tokenizer, kept in step with the
+  users table by triggers and queried with MATCH.
+
+Trigrams need at least three characters, so shorter queries fall back to
+``icontains``. Suggestions for a query are cached under its normalized form.
+The shortest prefixes, which every search starts with, are also kept in
+process, so most keystrokes are answered without a round trip.
+"""
+
+import hashlib
+from typing import List
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from core.tiered_cache import LocalCache
+
+User = get_user_model()
+
+# FTS5 table indexing usernames and emails on SQLite
+SEARCH_INDEX_TABLE = "users_user_search"
+SEARCH_FIELDS = ("username", "email")
+
+# Trigram indexes can't answer shorter queries
+MIN_INDEXED_LENGTH = 3
+MIN_SUGGESTION_LENGTH = 2
+
+# Cache keys
+SUGGESTIONS_KEY_TEMPLATE = "user_search_suggestions_{}"
+PLAN_NAMES_KEY = "user_search_plan_names"
+
+# Cache timeouts (in seconds)
+SUGGESTIONS_TIMEOUT = 60
+PLAN_NAMES_TIMEOUT = 60 * 5  # 5 minutes
+
+# Prefixes up to this length are also cached in process
+SHORT_PREFIX_LENGTH = 3
+LOCAL_CACHE_SIZE = 1024
+LOCAL_CACHE_TIMEOUT = 30  # seconds
+
+
+_short_prefixes = LocalCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TIMEOUT)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so equivalent queries share cache entries.
+
+    Args:
+        query (str): The raw query
+
+    Returns:
+        str: The query lowercased with whitespace collapsed
+    """
+    return " ".join(query.split()).lower()
+
+
+def filter_users(queryset, query: str, field: str = "username"):
+    """
+    Filter users to those whose username or email contains the query.
+
+    Args:
+        queryset (QuerySet): The users to search
+        query (str): Text to look for, case-insensitively
+        field (str): 'username' or 'email'
+
+    Returns:
+        QuerySet: The matching users
+    """
+    if field not in SEARCH_FIELDS:
+        raise ValueError(f"field must be one of {SEARCH_FIELDS}")
+
+    if connections[queryset.db].vendor == "sqlite" and len(query) >= MIN_INDEXED_LENGTH:
+        phrase = '"' + query.replace('"', '""') + '"'
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT rowid FROM {SEARCH_INDEX_TABLE} WHERE {SEARCH_INDEX_TABLE} MATCH %s",
+                [f"{field} : {phrase}"],
+            )
+        )
+
+    # PostgreSQL's trigram indexes serve icontains as is
+    return queryset.filter(**{f"{field}__icontains": query})
+
+
+def _plan_names() -> List[str]:
+    """Names of the plans users are subscribed to; a handful of rows, cached."""
+    names = cache.get(PLAN_NAMES_KEY)
+    if names is None:
+        from plans.models import Plan
+
+        names = list(
+            Plan.objects.filter(subscriptions__isnull=False)
+            .values_list("name", flat=True)
+            .distinct()
+        )
+        cache.set(PLAN_NAMES_KEY, names, PLAN_NAMES_TIMEOUT)
+    return names
+
+
+def _find_suggestions(query: str, limit: int) -> List[str]:
+    suggestions = list(
+        filter_users(User.objects.all(), query).values_list("username", flat=True)[:limit]
+    )
+
+    # Only the local part of emails is shown
+    emails = filter_users(User.objects.all(), query, "email").values_list("email", flat=True)[
+        :limit
+    ]
+    suggestions.extend(f"{email.split('@')[0]}@..." for email in emails)
+
+    suggestions.extend(name for name in _plan_names() if query in name.lower())
+
+    # Remove duplicates and limit the suggestions
+    return list(dict.fromkeys(suggestions))[:limit]
+
+
+def get_suggestions(query: str, limit: int = 5) -> List[str]:
+    """
+    Get search suggestions from usernames, emails and plan names.
+
+    Args:
+        query (str): The text typed so far
+        limit (int): Maximum number of suggestions
+
+    Returns:
+        List[str]: Matching usernames, masked emails and plan names
+    """
+    query = normalize_query(query)
+    if len(query) < MIN_SUGGESTION_LENGTH:
+        return []
+
+    digest = hashlib.md5(f"{limit}:{query}".encode()).hexdigest()
+    short = len(query) <= SHORT_PREFIX_LENGTH
+    if short:
+        suggestions = _short_prefixes.get(digest)
+        if suggestions is not None:
+            return suggestions
+
+    cache_key = SUGGESTIONS_KEY_TEMPLATE.format(digest)
+    suggestions = cache.get(cache_key)
+    if suggestions is None:
+        suggestions = _find_suggestions(query, limit)
+        cache.set(cache_key, suggestions, SUGGESTIONS_TIMEOUT)
+
+    if short:
+        _short_prefixes.set(digest, suggestions)
+    return suggestions
@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient, APITestCase
@@ -200,3 +200,769 @@ class UserAPITests(APITestCase):
         response = self.client.get(self.me_url)
 
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class UserCacheTests(TestCase):
+    """
+    Test suite for the cached user projection used by CustomAuthBackend
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='cacheduser',
+            email='cached@example.com',
+            password='testpass123'
+        )
+        self.user.funding_wallet = Decimal('25.00')
+        self.user.save()
+
+    def test_get_user_served_from_cache(self):
+        """
+        Test that a cached projection is returned without a query
+        """
+        from users.backends import CustomAuthBackend
+        backend = CustomAuthBackend()
+        backend.get_user(self.user.pk)
+
+        with self.assertNumQueries(0):
+            user = backend.get_user(self.user.pk)
+            self.assertEqual(user.username, 'cacheduser')
+            self.assertTrue(user.is_authenticated)
+
+    def test_deferred_fields_load_in_one_query(self):
+        """
+        Test that reading a wallet field loads every deferred column at once
+        """
+        from users.cache import get_cached_user
+        user = get_cached_user(self.user.pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(user.balance, 25.0)
+            self.assertFalse(user.is_account_locked())
+
+    def test_save_invalidates_cache(self):
+        """
+        Test that saving a user drops the cached projection
+        """
+        from users.cache import get_cached_user
+        get_cached_user(self.user.pk)
+
+        self.user.first_name = 'Updated'
+        self.user.save()
+
+        self.assertEqual(get_cached_user(self.user.pk).first_name, 'Updated')
+
+    def test_inactive_user_not_returned(self):
+        """
+        Test that get_user rejects inactive users
+        """
+        from users.backends import CustomAuthBackend
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(CustomAuthBackend().get_user(self.user.pk))
+
+
+class LoginThrottlingTests(TestCase):
+    """
+    Test suite for cache-backed failed-login throttling
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='throttled',
+            email='throttled@example.com',
+            password='testpass123'
+        )
+
+    def test_failed_login_does_not_write(self):
+        """
+        Test that a failed attempt below the limit only reads the user row
+        """
+        from users.backends import CustomAuthBackend
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(CustomAuthBackend().authenticate(None, username='throttled', password='wrong'))
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.failed_login_attempts, 0)
+
+    def test_account_locks_after_limit(self):
+        """
+        Test that reaching the limit persists the lock and blocks logins
+        """
+        from django.core.exceptions import ValidationError
+        from users.backends import CustomAuthBackend
+        backend = CustomAuthBackend()
+
+        for _ in range(5):
+            backend.authenticate(None, username='throttled', password='wrong')
+
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.account_locked_until)
+        with self.assertRaises(ValidationError):
+            backend.authenticate(None, username='throttled', password='testpass123')
+
+    def test_successful_login_clears_failures(self):
+        """
+        Test that a successful login resets the failure count
+        """
+        from users.backends import CustomAuthBackend
+        from users.throttling import failed_login_count
+        backend = CustomAuthBackend()
+
+        backend.authenticate(None, username='throttled', password='wrong')
+        self.assertEqual(failed_login_count(self.user.pk), 1)
+
+        self.assertEqual(backend.authenticate(None, username='throttled', password='testpass123'), self.user)
+        self.assertEqual(failed_login_count(self.user.pk), 0)
+
+
+class ReferralCodeAllocatorTests(TestCase):
+    """
+    Test suite for sequence-derived referral codes
+    """
+
+    def test_codes_are_unique_and_valid(self):
+        """
+        Test that consecutive sequence numbers map to distinct, valid codes
+        """
+        from users.referral_codes import encode_referral_code
+        codes = [encode_referral_code(number) for number in range(2000)]
+
+        self.assertEqual(len(set(codes)), len(codes))
+        for code in codes[:50]:
+            User.referral_code_validator(code)
+
+    def test_allocation_reserves_blocks(self):
+        """
+        Test that codes come from one reserved block until it runs out
+        """
+        from users.models import ReferralCodeBlock
+        from users.referral_codes import ReferralCodeAllocator
+        allocator = ReferralCodeAllocator(block_size=10)
+
+        with self.assertNumQueries(1):
+            codes = [allocator.allocate() for _ in range(10)]
+        codes += allocator.allocate_many(25)
+
+        self.assertEqual(len(set(codes)), 35)
+        self.assertEqual(ReferralCodeBlock.objects.count(), 4)
+
+    def test_assign_referral_codes_in_memory(self):
+        """
+        Test that bulk-created users can be given codes before insert
+        """
+        from users.referral_codes import assign_referral_codes
+        users = [User(username=f'bulk{i}', email=f'bulk{i}@example.com') for i in range(3)]
+
+        assign_referral_codes(users)
+        User.objects.bulk_create(users)
+
+        self.assertEqual(User.objects.filter(referral_code__isnull=False).count(), 3)
+
+
+class ReferralTreeTests(TestCase):
+    """
+    Test suite for the referral closure table
+    """
+
+    def setUp(self):
+        # root -> child -> grandchild, root -> sibling
+        self.root = User.objects.create_user(username='root', email='root@example.com', password='testpass123')
+        self.child = User.objects.create_user(
+            username='child', email='child@example.com', password='testpass123', referred_by=self.root
+        )
+        self.grandchild = User.objects.create_user(
+            username='grandchild', email='grandchild@example.com', password='testpass123', referred_by=self.child
+        )
+        self.sibling = User.objects.create_user(
+            username='sibling', email='sibling@example.com', password='testpass123', referred_by=self.root
+        )
+
+    def test_signup_adds_paths(self):
+        """
+        Test that new users are linked to their whole upline
+        """
+        from users.referral_tree import get_downline, get_downline_counts_by_depth, get_downline_size
+
+        self.assertEqual(get_downline_size(self.root), 3)
+        self.assertEqual(get_downline_size(self.root, max_depth=1), 2)
+        self.assertEqual(get_downline_counts_by_depth(self.root), {1: 2, 2: 1})
+        self.assertEqual(
+            [(user.username, user.referral_depth) for user in get_downline(self.root)],
+            [('child', 1), ('sibling', 1), ('grandchild', 2)],
+        )
+
+    def test_changing_referrer_moves_downline(self):
+        """
+        Test that re-parenting a user moves their downline with them
+        """
+        from users.referral_tree import get_downline_size
+
+        self.child.referred_by = self.sibling
+        self.child.save()
+
+        self.assertEqual(get_downline_size(self.sibling), 2)
+        self.assertEqual(get_downline_size(self.root), 3)
+        self.assertEqual(get_downline_size(self.root, max_depth=2), 2)
+
+    def test_deleting_user_detaches_downline(self):
+        """
+        Test that a deleted user's downline leaves the upline's tree
+        """
+        from users.referral_tree import get_downline_size
+
+        self.child.delete()
+
+        self.assertEqual(get_downline_size(self.root), 1)
+
+    def test_backfill_rebuilds_tree(self):
+        """
+        Test that the backfill command reproduces the maintained table
+        """
+        from django.core.management import call_command
+        from io import StringIO
+        from users.models import ReferralPath
+
+        expected = set(ReferralPath.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        call_command('backfill_referral_paths', '--reset', '--chunk-size', '2', stdout=StringIO())
+
+        self.assertEqual(set(ReferralPath.objects.values_list('ancestor_id', 'descendant_id', 'depth')), expected)
+
+
+class NotificationCounterTests(TestCase):
+    """
+    Test suite for the cached unread notification counter
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='notified',
+            email='notified@example.com',
+            password='testpass123'
+        )
+
+    def test_counter_follows_create_read_and_delete(self):
+        """
+        Test that the counter is adjusted by each notification change
+        """
+        from users.models import Notification
+        from users.notifications import get_unread_count
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Notification.create_notification(self.user, 'First', title='First')
+            second = Notification.create_notification(self.user, 'Second', title='Second')
+            Notification.create_notification(self.user, 'Third', title='Third')
+        self.assertEqual(get_unread_count(self.user.pk), 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.mark_as_read()
+            first.mark_as_read()
+        self.assertEqual(get_unread_count(self.user.pk), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertEqual(get_unread_count(self.user.pk), 1)
+
+    def test_count_read_before_commit_is_not_kept(self):
+        """
+        Test that a count loaded while a change was uncommitted is reloaded afterwards
+        """
+        from users.models import Notification
+        from users.notifications import get_unread_count
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.create_notification(self.user, 'First', title='First')
+        self.assertEqual(get_unread_count(self.user.pk), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.create_notification(self.user, 'Second', title='Second')
+            # A concurrent reader still sees the committed count
+            self.assertEqual(get_unread_count(self.user.pk), 1)
+
+        self.assertEqual(get_unread_count(self.user.pk), 2)
+
+    def test_unread_count_endpoint_skips_notifications_table(self):
+        """
+        Test that a cached badge count is served without any query
+        """
+        from users.models import Notification
+        from users.notifications import get_unread_count
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.create_notification(self.user, 'Hello', title='Hello')
+        get_unread_count(self.user.pk)
+        self.client.force_login(self.user)
+        self.client.get(reverse('users:unread_notification_count'))
+
+        with self.assertNumQueries(1):
+            # Only the session lookup; the user and the count come from cache
+            response = self.client.get(reverse('users:unread_notification_count'))
+        self.assertEqual(response.json()['unread_count'], 1)
+
+    def test_mark_all_read_resets_counter(self):
+        """
+        Test that marking everything read clears the counter
+        """
+        from users.models import Notification
+        from users.notifications import get_unread_count
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.create_notification(self.user, 'One', title='One')
+            Notification.create_notification(self.user, 'Two', title='Two')
+        self.client.force_login(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('users:mark_all_notifications_read'))
+
+        self.assertEqual(get_unread_count(self.user.pk), 0)
+
+    def test_notification_pages_walk_by_cursor(self):
+        """
+        Test that pages follow the cursor and only mark their own rows read
+        """
+        from users.models import Notification
+        from users.notifications import NOTIFICATION_PAGE_SIZE, create_notifications, get_unread_count
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_notifications([
+                Notification(user=self.user, title=f'Note {i}', message=f'Note {i}')
+                for i in range(NOTIFICATION_PAGE_SIZE + 5)
+            ])
+        self.client.force_login(self.user)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(reverse('frontend:notifications'))
+        first_page = response.context['notifications']
+        self.assertEqual(len(first_page), NOTIFICATION_PAGE_SIZE)
+        self.assertEqual(first_page[0].title, f'Note {NOTIFICATION_PAGE_SIZE + 4}')
+        self.assertEqual(get_unread_count(self.user.pk), 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get(
+                reverse('users:notification_list'), {'before': response.context['next_before']}
+            )
+        data = response.json()
+        self.assertEqual([n['title'] for n in data['notifications']], [f'Note {i}' for i in range(4, -1, -1)])
+        self.assertIsNone(data['next_before'])
+        self.assertEqual(get_unread_count(self.user.pk), 0)
+
+
+class BroadcastNotificationTests(TestCase):
+    """
+    Test suite for broadcasting a notification to many users
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.users = [
+            User.objects.create_user(
+                username=f'member{i}',
+                email=f'member{i}@example.com',
+                password='testpass123'
+            )
+            for i in range(5)
+        ]
+        self.inactive = User.objects.create_user(
+            username='inactive',
+            email='inactive@example.com',
+            password='testpass123',
+            is_active=False
+        )
+
+    def test_broadcast_reaches_active_users_in_chunks(self):
+        """
+        Test that every active user gets one notification and one more unread
+        """
+        from users.models import Notification
+        from users.notifications import broadcast_notification, get_unread_count
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.create_notification(self.users[0], 'Earlier', title='Earlier')
+        self.assertEqual(get_unread_count(self.users[0].pk), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sent = broadcast_notification('Maintenance tonight', title='Maintenance', chunk_size=2)
+
+        self.assertEqual(sent, 5)
+        self.assertEqual(Notification.objects.filter(title='Maintenance').count(), 5)
+        self.assertFalse(Notification.objects.filter(user=self.inactive).exists())
+        self.assertEqual(get_unread_count(self.users[0].pk), 2)
+        self.assertEqual(get_unread_count(self.users[4].pk), 1)
+
+    def test_broadcast_query_count_does_not_grow_per_user(self):
+        """
+        Test that a chunk costs a fixed number of queries
+        """
+        from users.notifications import broadcast_notification
+
+        # Fetch ids, savepoint, insert, create counters, update counters,
+        # release, then one empty fetch
+        with self.assertNumQueries(7):
+            broadcast_notification('Hello everyone', title='Hello', chunk_size=100)
+
+    def test_broadcast_endpoint_requires_staff(self):
+        """
+        Test that only staff can broadcast through the API
+        """
+        import json
+        from users.models import Notification
+
+        url = reverse('users:broadcast_notification')
+        payload = json.dumps({'title': 'News', 'message': 'Big news'})
+
+        self.client.force_login(self.users[0])
+        response = self.client.post(url, payload, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+        staff = User.objects.create_user(
+            username='staff',
+            email='staff@example.com',
+            password='testpass123',
+            is_staff=True
+        )
+        self.client.force_login(staff)
+        response = self.client.post(url, payload, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['sent'], 6)
+        self.assertEqual(Notification.objects.filter(title='News').count(), 6)
+
+        for body in ('["News"]', '"News"'):
+            response = self.client.post(url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_admin_page_notifies_matching_users(self):
+        """
+        Test that the custom admin page notifies the users matching its search
+        """
+        from users.models import Notification
+
+        staff = User.objects.create_user(
+            username='staff',
+            email='staff@example.com',
+            password='testpass123',
+            is_staff=True
+        )
+        self.client.force_login(staff)
+        url = reverse('admin:broadcast_notification')
+
+        response = self.client.get(url, {'search': 'member'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['recipient_count'], 5)
+
+        response = self.client.post(url, {
+            'search': 'member',
+            'title': 'Members',
+            'message': 'Members only',
+            'notification_type': 'success',
+        })
+
+        self.assertRedirects(response, reverse('admin:manage_users'), fetch_redirect_response=False)
+        self.assertEqual(Notification.objects.filter(title='Members').count(), 5)
+        self.assertFalse(Notification.objects.filter(user=staff).exists())
+
+
+class NotificationPushTests(TestCase):
+    """
+    Test suite for pushing new notifications to open streams
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='listener',
+            email='listener@example.com',
+            password='testpass123'
+        )
+
+    @override_settings(NOTIFICATION_PUSH_ENABLED=True)
+    def test_stream_receives_committed_notification(self):
+        """
+        Test that a notification created on another thread reaches an open stream
+        """
+        import asyncio
+        import threading
+        import time
+        from users.models import Notification
+        from users.push import broker, notification_events
+
+        received = []
+
+        async def listen():
+            events = notification_events(self.user.pk, keepalive=1, duration=5)
+            received.append(await anext(events))
+            while len(received) < 2 or received[-1].startswith(':'):
+                received.append(await anext(events))
+            await events.aclose()
+
+        listener = threading.Thread(target=asyncio.run, args=(listen(),))
+        listener.start()
+        deadline = time.monotonic() + 5
+        while not broker.connected(self.user.pk) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = Notification.create_notification(self.user, 'Deposit confirmed', title='Deposit')
+        listener.join(5)
+
+        self.assertTrue(received[0].startswith('retry:'))
+        self.assertTrue(received[-1].startswith('event: notification\ndata: '))
+        self.assertIn(f'"id": {notification.pk}', received[-1])
+        self.assertEqual(broker.connected(self.user.pk), 0)
+
+    def test_broadcast_pushes_once_per_chunk(self):
+        """
+        Test that a broadcast publishes one event per chunk of recipients
+        """
+        from unittest import mock
+        from users.notifications import broadcast_notification
+
+        User.objects.create_user(username='second', email='second@example.com', password='testpass123')
+        with mock.patch('users.notifications.publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                broadcast_notification('Hello', title='Hello', chunk_size=1)
+
+        self.assertEqual(publish.call_count, 2)
+        self.assertEqual(publish.call_args.args[1]['message'], 'Hello')
+
+    def test_bulk_notifications_publish_once_and_only_when_enabled(self):
+        """
+        Test that a bulk insert is one publish, and nothing is published with push disabled
+        """
+        import json
+        from unittest import mock
+        from users.models import Notification
+        from users.notifications import create_notifications
+
+        def notify():
+            with self.captureOnCommitCallbacks(execute=True):
+                create_notifications([
+                    Notification(user=self.user, title='Note', message=f'Note {i}') for i in range(3)
+                ])
+
+        with mock.patch('users.push._redis') as redis_client:
+            notify()
+            redis_client.assert_not_called()
+
+            with self.settings(NOTIFICATION_PUSH_ENABLED=True, NOTIFICATION_PUSH_REDIS_URL='redis://push'):
+                notify()
+        self.assertEqual(redis_client.return_value.publish.call_count, 1)
+        payload = json.loads(redis_client.return_value.publish.call_args.args[1])
+        self.assertEqual([m['event']['message'] for m in payload['messages']], ['Note 0', 'Note 1', 'Note 2'])
+
+    @override_settings(NOTIFICATION_PUSH_ENABLED=True)
+    async def test_stream_view_requires_login(self):
+        """
+        Test that the stream is only served to signed-in users
+        """
+        url = reverse('users:notification_stream')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 302)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue((await anext(aiter(response.streaming_content))).startswith(b'retry:'))
+
+    def test_stream_is_not_served_without_asgi(self):
+        """
+        Test that the stream ends at once when push is disabled or the request came through WSGI
+        """
+        self.client.force_login(self.user)
+        url = reverse('users:notification_stream')
+
+        self.assertEqual(self.client.get(url).status_code, 204)
+        with self.settings(NOTIFICATION_PUSH_ENABLED=True):
+            self.assertEqual(self.client.get(url).status_code, 204)
+
+        # The badge polls the unread count instead
+        response = self.client.get(reverse('frontend:notifications'))
+        self.assertNotContains(response, 'new EventSource(')
+        self.assertContains(response, reverse('users:unread_notification_count'))
+
+
+class NotificationRetentionTests(TestCase):
+    """
+    Test suite for pruning notifications by age and per-user caps
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='retained',
+            email='retained@example.com',
+            password='testpass123'
+        )
+
+    def _notify(self, count, notification_type='info', days_old=0):
+        from datetime import timedelta
+        from django.utils import timezone
+        from users.models import Notification
+        from users.notifications import create_notifications
+
+        created = create_notifications([
+            Notification(user=self.user, title='Note', message='Note', notification_type=notification_type)
+            for _ in range(count)
+        ])
+        if days_old:
+            Notification.objects.filter(pk__in=[n.pk for n in created]).update(
+                created_at=timezone.now() - timedelta(days=days_old)
+            )
+        return created
+
+    def test_prune_applies_age_and_cap_per_type(self):
+        """
+        Test that old notifications and those over the cap are deleted
+        """
+        from django.test import override_settings
+        from users.models import Notification
+        from users.notifications import get_unread_count
+        from users.retention import prune_notifications
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._notify(2, 'info', days_old=40)
+            self._notify(2, 'error', days_old=40)
+            newest = self._notify(4, 'info')
+
+        policy = {'info': {'days': 30, 'max_per_user': 3}, 'error': {'days': 60}}
+        with override_settings(NOTIFICATION_RETENTION=policy):
+            with self.captureOnCommitCallbacks(execute=True):
+                totals = prune_notifications(chunk_size=2)
+
+        self.assertEqual(totals, {'expired': 2, 'over_cap': 1})
+        self.assertEqual(Notification.objects.filter(notification_type='error').count(), 2)
+        self.assertEqual(
+            set(Notification.objects.filter(notification_type='info').values_list('pk', flat=True)),
+            {n.pk for n in newest[1:]},
+        )
+        self.assertEqual(get_unread_count(self.user.pk), 5)
+
+    def test_over_cap_is_deleted_in_batches(self):
+        """
+        Test that over-cap rows are deleted in fixed-size batches with or without DELETE ... RETURNING
+        """
+        from unittest.mock import patch
+        from users.models import Notification
+        from users.notifications import get_unread_count
+        from users.retention import prune_over_cap
+
+        policy = {'info': {'max_per_user': 2}}
+        for can_return in (True, False):
+            with self.captureOnCommitCallbacks(execute=True):
+                Notification.objects.all().delete()
+                created = self._notify(5, 'info')
+                created[0].mark_as_read()
+
+            with patch('users.retention.OVER_CAP_BATCH_SIZE', 2), \
+                    patch('users.retention._can_return_from_delete', return_value=can_return):
+                with self.captureOnCommitCallbacks(execute=True):
+                    deleted = prune_over_cap(self.user.pk, self.user.pk + 1, policy)
+
+            self.assertEqual(deleted, 3)
+            self.assertEqual(
+                set(Notification.objects.values_list('pk', flat=True)), {n.pk for n in created[3:]}
+            )
+            # The read row removed isn't subtracted from the unread count
+            self.assertEqual(get_unread_count(self.user.pk), 2)
+
+    def test_prune_resumes_from_saved_position(self):
+        """
+        Test that a resumed run skips the ranges already pruned
+        """
+        from django.core.cache import cache
+        from django.test import override_settings
+        from users.models import Notification
+        from users.retention import PRUNE_PROGRESS_KEY, prune_notifications
+
+        old = self._notify(4, 'info', days_old=40)
+        cache.set(PRUNE_PROGRESS_KEY, {'phase': 'expired', 'position': old[2].pk})
+
+        with override_settings(NOTIFICATION_RETENTION={'info': {'days': 30}}):
+            totals = prune_notifications(chunk_size=1, resume=True)
+
+        self.assertEqual(totals['expired'], 2)
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertIsNone(cache.get(PRUNE_PROGRESS_KEY))
+
+
+class UserSearchTests(TestCase):
+    """
+    Test suite for the indexed admin user search
+    """
+
+    def setUp(self):
+        from django.core.cache import cache
+        from users.search import _short_prefixes
+        cache.clear()
+        _short_prefixes.clear()
+        self.alice = User.objects.create_user(
+            username='AliceWonder',
+            email='alice@example.com',
+            password='testpass123'
+        )
+        self.bob = User.objects.create_user(
+            username='bobbuilder',
+            email='bob@builders.org',
+            password='testpass123'
+        )
+
+    def test_filter_matches_substrings_and_follows_changes(self):
+        """
+        Test that search matches like icontains and sees renames and deletes
+        """
+        from users.search import filter_users
+
+        users = User.objects.all()
+        self.assertEqual(list(filter_users(users, 'cewon')), [self.alice])
+        self.assertEqual(list(filter_users(users, 'builders.', field='email')), [self.bob])
+        self.assertEqual(list(filter_users(users, 'bo')), [self.bob])
+
+        self.alice.username = 'alicesprings'
+        self.alice.save()
+        self.assertFalse(filter_users(users, 'wonder').exists())
+        self.assertEqual(list(filter_users(users, 'SPRING')), [self.alice])
+
+        self.bob.delete()
+        self.assertFalse(filter_users(users, 'builder').exists())
+
+    def test_suggestions_are_cached_by_normalized_query(self):
+        """
+        Test that repeated and equivalent queries are served from cache
+        """
+        from users.search import get_suggestions
+
+        from django.core.cache import cache
+
+        self.assertEqual(get_suggestions('alic'), ['AliceWonder', 'alice@...'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_suggestions('  ALIC '), ['AliceWonder', 'alice@...'])
+
+        # Short prefixes are also kept in process
+        get_suggestions('ali')
+        cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_suggestions('ali'), ['AliceWonder', 'alice@...'])
+
+    def test_suggestions_endpoint(self):
+        """
+        Test that the admin suggestions endpoint returns matches
+        """
+        staff = User.objects.create_user(
+            username='searcher',
+            email='searcher@example.com',
+            password='testpass123',
+            is_staff=True
+        )
+        self.client.force_login(staff)
+        response = self.client.get(reverse('admin:search_suggestions'), {'q': 'bobb'})
+        self.assertEqual(response.json()['suggestions'], ['bobbuilder'])
@@ -0,0 +1,152 @@
+"""
+Failed-login throttling for the users app.
+
+Failed attempts are counted in the cache with a sliding-window counter made of
+two fixed buckets: the current window's count plus the previous window's count
+weighted by how much of it still overlaps the sliding window. Counting an
+attempt is a single atomic ``incr``; the User row is only written when an
+account becomes locked or a locked account is unlocked.
+
+The lock is mirrored to ``User.account_locked_until`` so it survives a cache
+flush and stays visible in the admin.
+"""
+
+import logging
+import time
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Cache keys
+LOGIN_FAILURES_KEY_TEMPLATE = "login_failures_{}_{}"
+LOGIN_LOCK_KEY_TEMPLATE = "login_lock_{}"
+
+# Defaults used when the settings are missing
+DEFAULT_LOGIN_FAILURE_LIMIT = 5
+DEFAULT_LOGIN_FAILURE_WINDOW = 60 * 15  # 15 minutes
+DEFAULT_LOGIN_LOCKOUT_DURATION = 60 * 30  # 30 minutes
+
+
+def _failure_limit() -> int:
+    return getattr(settings, "LOGIN_FAILURE_LIMIT", DEFAULT_LOGIN_FAILURE_LIMIT)
+
+
+def _failure_window() -> int:
+    return getattr(settings, "LOGIN_FAILURE_WINDOW", DEFAULT_LOGIN_FAILURE_WINDOW)
+
+
+def _lockout_duration() -> int:
+    return getattr(settings, "LOGIN_LOCKOUT_DURATION", DEFAULT_LOGIN_LOCKOUT_DURATION)
+
+
+def _bucket_keys(user_id: int, now: float):
+    window = _failure_window()
+    bucket = int(now // window)
+    elapsed = (now % window) / window
+    return (
+        LOGIN_FAILURES_KEY_TEMPLATE.format(user_id, bucket),
+        LOGIN_FAILURES_KEY_TEMPLATE.format(user_id, bucket - 1),
+        elapsed,
+    )
+
+
+def failed_login_count(user_id: int, now: Optional[float] = None) -> int:
+    """
+    Return the number of failed logins inside the sliding window.
+
+    Args:
+        user_id (int): The ID of the user
+        now (Optional[float]): Unix time to evaluate at, defaults to the current time
+
+    Returns:
+        int: The weighted failure count, rounded down
+    """
+    now = time.time() if now is None else now
+    current_key, previous_key, elapsed = _bucket_keys(user_id, now)
+    counts = cache.get_many([current_key, previous_key])
+    return int(counts.get(current_key, 0) + counts.get(previous_key, 0) * (1 - elapsed))
+
+
+def is_login_locked(user) -> bool:
+    """
+    Check whether a user is locked out, without writing anything.
+
+    Args:
+        user (User): The user attempting to log in
+
+    Returns:
+        bool: True if the account is locked
+    """
+    if cache.get(LOGIN_LOCK_KEY_TEMPLATE.format(user.pk)):
+        return True
+    # Fall back to the persisted lock in case the cache was flushed
+    return bool(user.account_locked_until and timezone.now() < user.account_locked_until)
+
+
+def record_failed_login(user) -> bool:
+    """
+    Count a failed login and lock the account once the limit is reached.
+
+    Args:
+        user (User): The user whose password check failed
+
+    Returns:
+        bool: True if this attempt locked the account
+    """
+    now = time.time()
+    current_key, _, _ = _bucket_keys(user.pk, now)
+    timeout = _failure_window() * 2
+
+    cache.add(current_key, 0, timeout)
+    try:
+        cache.incr(current_key)
+    except ValueError:
+        # The key expired between add() and incr()
+        cache.set(current_key, 1, timeout)
+
+    failures = failed_login_count(user.pk, now)
+    if failures < _failure_limit():
+        return False
+
+    # Only the attempt that creates the lock key persists the lock
+    lockout = _lockout_duration()
+    if not cache.add(LOGIN_LOCK_KEY_TEMPLATE.format(user.pk), True, lockout):
+        return False
+
+    locked_until = timezone.now() + timedelta(seconds=lockout)
+    get_user_model().objects.filter(pk=user.pk).update(
+        failed_login_attempts=failures,
+        last_failed_login=timezone.now(),
+        account_locked_until=locked_until,
+    )
+    user.failed_login_attempts = failures
+    user.account_locked_until = locked_until
+    logger.warning(f"Locked user {user.pk} after {failures} failed logins")
+    return True
+
+
+def clear_failed_logins(user) -> None:
+    """
+    Forget failed logins after a successful one.
+
+    The User row is only written if it still carries a lock or failure count.
+
+    Args:
+        user (User): The user who logged in
+    """
+    current_key, previous_key, _ = _bucket_keys(user.pk, time.time())
+    cache.delete_many([current_key, previous_key, LOGIN_LOCK_KEY_TEMPLATE.format(user.pk)])
+
+    if user.failed_login_attempts or user.account_locked_until:
+        get_user_model().objects.filter(pk=user.pk).update(
+            failed_login_attempts=0,
+            account_locked_until=None,
+        )
+        user.failed_login_attempts = 0
+        user.account_locked_until = None
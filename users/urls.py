@@ -33,6 +33,10 @@ urlpatterns = [
     path('api/notifications/<int:notification_id>/mark-read/', views.mark_notification_read, name='mark_notification_read'),
     path('api/notifications/<int:notification_id>/', views.delete_notification, name='delete_notification'),
     path('api/notifications/mark-all-read/', views.mark_all_read, name='mark_all_notifications_read'),
+    path('api/notifications/', views.notification_list, name='notification_list'),
+    path('api/notifications/stream/', views.notification_stream, name='notification_stream'),
+    path('api/notifications/unread-count/', views.unread_notification_count, name='unread_notification_count'),
+    path('api/notifications/broadcast/', views.broadcast_notification_view, name='broadcast_notification'),
     path('api/notifications/create/', views.create_notification, name='create_notification'),
     path('api/notifications/test/', views.create_test_notification, name='create_test_notification'),
 ] 
\ No newline at end of file
@@ -7,9 +7,14 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
 from django.contrib.auth import get_user_model
 from .forms import UserRegistrationForm, UserUpdateForm
-from django.http import JsonResponse, HttpResponseRedirect
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from .models import Notification
+from .notifications import broadcast_notification, get_notification_page, get_unread_count, mark_notifications_read
+from .push import notification_event, notification_events
+from subscriptions.referral_stats import get_referrer_stats
 from django.views.decorators.csrf import csrf_protect
 from django.urls import reverse
 
@@ -61,7 +66,7 @@ def referrals(request):
     referrals = User.objects.filter(referred_by=request.user)
     context = {
         'referrals': referrals,
-        'referral_count': referrals.count()
+        'referral_count': get_referrer_stats(request.user).total_referrals
     }
     return render(request, 'users/referrals.html', context)
 
@@ -93,9 +98,46 @@ def delete_notification(request, notification_id):
 @require_http_methods(["POST"])
 def mark_all_read(request):
     """Mark all notifications as read."""
-    request.user.notifications.filter(read=False).update(read=True)
+    mark_notifications_read(request.user.pk)
     return JsonResponse({'status': 'success'})
 
+@login_required
+@require_http_methods(["GET"])
+def notification_list(request):
+    """Return the next page of notifications for infinite scroll."""
+    try:
+        before = int(request.GET['before']) if request.GET.get('before') else None
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'before must be a notification ID.'}, status=400)
+
+    notifications, next_before = get_notification_page(request.user.pk, before=before)
+    return JsonResponse({
+        'status': 'success',
+        'notifications': [notification_event(notification) for notification in notifications],
+        'next_before': next_before,
+    })
+
+@login_required
+@require_http_methods(["GET"])
+def unread_notification_count(request):
+    """Return the unread notification count for the header badge."""
+    return JsonResponse({'status': 'success', 'unread_count': get_unread_count(request.user.pk)})
+
+@login_required
+@require_http_methods(["GET"])
+async def notification_stream(request):
+    """Server-Sent Events stream of the user's new notifications."""
+    if not settings.NOTIFICATION_PUSH_ENABLED or not isinstance(request, ASGIRequest):
+        # Under WSGI the stream would hold a worker for its whole duration;
+        # 204 tells EventSource not to reconnect, and the badge polls instead
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    response = StreamingHttpResponse(notification_events(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
 # Example of creating a notification
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
@@ -132,6 +174,34 @@ def create_notification(request):
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
+@require_POST
+@login_required
+def broadcast_notification_view(request):
+    """Send a notification to every active user (staff only)."""
+    if not request.user.is_staff:
+        return JsonResponse({'status': 'error', 'message': 'Staff access required.'}, status=403)
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON.'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'status': 'error', 'message': 'Request body must be a JSON object.'}, status=400)
+
+    message = data.get('message')
+    notification_type = data.get('type', 'info')
+    if not message:
+        return JsonResponse({'status': 'error', 'message': 'Message is required.'}, status=400)
+    if notification_type not in dict(Notification.NOTIFICATION_TYPES):
+        return JsonResponse({'status': 'error', 'message': 'Invalid notification type.'}, status=400)
+
+    sent = broadcast_notification(
+        message,
+        title=data.get('title') or '',
+        notification_type=notification_type,
+        link=data.get('link') or None,
+    )
+    return JsonResponse({'status': 'success', 'sent': sent})
+
 # (keep the test view as well)
 def create_test_notification(request):
     """Create a test notification (for development only)."""